@@ -2,5 +2,7 @@
 from .config import config
 from .database import db
 from . import urls
+from .http_client import http_client
+from .cache import response_cache
 
-__all__ = ['config', 'db', 'urls']
+__all__ = ['config', 'db', 'urls', 'http_client', 'response_cache']
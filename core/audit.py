@@ -0,0 +1,130 @@
+"""登录审计日志写入模块
+
+登录流程只把日志记录放入内存缓冲区，由后台任务按批（满 batch_size 条
+或每隔 flush_interval_ms 毫秒）在一个事务中写入数据库。
+缓冲区有上限，写满时按 drop_policy 丢弃最旧或最新的记录
+"""
+import asyncio
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional
+
+from core.config import config
+from core.database import db
+from utils import app_logger
+
+
+class AuditSink:
+    """写后批量落库的审计日志缓冲区"""
+
+    def __init__(self):
+        audit_config = config.get('audit', {})
+        self.batch_size = audit_config.get('batch_size', 50)
+        self.flush_interval = audit_config.get('flush_interval_ms', 500) / 1000
+        self.max_buffer = audit_config.get('max_buffer', 10000)
+        self.drop_policy = audit_config.get('drop_policy', 'drop_oldest')
+
+        self._buffer: Deque[Dict[str, Any]] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def log_wechat_login(self, qr_code_key: str, validation_code: str = None,
+                         state: str = None, response_data: Dict = None,
+                         status: str = 'pending') -> None:
+        """记录一条微信登录日志（不等待写入）"""
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                app_logger.warning(f"审计日志缓冲区已满，已丢弃 {self.dropped} 条记录")
+            if self.drop_policy == 'drop_newest':
+                return
+            self._buffer.popleft()
+
+        self._buffer.append({
+            "qr_code_key": qr_code_key,
+            "validation_code": validation_code,
+            "state": state,
+            "response_data": response_data,
+            "status": status,
+            "created_at": datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        })
+
+        if len(self._buffer) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        """把缓冲区中的记录按批写入数据库，返回写入条数"""
+        flushed = 0
+        while self._buffer:
+            batch: List[Dict[str, Any]] = [
+                self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))
+            ]
+            write = asyncio.ensure_future(db.run(db.log_wechat_login_batch, batch))
+            try:
+                ok = await asyncio.shield(write)
+            except asyncio.CancelledError:
+                # 已从缓冲区取出的一批不能丢：等这一批写完再传递取消
+                ok = await write
+                self._count(ok, len(batch))
+                raise
+            flushed += self._count(ok, len(batch))
+        return flushed
+
+    def _count(self, ok: bool, size: int) -> int:
+        if ok:
+            self.written += size
+            return size
+        self.failed += size
+        return 0
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                app_logger.error(f"写入审计日志失败: {e}")
+
+    def start(self) -> None:
+        """启动后台写入任务（需在事件循环中调用）"""
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止后台写入任务，并写入剩余记录"""
+        if self._task is not None:
+            # 不取消后台任务：唤醒后让它完成当前这一轮写入再退出
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        flushed = await self.flush()
+        if flushed:
+            app_logger.info(f"关闭前写入剩余审计日志 {flushed} 条")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取写入统计"""
+        return {
+            "buffered": len(self._buffer),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batch_size": self.batch_size,
+            "flush_interval_ms": self.flush_interval * 1000,
+            "max_buffer": self.max_buffer,
+            "drop_policy": self.drop_policy
+        }
+
+
+# 全局审计日志实例
+audit_sink = AuditSink()
@@ -0,0 +1,342 @@
+"""上游响应缓存模块
+
+为变化不频繁的只读接口提供按会话、按端点隔离的进程内缓存：
+- 每个端点独立的TTL（config.toml [cache.ttl]）
+- 按条目数量限制的LRU淘汰
+- 过期后的 stale-while-revalidate 后台刷新
+- 请求头 Cache-Control: no-cache 时绕过缓存
+- 配置 [shared_state] 跨进程后端时，条目保存在共享存储中，多个worker共享缓存并合并未命中的上游请求
+
+以及按天缓存的统计数据（DayCache），日期范围请求只需向上游获取缺失的天
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from core.config import config
+from core.shared_state import shared_state
+from utils import app_logger
+
+
+def make_session_key(auth_token: str) -> str:
+    """根据认证令牌生成会话键，避免在内存和日志中保存原始令牌"""
+    return hashlib.sha256((auth_token or '').encode('utf-8')).hexdigest()[:16]
+
+
+def is_no_cache(cache_control: Optional[str]) -> bool:
+    """判断请求头 Cache-Control 是否要求绕过缓存"""
+    if not cache_control:
+        return False
+    directives = [d.strip().lower() for d in cache_control.split(',')]
+    return 'no-cache' in directives or 'no-store' in directives
+
+
+class CacheBackend:
+    """缓存存储后端接口（异步，共享存储后端的读写不阻塞事件循环）"""
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def set(self, key: str, entry: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        """写入条目；ttl为条目在后端中的最长保留时间，进程内LRU按数量淘汰，忽略该参数"""
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def clear(self) -> None:
+        raise NotImplementedError
+
+    async def size(self) -> int:
+        raise NotImplementedError
+
+
+class MemoryLRUBackend(CacheBackend):
+    """
+    进程内LRU存储后端
+
+    条目以JSON文本保存，每次读取得到独立的对象，调用方修改返回值不会影响缓存；
+    与共享存储后端的序列化行为一致
+    """
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self.evictions = 0
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return json.loads(entry)
+
+    async def set(self, key: str, entry: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        self._entries[key] = json.dumps(entry, ensure_ascii=False)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    async def clear(self) -> None:
+        self._entries.clear()
+
+    async def size(self) -> int:
+        return len(self._entries)
+
+
+class SharedStateBackend(CacheBackend):
+    """
+    共享状态存储后端
+
+    条目保存在 core.shared_state 中，uvicorn 的多个worker共享同一份缓存；
+    条目按TTL过期，不按数量淘汰。
+
+    键中带有命名空间的代数：clear() 把代数加一，旧代数的条目不再被读取并按TTL自然过期。
+    各worker最多每隔 generation_refresh_interval 秒重新读取一次代数，不为每次读写增加一次往返
+    """
+
+    def __init__(self, namespace: str, refresh_interval: float = 1.0):
+        self.namespace = shared_state.key('cache', namespace)
+        self.generation_key = shared_state.key('cache_generation', namespace)
+        self.refresh_interval = refresh_interval
+        self._generation: Optional[int] = None
+        self._generation_checked = 0.0
+
+    async def _prefix(self) -> str:
+        """当前代数的键前缀"""
+        now = time.monotonic()
+        if self._generation is None or now - self._generation_checked >= self.refresh_interval:
+            self._generation = await shared_state.get(self.generation_key) or 0
+            self._generation_checked = now
+        return f"{self.namespace}:{self._generation}:"
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return await shared_state.get(await self._prefix() + key)
+
+    async def set(self, key: str, entry: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        await shared_state.set(await self._prefix() + key, entry, ttl)
+
+    async def delete(self, key: str) -> None:
+        await shared_state.delete(await self._prefix() + key)
+
+    async def clear(self) -> None:
+        generation = await shared_state.incr(self.generation_key)
+        if generation is not None:
+            self._generation = generation
+            self._generation_checked = time.monotonic()
+
+    async def size(self) -> int:
+        return await shared_state.count(await self._prefix()) or 0
+
+
+def _default_backend(namespace: str, max_entries: int) -> CacheBackend:
+    """配置了跨进程共享状态后端时使用共享存储，否则使用进程内LRU"""
+    if shared_state.is_shared:
+        return SharedStateBackend(namespace,
+                                  config.get('cache', {}).get('generation_refresh_interval', 1.0))
+    return MemoryLRUBackend(max_entries)
+
+
+class ResponseCache:
+    """带TTL、LRU和后台刷新的响应缓存"""
+
+    def __init__(self, backend: Optional[CacheBackend] = None):
+        self.cache_config = config.get('cache', {})
+        self.enabled = self.cache_config.get('enabled', True)
+        self.default_ttl = self.cache_config.get('default_ttl', 60)
+        self.stale_while_revalidate = self.cache_config.get('stale_while_revalidate', 60)
+        self.ttls: Dict[str, float] = self.cache_config.get('ttl', {})
+        self.backend = backend or _default_backend('response', self.cache_config.get('max_entries', 1000))
+
+        self._refreshing: Set[str] = set()
+        # 后台刷新任务；事件循环只保留任务的弱引用，这里持有引用直到任务结束
+        self._background: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.bypasses = 0
+
+    def ttl_for(self, endpoint: str) -> float:
+        """获取端点的TTL（秒）"""
+        return self.ttls.get(endpoint, self.default_ttl)
+
+    @staticmethod
+    def _is_cacheable(value: Any) -> bool:
+        """错误响应不写入缓存"""
+        if value is None:
+            return False
+        return not (isinstance(value, dict) and 'error' in value)
+
+    async def _store(self, key: str, endpoint: str, value: Any) -> None:
+        if self._is_cacheable(value):
+            # 使用墙上时间，共享存储中的条目在各个worker之间都能正确计算年龄
+            await self.backend.set(key, {"value": value, "stored_at": time.time()},
+                             ttl=self.ttl_for(endpoint) + self.stale_while_revalidate)
+
+    async def _fresh(self, key: str, endpoint: str) -> Any:
+        """读取未过期的条目值，不存在或已过期时返回None"""
+        entry = await self.backend.get(key)
+        if entry is not None and time.time() - entry['stored_at'] < self.ttl_for(endpoint):
+            return entry['value']
+        return None
+
+    async def _refresh(self, key: str, endpoint: str, fetch: Callable[[], Awaitable[Any]]) -> None:
+        """后台刷新过期条目"""
+        try:
+            await self._store(key, endpoint, await fetch())
+        except Exception as e:
+            app_logger.warning(f"后台刷新缓存失败 {key}: {e}")
+        finally:
+            self._refreshing.discard(key)
+
+    async def get_or_fetch(self, endpoint: str, auth_token: str,
+                           fetch: Callable[[], Awaitable[Any]],
+                           bypass: bool = False) -> Any:
+        """
+        读取缓存，未命中时调用上游
+
+        Args:
+            endpoint: 端点名称（与 core/urls.py 中的键一致），用于选择TTL
+            auth_token: 认证令牌，缓存按会话隔离
+            fetch: 调用上游的协程函数
+            bypass: 为True时跳过缓存读取（结果仍会写回缓存）
+
+        Returns:
+            Any: 缓存或上游返回的原始响应
+        """
+        if not self.enabled:
+            return await fetch()
+
+        key = f"{make_session_key(auth_token)}:{endpoint}"
+
+        if bypass:
+            self.bypasses += 1
+            value = await fetch()
+            await self._store(key, endpoint, value)
+            return value
+
+        entry = await self.backend.get(key)
+        if entry is not None:
+            age = time.time() - entry['stored_at']
+            ttl = self.ttl_for(endpoint)
+            if age < ttl:
+                self.hits += 1
+                return entry['value']
+            if age < ttl + self.stale_while_revalidate:
+                self.stale_hits += 1
+                if key not in self._refreshing:
+                    self._refreshing.add(key)
+                    task = asyncio.ensure_future(self._refresh(key, endpoint, fetch))
+                    self._background.add(task)
+                    task.add_done_callback(self._background.discard)
+                return entry['value']
+
+        self.misses += 1
+
+        async def fetch_and_store() -> Any:
+            value = await fetch()
+            await self._store(key, endpoint, value)
+            return value
+
+        # 共享存储时，多个worker同时未命中只有一个向上游请求，其余等待它写入的结果
+        return await shared_state.coalesce(key, fetch_and_store, partial(self._fresh, key, endpoint))
+
+    async def shutdown(self) -> None:
+        """取消仍在执行的后台刷新"""
+        tasks = list(self._background)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        # 尚未开始执行就被取消的任务不会进入 _refresh 的 finally
+        self._refreshing.clear()
+
+    async def invalidate(self, auth_token: str, endpoint: Optional[str] = None) -> None:
+        """使某个会话的缓存失效"""
+        session_key = make_session_key(auth_token)
+        endpoints = [endpoint] if endpoint else list(self.ttls.keys())
+        for name in endpoints:
+            await self.backend.delete(f"{session_key}:{name}")
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        return {
+            "enabled": self.enabled,
+            "entries": await self.backend.size(),
+            "max_entries": getattr(self.backend, 'max_entries', None),
+            "evictions": getattr(self.backend, 'evictions', 0),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "bypasses": self.bypasses,
+            "ttl": {"default": self.default_ttl, **self.ttls},
+            "stale_while_revalidate": self.stale_while_revalidate
+        }
+
+
+class DayCache:
+    """按天缓存的统计数据
+
+    过去的日期数据不再变化，按 会话:端点:日期 分别缓存；
+    今天及以后的日期不写入缓存，每次都向上游获取
+    """
+
+    def __init__(self, backend: Optional[CacheBackend] = None):
+        self.day_config = config.get('cache', {}).get('days', {})
+        self.enabled = self.day_config.get('enabled', True)
+        self.ttl = self.day_config.get('ttl', 86400)
+        self.backend = backend or _default_backend('days', self.day_config.get('max_entries', 20000))
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(auth_token: str, endpoint: str, day: str) -> str:
+        return f"{make_session_key(auth_token)}:{endpoint}:{day}"
+
+    async def get_many(self, auth_token: str, endpoint: str, days: List[str]) -> Dict[str, Any]:
+        """读取多天的缓存，返回 {日期: 数据}，未命中的日期不在结果中"""
+        found: Dict[str, Any] = {}
+        if not self.enabled:
+            return found
+        now = time.time()
+        for day in days:
+            entry = await self.backend.get(self._key(auth_token, endpoint, day))
+            if entry is not None and now - entry['stored_at'] < self.ttl:
+                found[day] = entry['value']
+        self.hits += len(found)
+        self.misses += len(days) - len(found)
+        return found
+
+    async def set(self, auth_token: str, endpoint: str, day: str, value: Any) -> None:
+        """写入一天的数据"""
+        if self.enabled:
+            await self.backend.set(self._key(auth_token, endpoint, day),
+                             {"value": value, "stored_at": time.time()}, ttl=self.ttl)
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """获取按天缓存统计"""
+        return {
+            "enabled": self.enabled,
+            "entries": await self.backend.size(),
+            "max_entries": getattr(self.backend, 'max_entries', None),
+            "evictions": getattr(self.backend, 'evictions', 0),
+            "hits": self.hits,
+            "misses": self.misses,
+            "ttl": self.ttl
+        }
+
+
+# 全局响应缓存实例
+response_cache = ResponseCache()
+
+# 全局按天统计缓存实例
+day_cache = DayCache()
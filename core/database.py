@@ -1,9 +1,19 @@
-"""数据库管理模块"""
+"""数据库管理模块
+
+整个进程复用一个SQLite连接（WAL模式），所有访问由锁串行化；
+异步代码通过 db.run() 把数据库操作放到专用的单线程执行器中，
+避免磁盘同步阻塞事件循环
+"""
+import asyncio
 import sqlite3
 import json
-from datetime import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import partial
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Callable, Iterator, Tuple
 from utils import app_logger
 from core.config import config
 
@@ -15,17 +25,106 @@ class Database:
         self.db_path = Path(db_path)
         # 确保数据库目录存在
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
-        self.init_database()
-    
-    def get_connection(self) -> sqlite3.Connection:
-        """获取数据库连接"""
-        conn = sqlite3.connect(self.db_path)
+        self.db_config = config.get('database', {})
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # 建表在首次获取连接时执行（或由应用启动时显式执行），导入模块时不访问磁盘
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        """创建连接并应用 [database] 中的PRAGMA配置"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
         conn.row_factory = sqlite3.Row  # 使结果可以通过列名访问
+
+        journal_mode = conn.execute(
+            f"PRAGMA journal_mode = {self.db_config.get('journal_mode', 'WAL')}"
+        ).fetchone()[0]
+        conn.execute(f"PRAGMA synchronous = {self.db_config.get('synchronous', 'NORMAL')}")
+        conn.execute(f"PRAGMA cache_size = {int(self.db_config.get('cache_size', -8000))}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.db_config.get('mmap_size', 67108864))}")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.db_config.get('busy_timeout', 5000))}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+
+        app_logger.info(f"数据库连接已建立: {self.db_path}, journal_mode={journal_mode}")
         return conn
+
+    @contextmanager
+    def get_connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        获取共享的数据库连接
+
+        连接在首次使用时创建并一直复用；持有期间其他线程等待，
+        发生异常时回滚未提交的修改
+        """
+        with self._lock:
+            if self._conn is None:
+                self._conn = self._connect()
+            if not self._initialized:
+                self.init_database()
+            try:
+                yield self._conn
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        在数据库专用线程中执行同步的数据库方法
+
+        Example:
+            session = await db.run(db.get_latest_active_session)
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(fn, *args, **kwargs))
+
+    def close(self) -> None:
+        """关闭执行器和数据库连接"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                app_logger.info("数据库连接已关闭")
     
+    def _enable_incremental_vacuum(self, conn: sqlite3.Connection) -> None:
+        """
+        把已有数据库切换为增量VACUUM模式
+
+        auto_vacuum只能在建表前设置，已有数据库需要执行一次完整VACUUM才能生效，
+        之后由定期维护执行 PRAGMA incremental_vacuum 回收空闲页
+        """
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        has_tables = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0]
+        if has_tables:
+            app_logger.info("数据库切换为增量VACUUM模式，正在执行一次完整VACUUM")
+            conn.execute("VACUUM")
+
     def init_database(self) -> None:
-        """初始化数据库表"""
+        """初始化数据库表，进程内只执行一次"""
+        with self._lock:
+            if self._initialized:
+                return
+            # 先置位，建表过程中获取连接时不会重复进入
+            self._initialized = True
+            try:
+                self._create_tables()
+            except Exception:
+                self._initialized = False
+                raise
+
+    def _create_tables(self) -> None:
+        """创建数据库表和索引"""
         with self.get_connection() as conn:
+            self._enable_incremental_vacuum(conn)
+
             # 用户会话表
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS user_sessions (
@@ -53,6 +152,101 @@ class Database:
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             """)
+
+            # 任务镜像表（按账号保存 batch/check 同步下来的任务）
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS task_mirror (
+                    account_key TEXT NOT NULL,
+                    task_id TEXT NOT NULL,
+                    project_id TEXT,
+                    data TEXT,  -- JSON格式存储任务原始数据
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (account_key, task_id)
+                )
+            """)
+
+            # 任务镜像同步状态表（checkpoint和非任务部分的快照）
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS task_mirror_state (
+                    account_key TEXT PRIMARY KEY,
+                    checkpoint INTEGER DEFAULT 0,
+                    snapshot TEXT,  -- JSON格式存储projectProfiles等非任务数据
+                    last_full_sync_at TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # 专注记录归档表（按账号保存 /pomodoros/timeline 获取到的记录，用于本地统计）
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS focus_records (
+                    account_key TEXT NOT NULL,
+                    record_id TEXT NOT NULL,
+                    start_ms INTEGER NOT NULL,
+                    end_ms INTEGER NOT NULL,
+                    pause_ms INTEGER DEFAULT 0,
+                    data TEXT,  -- JSON格式存储专注记录原始数据
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (account_key, record_id)
+                )
+            """)
+
+            # 专注记录归档同步状态（高水位和历史回填进度）
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS focus_archive_state (
+                    account_key TEXT PRIMARY KEY,
+                    newest_start_ms INTEGER,  -- 已归档的最新记录开始时间（高水位）
+                    backfill_cursor INTEGER,  -- 历史回填下一页的 to 参数
+                    backfill_done INTEGER DEFAULT 0,
+                    last_sync_at TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # 已完成/已放弃任务归档表（按账号和状态保存 /project/all/closed 获取到的任务）
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS closed_tasks (
+                    account_key TEXT NOT NULL,
+                    status TEXT NOT NULL,  -- Completed 或 Abandoned
+                    task_id TEXT NOT NULL,
+                    completed_time TEXT,  -- 原始completedTime（统一为+0000，可按字符串排序）
+                    data TEXT,  -- JSON格式存储任务原始数据
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (account_key, status, task_id)
+                )
+            """)
+
+            # 已完成/已放弃任务归档同步状态（completedTime高水位）
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS closed_task_state (
+                    account_key TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    newest_completed_time TEXT,
+                    last_full_sync_at TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (account_key, status)
+                )
+            """)
+
+            # 启动时恢复会话：WHERE is_active = 1 ORDER BY updated_at DESC LIMIT 1
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_user_sessions_active_updated
+                ON user_sessions (is_active, updated_at DESC)
+            """)
+            # 保留策略按时间批量删除
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_wechat_login_logs_created
+                ON wechat_login_logs (created_at)
+            """)
+            # 本地已完成任务列表按completedTime倒序分页
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_closed_tasks_completed
+                ON closed_tasks (account_key, status, completed_time DESC)
+            """)
+            # 本地专注统计按时间范围读取
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_focus_records_start
+                ON focus_records (account_key, start_ms)
+            """)
             
             conn.commit()
             app_logger.info("数据库初始化完成")
@@ -134,13 +328,31 @@ class Database:
             app_logger.error(f"获取最新活跃会话失败: {e}")
             return None
 
+    def touch_user_session(self, session_id: str) -> bool:
+        """刷新会话的 updated_at，仍在使用的会话不会被定期维护清理"""
+        try:
+            with self.get_connection() as conn:
+                conn.execute(
+                    "UPDATE user_sessions SET updated_at = ? WHERE session_id = ?",
+                    (datetime.now(), session_id)
+                )
+                conn.commit()
+                return True
+
+        except Exception as e:
+            app_logger.error(f"刷新用户会话时间失败: {e}")
+            return False
+
     def log_wechat_login(self, qr_code_key: str, validation_code: str = None,
                         state: str = None, response_data: Dict = None,
                         status: str = 'pending') -> bool:
         """记录微信登录日志"""
         try:
             with self.get_connection() as conn:
-                response_json = json.dumps(response_data) if response_data else None
+                response_json = (
+                    json.dumps(response_data, ensure_ascii=False, separators=(',', ':'))
+                    if response_data else None
+                )
 
                 conn.execute("""
                     INSERT INTO wechat_login_logs
@@ -156,6 +368,403 @@ class Database:
             app_logger.error(f"记录微信登录日志失败: {e}")
             return False
 
+    def log_wechat_login_batch(self, records: List[Dict[str, Any]]) -> bool:
+        """
+        在一个事务中批量写入微信登录日志
+
+        Args:
+            records: 日志记录列表，字段与 log_wechat_login 的参数一致，
+                     另含 created_at（UTC，格式 YYYY-MM-DD HH:MM:SS）
+        """
+        try:
+            with self.get_connection() as conn:
+                conn.executemany("""
+                    INSERT INTO wechat_login_logs
+                    (qr_code_key, validation_code, state, response_data, status, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, [
+                    (
+                        record.get('qr_code_key'),
+                        record.get('validation_code'),
+                        record.get('state'),
+                        json.dumps(record['response_data'], ensure_ascii=False, separators=(',', ':'))
+                        if record.get('response_data') else None,
+                        record.get('status', 'pending'),
+                        record['created_at']
+                    )
+                    for record in records
+                ])
+                conn.commit()
+                return True
+
+        except Exception as e:
+            app_logger.error(f"批量记录微信登录日志失败: {e}")
+            return False
+
+    def prune_login_logs(self, retention_days: int, batch_size: int = 500) -> int:
+        """
+        分批删除超过保留期的微信登录日志
+
+        每批单独提交，批与批之间释放连接，避免长时间占用数据库
+
+        Returns:
+            int: 删除的行数
+        """
+        cutoff = f"-{int(retention_days)} days"
+        return self._execute_in_batches("""
+            DELETE FROM wechat_login_logs WHERE id IN (
+                SELECT id FROM wechat_login_logs
+                WHERE created_at < datetime('now', ?)
+                LIMIT ?
+            )
+        """, (cutoff,), batch_size)
+
+    def prune_user_sessions(self, retention_days: int, batch_size: int = 500) -> int:
+        """
+        分批删除超过保留期的用户会话（最新的活跃会话始终保留）
+
+        Returns:
+            int: 删除的行数
+        """
+        cutoff = datetime.now() - timedelta(days=retention_days)
+        return self._execute_in_batches("""
+            DELETE FROM user_sessions WHERE session_id IN (
+                SELECT session_id FROM user_sessions
+                WHERE updated_at < ?
+                  AND session_id NOT IN (
+                      SELECT session_id FROM user_sessions
+                      WHERE is_active = 1 ORDER BY updated_at DESC LIMIT 1
+                  )
+                LIMIT ?
+            )
+        """, (cutoff,), batch_size)
+
+    def compact_login_logs(self, batch_size: int = 500) -> int:
+        """
+        分批去掉旧版日志中保存的完整响应头和cookies
+
+        Returns:
+            int: 压缩的行数
+        """
+        return self._execute_in_batches("""
+            UPDATE wechat_login_logs
+            SET response_data = json_remove(response_data, '$.headers', '$.cookies', '$.json_data')
+            WHERE id IN (
+                SELECT id FROM wechat_login_logs
+                WHERE json_valid(response_data)
+                  AND (json_type(response_data, '$.headers') IS NOT NULL
+                       OR json_type(response_data, '$.cookies') = 'object'
+                       OR json_type(response_data, '$.json_data') IS NOT NULL)
+                LIMIT ?
+            )
+        """, (), batch_size)
+
+    def _execute_in_batches(self, sql: str, params: tuple, batch_size: int) -> int:
+        """重复执行带 LIMIT ? 的删除或更新语句，直到影响行数不足一批"""
+        total = 0
+        while True:
+            with self.get_connection() as conn:
+                affected = conn.execute(sql, (*params, batch_size)).rowcount
+                conn.commit()
+            total += affected
+            if affected < batch_size:
+                return total
+
+    def incremental_vacuum(self, pages: int = 1000) -> int:
+        """
+        回收空闲页
+
+        Returns:
+            int: 回收前的空闲页数量
+        """
+        with self.get_connection() as conn:
+            freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if freelist:
+                conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+                conn.commit()
+            return freelist
+
+    def get_task_mirror_state(self, account_key: str) -> Optional[Dict[str, Any]]:
+        """获取任务镜像同步状态"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute(
+                    "SELECT * FROM task_mirror_state WHERE account_key = ?",
+                    (account_key,)
+                )
+                row = cursor.fetchone()
+
+                if row:
+                    state = dict(row)
+                    state['snapshot'] = json.loads(state['snapshot']) if state['snapshot'] else {}
+                    return state
+
+                return None
+
+        except Exception as e:
+            app_logger.error(f"获取任务镜像同步状态失败: {e}")
+            return None
+
+    def apply_task_mirror_changes(self, account_key: str, checkpoint: int,
+                                  updates: List[Dict[str, Any]], deleted_ids: List[str],
+                                  snapshot: Dict[str, Any], full_sync: bool = False) -> bool:
+        """
+        在一个事务中应用任务镜像的增量变更
+
+        Args:
+            account_key: 账号键
+            checkpoint: 本次同步后的checkpoint
+            updates: 新增或修改的任务
+            deleted_ids: 被删除的任务ID
+            snapshot: 合并后的非任务数据快照
+            full_sync: 是否为全量同步（全量同步会先清空该账号的镜像）
+        """
+        try:
+            with self.get_connection() as conn:
+                now = datetime.now()
+
+                if full_sync:
+                    conn.execute("DELETE FROM task_mirror WHERE account_key = ?", (account_key,))
+
+                conn.executemany("""
+                    INSERT OR REPLACE INTO task_mirror (account_key, task_id, project_id, data, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                """, [
+                    (account_key, task['id'], task.get('projectId'), json.dumps(task, ensure_ascii=False), now)
+                    for task in updates if task.get('id')
+                ])
+
+                conn.executemany(
+                    "DELETE FROM task_mirror WHERE account_key = ? AND task_id = ?",
+                    [(account_key, task_id) for task_id in deleted_ids]
+                )
+
+                if full_sync:
+                    conn.execute("""
+                        INSERT OR REPLACE INTO task_mirror_state
+                        (account_key, checkpoint, snapshot, last_full_sync_at, updated_at)
+                        VALUES (?, ?, ?, ?, ?)
+                    """, (account_key, checkpoint, json.dumps(snapshot, ensure_ascii=False), now, now))
+                else:
+                    conn.execute("""
+                        UPDATE task_mirror_state SET checkpoint = ?, snapshot = ?, updated_at = ?
+                        WHERE account_key = ?
+                    """, (checkpoint, json.dumps(snapshot, ensure_ascii=False), now, account_key))
+
+                conn.commit()
+                app_logger.info(
+                    f"任务镜像已更新: {account_key}, checkpoint={checkpoint}, "
+                    f"更新 {len(updates)} 条, 删除 {len(deleted_ids)} 条, 全量={full_sync}"
+                )
+                return True
+
+        except Exception as e:
+            app_logger.error(f"更新任务镜像失败: {e}")
+            return False
+
+    def get_mirrored_tasks(self, account_key: str) -> List[Dict[str, Any]]:
+        """获取任务镜像中的所有任务"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute(
+                    "SELECT data FROM task_mirror WHERE account_key = ?",
+                    (account_key,)
+                )
+                return [json.loads(row['data']) for row in cursor.fetchall()]
+
+        except Exception as e:
+            app_logger.error(f"获取任务镜像失败: {e}")
+            return []
+
+
+    def save_focus_records(self, account_key: str, records: List[Dict[str, Any]],
+                           state: Optional[Dict[str, Any]] = None) -> int:
+        """
+        写入或更新专注记录归档，并在同一事务中更新同步状态
+
+        Args:
+            account_key: 账号键
+            records: 已解析的记录，每条包含 id、start_ms、end_ms、pause_ms、data
+            state: 需要更新的同步状态字段（newest_start_ms、backfill_cursor、backfill_done、last_sync_at）
+
+        Returns:
+            int: 写入的记录数
+        """
+        try:
+            with self.get_connection() as conn:
+                now = datetime.now()
+                conn.executemany("""
+                    INSERT OR REPLACE INTO focus_records
+                    (account_key, record_id, start_ms, end_ms, pause_ms, data, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, [
+                    (account_key, record['id'], record['start_ms'], record['end_ms'],
+                     record['pause_ms'], json.dumps(record['data'], ensure_ascii=False), now)
+                    for record in records
+                ])
+
+                if state:
+                    columns = [c for c in ('newest_start_ms', 'backfill_cursor', 'backfill_done', 'last_sync_at')
+                               if c in state]
+                    conn.execute(
+                        "INSERT OR IGNORE INTO focus_archive_state (account_key) VALUES (?)",
+                        (account_key,)
+                    )
+                    conn.execute(
+                        f"UPDATE focus_archive_state SET {', '.join(f'{c} = ?' for c in columns)}, updated_at = ? "
+                        f"WHERE account_key = ?",
+                        (*[state[c] for c in columns], now, account_key)
+                    )
+
+                conn.commit()
+                return len(records)
+
+        except Exception as e:
+            app_logger.error(f"写入专注记录归档失败: {e}")
+            return 0
+
+    def get_focus_archive_state(self, account_key: str) -> Dict[str, Any]:
+        """获取专注记录归档同步状态（含已归档记录数）"""
+        try:
+            with self.get_connection() as conn:
+                row = conn.execute(
+                    "SELECT * FROM focus_archive_state WHERE account_key = ?",
+                    (account_key,)
+                ).fetchone()
+                state = dict(row) if row else {
+                    "account_key": account_key, "newest_start_ms": None,
+                    "backfill_cursor": None, "backfill_done": 0, "last_sync_at": None
+                }
+                state['records'] = conn.execute(
+                    "SELECT COUNT(*) FROM focus_records WHERE account_key = ?",
+                    (account_key,)
+                ).fetchone()[0]
+                return state
+
+        except Exception as e:
+            app_logger.error(f"获取专注记录归档状态失败: {e}")
+            return {"account_key": account_key, "newest_start_ms": None,
+                    "backfill_cursor": None, "backfill_done": 0, "records": 0}
+
+    def get_focus_records(self, account_key: str) -> List[Dict[str, Any]]:
+        """获取归档中的全部专注记录原始数据，按开始时间从新到旧"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.execute(
+                    "SELECT data FROM focus_records WHERE account_key = ? ORDER BY start_ms DESC",
+                    (account_key,)
+                )
+                return [json.loads(row['data']) for row in cursor.fetchall()]
+
+        except Exception as e:
+            app_logger.error(f"读取专注记录归档失败: {e}")
+            return []
+
+    def get_focus_intervals(self, account_key: str, start_ms: int, end_ms: int) -> List[Tuple[int, int, int]]:
+        """获取与 [start_ms, end_ms) 有重叠的专注记录的 (开始, 结束, 暂停) 毫秒数"""
+        try:
+            with self.get_connection() as conn:
+                # 单条专注不超过一天，start_ms 下界放宽一天即可使用索引
+                cursor = conn.execute("""
+                    SELECT start_ms, end_ms, pause_ms FROM focus_records
+                    WHERE account_key = ? AND start_ms >= ? AND start_ms < ? AND end_ms > ?
+                """, (account_key, start_ms - 86400000, end_ms, start_ms))
+                return [tuple(row) for row in cursor.fetchall()]
+
+        except Exception as e:
+            app_logger.error(f"读取专注记录归档失败: {e}")
+            return []
+
+    def get_closed_task_state(self, account_key: str, status: str) -> Optional[Dict[str, Any]]:
+        """获取已完成/已放弃任务归档的同步状态"""
+        try:
+            with self.get_connection() as conn:
+                row = conn.execute(
+                    "SELECT * FROM closed_task_state WHERE account_key = ? AND status = ?",
+                    (account_key, status)
+                ).fetchone()
+                return dict(row) if row else None
+
+        except Exception as e:
+            app_logger.error(f"获取已完成任务归档状态失败: {e}")
+            return None
+
+    def save_closed_tasks(self, account_key: str, status: str, tasks: List[Dict[str, Any]],
+                          newest_completed_time: Optional[str], full_sync: bool = False) -> int:
+        """
+        在一个事务中写入已完成/已放弃任务并推进高水位
+
+        Args:
+            account_key: 账号键
+            status: Completed 或 Abandoned
+            tasks: 任务原始数据，按ID写入或更新
+            newest_completed_time: 同步后的completedTime高水位
+            full_sync: 是否为全量同步（全量同步会先清空该账号该状态的归档，去掉已被重新打开的任务）
+
+        Returns:
+            int: 写入的任务数，失败时为-1
+        """
+        try:
+            with self.get_connection() as conn:
+                now = datetime.now()
+
+                if full_sync:
+                    conn.execute(
+                        "DELETE FROM closed_tasks WHERE account_key = ? AND status = ?",
+                        (account_key, status)
+                    )
+
+                rows = [
+                    (account_key, status, task['id'], task.get('completedTime'),
+                     json.dumps(task, ensure_ascii=False), now)
+                    for task in tasks if task.get('id')
+                ]
+                conn.executemany("""
+                    INSERT OR REPLACE INTO closed_tasks
+                    (account_key, status, task_id, completed_time, data, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, rows)
+
+                conn.execute("""
+                    INSERT INTO closed_task_state (account_key, status, newest_completed_time, last_full_sync_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (account_key, status) DO UPDATE SET
+                        newest_completed_time = excluded.newest_completed_time,
+                        last_full_sync_at = COALESCE(excluded.last_full_sync_at, closed_task_state.last_full_sync_at),
+                        updated_at = excluded.updated_at
+                """, (account_key, status, newest_completed_time, now if full_sync else None, now))
+
+                conn.commit()
+                return len(rows)
+
+        except Exception as e:
+            app_logger.error(f"写入已完成任务归档失败: {e}")
+            return -1
+
+    def get_closed_tasks(self, account_key: str, status: str,
+                         limit: Optional[int] = None, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        按completedTime倒序读取已完成/已放弃任务归档
+
+        Returns:
+            tuple: (任务列表, 归档中该状态的任务总数)
+        """
+        try:
+            with self.get_connection() as conn:
+                total = conn.execute(
+                    "SELECT COUNT(*) FROM closed_tasks WHERE account_key = ? AND status = ?",
+                    (account_key, status)
+                ).fetchone()[0]
+                cursor = conn.execute("""
+                    SELECT data FROM closed_tasks WHERE account_key = ? AND status = ?
+                    ORDER BY completed_time DESC LIMIT ? OFFSET ?
+                """, (account_key, status, -1 if limit is None else limit, offset))
+                return [json.loads(row['data']) for row in cursor.fetchall()], total
+
+        except Exception as e:
+            app_logger.error(f"读取已完成任务归档失败: {e}")
+            return [], 0
+
 
 # 全局数据库实例
 db = Database()
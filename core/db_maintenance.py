@@ -0,0 +1,81 @@
+"""数据库定期维护模块
+
+按 [database.retention] 配置定期执行：
+- 分批删除过期的微信登录日志和用户会话
+- 压缩旧版日志行（去掉完整响应头和cookies）
+- 增量VACUUM回收空闲页
+
+多个worker共用同一个数据库文件，每个维护周期只由取得共享锁的一个worker执行
+"""
+import asyncio
+import uuid
+from typing import Any, Dict, Optional
+
+from core.config import config
+from core.database import db
+from core.shared_state import shared_state
+from utils import app_logger
+
+# 维护锁的键；锁在维护周期内不释放，到期前其他worker跳过本轮维护
+MAINTENANCE_LOCK_KEY = shared_state.key('lock', 'db_maintenance')
+
+
+class DatabaseMaintenance:
+    """数据库定期维护"""
+
+    def __init__(self):
+        self.retention_config = config.get('database', {}).get('retention', {})
+        self.enabled = self.retention_config.get('enabled', True)
+        self.interval = self.retention_config.get('interval_hours', 6) * 3600
+        self._task: Optional[asyncio.Task] = None
+        self._token = uuid.uuid4().hex
+        self.last_result: Dict[str, Any] = {}
+        self.skipped = 0
+
+    def run_once(self) -> Dict[str, Any]:
+        """执行一次维护（同步，在数据库线程中调用）"""
+        batch_size = self.retention_config.get('batch_size', 500)
+        result = {
+            "login_logs_deleted": db.prune_login_logs(
+                self.retention_config.get('login_log_days', 30), batch_size
+            ),
+            "sessions_deleted": db.prune_user_sessions(
+                self.retention_config.get('session_days', 30), batch_size
+            ),
+            "login_logs_compacted": db.compact_login_logs(batch_size),
+            "free_pages": db.incremental_vacuum(self.retention_config.get('vacuum_pages', 1000))
+        }
+        app_logger.info(f"数据库维护完成: {result}")
+        return result
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                # 锁的有效期略短于维护间隔，下一轮时已经过期
+                if await shared_state.acquire(MAINTENANCE_LOCK_KEY, self._token, self.interval * 0.9):
+                    self.last_result = await db.run(self.run_once)
+                else:
+                    self.skipped += 1
+                    app_logger.debug("其他worker已执行本轮数据库维护，跳过")
+            except Exception as e:
+                app_logger.error(f"数据库维护失败: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """启动定期维护（需在事件循环中调用）"""
+        if self.enabled and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止定期维护"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# 全局数据库维护实例
+db_maintenance = DatabaseMaintenance()
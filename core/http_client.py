@@ -0,0 +1,175 @@
+"""上游HTTP客户端模块
+
+所有服务共享同一个连接池化的 httpx.AsyncClient，
+由 main.py 的 lifespan 统一关闭，避免每个服务各自建立连接和TLS握手。
+相同会话、URL和参数的并发GET请求会合并为一次上游调用，响应体也只解析一次；
+每次实际的上游调用按端点记录延迟和状态码（见 core.metrics）
+"""
+import time
+from http.cookiejar import DefaultCookiePolicy
+from typing import Any, Dict, Hashable, Optional, Union
+
+import httpx
+
+from core import urls
+from core.config import config
+from core.metrics import metrics
+from core.singleflight import SingleFlight
+from utils import app_logger
+
+
+_UNPARSED = object()
+
+
+class SharedResponse:
+    """
+    合并请求共享的响应
+
+    代理 httpx.Response 的属性，json() 的解析结果在所有等待者之间共享，
+    大响应（如 /batch/check）只解析一次；解析结果应视为只读
+    """
+
+    def __init__(self, response: httpx.Response):
+        self.response = response
+        self._parsed: Any = _UNPARSED
+
+    def json(self, **kwargs: Any) -> Any:
+        if self._parsed is _UNPARSED:
+            self._parsed = self.response.json(**kwargs)
+        return self._parsed
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.response, name)
+
+
+class UpstreamClient:
+    """共享的上游HTTP客户端"""
+
+    def __init__(self):
+        self.request_config = config.get('request_config', {})
+        self._client: Optional[httpx.AsyncClient] = None
+        self.singleflight = SingleFlight()
+
+    def _http2_enabled(self) -> bool:
+        """检查是否可以启用HTTP/2（需要安装h2依赖）"""
+        if not self.request_config.get('http2', True):
+            return False
+        try:
+            import h2  # noqa: F401
+            return True
+        except ImportError:
+            app_logger.warning("未安装h2依赖，上游连接回退为HTTP/1.1")
+            return False
+
+    def _build_client(self) -> httpx.AsyncClient:
+        """根据 [request_config] 构建连接池化的客户端"""
+        limits = httpx.Limits(
+            max_connections=self.request_config.get('max_connections', 100),
+            max_keepalive_connections=self.request_config.get('max_keepalive_connections', 20),
+            keepalive_expiry=self.request_config.get('keepalive_expiry', 30.0)
+        )
+        http2 = self._http2_enabled()
+
+        app_logger.info(
+            f"创建上游HTTP客户端: max_connections={limits.max_connections}, "
+            f"max_keepalive={limits.max_keepalive_connections}, "
+            f"keepalive_expiry={limits.keepalive_expiry}s, http2={http2}"
+        )
+
+        client = httpx.AsyncClient(
+            timeout=self.request_config.get('timeout', 30.0),
+            limits=limits,
+            http2=http2
+        )
+        # 多个账号共用同一客户端，禁止把上游响应的cookie写入共享cookie罐
+        client.cookies.jar.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        return client
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """获取底层客户端，首次使用时创建"""
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+
+    def _flight_key(self, url: str, kwargs: Dict[str, Any]) -> Hashable:
+        """根据会话令牌、URL和查询参数构建合并键"""
+        cookies = kwargs.get('cookies') or {}
+        token = cookies.get('t', '') if isinstance(cookies, dict) else ''
+        params = kwargs.get('params') or {}
+        params_key = tuple(sorted((str(k), str(v)) for k, v in dict(params).items()))
+        return token, str(url), params_key
+
+    async def get(self, url: str, coalesce: bool = True, **kwargs: Any) -> Union[httpx.Response, SharedResponse]:
+        """
+        发送GET请求
+
+        Args:
+            url: 请求URL
+            coalesce: 是否与相同的在途请求合并，默认合并；
+                      每次调用都必须得到独立结果的请求（如生成二维码）应传False
+            **kwargs: 透传给 httpx 的参数
+
+        Returns:
+            响应对象；合并时多个调用者共享同一个 SharedResponse 及其解析结果
+        """
+        if not coalesce:
+            return await self._timed('GET', url, **kwargs)
+
+        key = self._flight_key(url, kwargs)
+        return await self.singleflight.do(key, lambda: self._get_shared(url, **kwargs))
+
+    async def _get_shared(self, url: str, **kwargs: Any) -> SharedResponse:
+        """在合并的调用内发送请求，成功的响应在这里解析一次"""
+        shared = SharedResponse(await self._timed('GET', url, **kwargs))
+        if shared.status_code == 200 and shared.content:
+            try:
+                shared.json()
+            except ValueError:
+                # 非JSON响应，调用者自行处理 json() 抛出的异常
+                pass
+        return shared
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        """发送POST请求"""
+        return await self._timed('POST', url, **kwargs)
+
+    async def _timed(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """发送请求并按端点记录延迟和状态码（合并的请求只记录一次实际的上游调用）"""
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            status = str(response.status_code)
+            return response
+        finally:
+            metrics.observe_upstream(urls.resolve_endpoint_name(url), method, status,
+                                     time.perf_counter() - started)
+
+    def get_pool_status(self) -> Dict[str, Any]:
+        """获取连接池配置概览"""
+        return {
+            "initialized": self._client is not None and not self._client.is_closed,
+            "max_connections": self.request_config.get('max_connections', 100),
+            "max_keepalive_connections": self.request_config.get('max_keepalive_connections', 20),
+            "keepalive_expiry": self.request_config.get('keepalive_expiry', 30.0),
+            "http2": self.request_config.get('http2', True)
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取连接池和请求合并统计"""
+        return {
+            "pool": self.get_pool_status(),
+            "singleflight": self.singleflight.get_stats()
+        }
+
+    async def close(self):
+        """关闭HTTP客户端"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            app_logger.info("上游HTTP客户端已关闭")
+        self._client = None
+
+
+# 全局上游HTTP客户端实例
+http_client = UpstreamClient()
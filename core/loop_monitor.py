@@ -0,0 +1,72 @@
+"""事件循环延迟监控模块
+
+定期安排一次短暂睡眠，实际唤醒时间与预期时间之差即为事件循环延迟，
+用于观察同步计算（如Excel渲染）是否阻塞了其他请求
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from core.config import config
+from utils import app_logger
+
+
+class LoopLagMonitor:
+    """事件循环延迟监控"""
+
+    def __init__(self):
+        monitor_config = config.get('loop_monitor', {})
+        self.interval = monitor_config.get('interval', 0.5)
+        self.warn_threshold = monitor_config.get('warn_threshold', 0.2)
+        self._samples: Deque[float] = deque(maxlen=monitor_config.get('window', 120))
+        self._task: Optional[asyncio.Task] = None
+        self.max_lag = 0.0
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            self._samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.warn_threshold:
+                app_logger.warning(f"事件循环延迟过高: {lag * 1000:.0f}ms")
+
+    def start(self) -> None:
+        """启动监控（需在事件循环中调用）"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止监控"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取最近窗口内的延迟统计（毫秒）"""
+        samples = sorted(self._samples)
+        if not samples:
+            return {"samples": 0, "interval_ms": self.interval * 1000}
+
+        def percentile(p: float) -> float:
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000, 2)
+
+        return {
+            "samples": len(samples),
+            "interval_ms": self.interval * 1000,
+            "last_ms": round(self._samples[-1] * 1000, 2),
+            "avg_ms": round(sum(samples) / len(samples) * 1000, 2),
+            "p50_ms": percentile(0.5),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(self.max_lag * 1000, 2)
+        }
+
+
+# 全局事件循环延迟监控实例
+loop_monitor = LoopLagMonitor()
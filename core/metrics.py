@@ -0,0 +1,238 @@
+"""监控指标模块
+
+以 Prometheus 文本格式（/system/metrics）输出：
+- 每个FastAPI路由的请求数、状态码和延迟直方图（MetricsMiddleware）
+- 每个上游端点的请求数、状态码和延迟直方图（core.http_client 记录，
+  端点名称为 core/urls.py 中 DIDA_*_APIS 的键）
+
+对比两组直方图即可区分慢在本服务还是慢在上游。
+指标保存在进程内，多worker部署时每个worker分别输出自己的指标
+"""
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from core.config import config
+
+# 默认直方图分桶（秒），覆盖从缓存命中到微信长轮询的范围
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """指标基类"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self._samples()
+        ]
+
+
+class Counter(Metric):
+    """只增不减的计数器"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(Metric):
+    """可增可减的瞬时值"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(self._values.items())
+        ]
+
+
+class Histogram(Metric):
+    """分桶直方图"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets)) + (float('inf'),)
+        # 每组标签：各分桶计数（非累计）、总和、总数
+        self._series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self.metrics_config = config.get('metrics', {})
+        self.enabled = self.metrics_config.get('enabled', True)
+        buckets = self.metrics_config.get('buckets', DEFAULT_BUCKETS)
+        self._metrics: List[Metric] = []
+
+        self.http_requests = self.register(Counter(
+            "dida_http_requests_total", "按路由和状态码统计的请求数", ("method", "route", "status")
+        ))
+        self.http_duration = self.register(Histogram(
+            "dida_http_request_duration_seconds", "按路由统计的请求延迟（到响应头发出为止）",
+            ("method", "route"), buckets
+        ))
+        self.http_in_progress = self.register(Gauge(
+            "dida_http_requests_in_progress", "正在处理的请求数"
+        ))
+        self.upstream_requests = self.register(Counter(
+            "dida_upstream_requests_total", "按上游端点和状态码统计的请求数", ("endpoint", "method", "status")
+        ))
+        self.upstream_duration = self.register(Histogram(
+            "dida_upstream_request_duration_seconds", "按上游端点统计的请求延迟",
+            ("endpoint", "method"), buckets
+        ))
+        self.startup_duration = self.register(Gauge(
+            "dida_startup_duration_seconds", "从导入应用到启动完成（可以接收请求）的耗时"
+        ))
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def observe_request(self, method: str, route: str, status: int, elapsed: float) -> None:
+        """记录一次路由请求"""
+        if not self.enabled:
+            return
+        self.http_requests.inc(method, route, str(status))
+        self.http_duration.observe(elapsed, method, route)
+
+    def observe_upstream(self, endpoint: str, method: str, status: str, elapsed: float) -> None:
+        """记录一次上游请求，status为HTTP状态码或 error（请求异常）"""
+        if not self.enabled:
+            return
+        self.upstream_requests.inc(endpoint, method, status)
+        self.upstream_duration.observe(elapsed, endpoint, method)
+
+    def render(self) -> str:
+        """输出 Prometheus 文本格式"""
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """
+    按路由记录请求数、状态码和延迟的ASGI中间件
+
+    路由标签使用路由模板（如 /tasks/completed），未匹配任何路由的请求记为 unmatched；
+    延迟记录到响应头发出为止，SSE等流式响应不会因为连接保持而拉高直方图
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not metrics.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status: Optional[int] = None
+
+        def record(code: int) -> None:
+            route = scope.get('route')
+            metrics.observe_request(scope['method'], getattr(route, 'path', None) or 'unmatched',
+                                    code, time.perf_counter() - started)
+
+        async def send_with_metrics(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                record(status)
+            await send(message)
+
+        metrics.http_in_progress.inc()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            metrics.http_in_progress.dec()
+            if status is None:
+                # 未发出响应头就抛出异常
+                record(500)
+
+
+# 全局指标注册表实例
+metrics = MetricsRegistry()
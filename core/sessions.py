@@ -0,0 +1,277 @@
+"""认证会话注册表模块
+
+按请求解析滴答清单认证会话，一个进程可以同时服务多个账号：
+- 请求头 X-Session-Id 或 cookie dida_session 指定会话ID
+- 热点会话保存在按数量限制的LRU中，未命中时从 user_sessions 表加载；
+  不存在的会话ID在 not_found_ttl 秒内直接按不存在处理，不重复查询数据库
+- 未指定会话ID时不使用任何会话；单账号部署可开启 fallback_to_latest 回退到最近登录的会话，
+  最近登录的会话ID保存在共享状态中，多个worker看到的是同一个会话，
+  每个worker最多每 default_refresh_interval 秒读取一次
+- 静态文件、接口文档等不需要会话的路径（skip_paths）不解析会话
+- 请求内登录产生的新会话通过 Set-Cookie 返回给客户端
+
+当前请求的会话保存在 contextvar 中，请求内创建的后台任务会继承该会话
+"""
+import contextvars
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from starlette.requests import HTTPConnection
+
+from core.config import config
+from core.database import db
+from core.shared_state import shared_state
+from core.singleflight import SingleFlight
+from utils import app_logger
+
+
+class _RequestContext:
+    """单个请求的会话状态"""
+    __slots__ = ('session', 'issued')
+
+    def __init__(self, session: Optional[Dict[str, Any]]):
+        self.session = session
+        # 请求内新登录的会话ID，响应时写入cookie
+        self.issued: Optional[str] = None
+
+
+# 共享状态中保存最近登录会话ID的键
+DEFAULT_SESSION_KEY = shared_state.key('sessions', 'default')
+
+_current: contextvars.ContextVar[Optional[_RequestContext]] = contextvars.ContextVar(
+    'dida_session', default=None
+)
+
+
+# 登录时按正则解析Set-Cookie头会把属性也当作cookie保存，请求上游时需要去掉
+_COOKIE_ATTRIBUTES = {'path', 'domain', 'expires', 'max-age', 'samesite', 'secure', 'httponly'}
+
+
+def session_cookies(cookies: Optional[Dict[str, str]]) -> Dict[str, str]:
+    """过滤登录响应中的cookie，只保留请求上游时需要携带的部分"""
+    return {
+        name: value for name, value in (cookies or {}).items()
+        if name and name.lower() not in _COOKIE_ATTRIBUTES
+    }
+
+
+def _build_session(row: Dict[str, Any]) -> Dict[str, Any]:
+    """把 user_sessions 行转换为服务层使用的会话字典"""
+    return {
+        'session_id': row['session_id'],
+        'auth_token': row['token'],
+        'csrf_token': row.get('csrf_token') or '',
+        'cookies': session_cookies(row.get('cookies')),
+        'is_active': bool(row.get('is_active', True))
+    }
+
+
+class SessionRegistry:
+    """认证会话注册表"""
+
+    def __init__(self):
+        self.session_config = config.get('sessions', {})
+        self.header = self.session_config.get('header', 'X-Session-Id').lower()
+        self.cookie = self.session_config.get('cookie', 'dida_session')
+        self.cookie_max_age = int(self.session_config.get('cookie_max_age_days', 30)) * 86400
+        # 默认关闭：多账号部署中未携带会话ID的请求不能拿到其他账号的数据
+        self.fallback_to_latest = self.session_config.get('fallback_to_latest', False)
+        self.max_cached = self.session_config.get('max_cached', 1000)
+        self.touch_interval = self.session_config.get('touch_interval', 3600)
+        self.not_found_ttl = self.session_config.get('not_found_ttl', 30)
+        self.default_refresh_interval = self.session_config.get('default_refresh_interval', 1.0)
+        self.skip_paths = tuple(self.session_config.get(
+            'skip_paths', ['/static', '/docs', '/redoc', '/openapi.json', '/system/metrics']
+        ))
+
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._touched: Dict[str, float] = {}
+        # 不存在的会话ID -> 记录时间（按插入顺序，超出 max_cached 时淘汰最早的）
+        self._missing: "OrderedDict[str, float]" = OrderedDict()
+        self._loads = SingleFlight()
+        self._default: Optional[Dict[str, Any]] = None
+        self._default_loaded = False
+        self._default_checked = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.not_found = 0
+        self.not_found_cached = 0
+        self.evictions = 0
+
+    def _remember(self, session: Dict[str, Any]) -> None:
+        """放入LRU，超出上限时淘汰最久未使用的会话（只从内存中移除）"""
+        session_id = session['session_id']
+        self._missing.pop(session_id, None)
+        self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        self._touched.setdefault(session_id, time.monotonic())
+        while len(self._sessions) > self.max_cached:
+            evicted, _ = self._sessions.popitem(last=False)
+            self._touched.pop(evicted, None)
+            self.evictions += 1
+
+    async def _load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        row = await db.run(db.get_user_session, session_id)
+        if not row:
+            return None
+        session = _build_session(row)
+        self._remember(session)
+        return session
+
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        按会话ID获取会话
+
+        Returns:
+            dict: 会话字典；会话不存在或已失效时返回None
+        """
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self.hits += 1
+            self._sessions.move_to_end(session_id)
+            # 定期刷新 updated_at，避免仍在使用的会话被定期维护清理
+            if time.monotonic() - self._touched.get(session_id, 0) > self.touch_interval:
+                self._touched[session_id] = time.monotonic()
+                await db.run(db.touch_user_session, session_id)
+            return session
+
+        missing_at = self._missing.get(session_id)
+        if missing_at is not None:
+            if time.monotonic() - missing_at < self.not_found_ttl:
+                self.not_found += 1
+                self.not_found_cached += 1
+                return None
+            del self._missing[session_id]
+
+        self.misses += 1
+        session = await self._loads.do(session_id, lambda: self._load(session_id))
+        if session is None:
+            self.not_found += 1
+            self._missing[session_id] = time.monotonic()
+            while len(self._missing) > self.max_cached:
+                self._missing.popitem(last=False)
+        return session
+
+    async def get_default(self) -> Optional[Dict[str, Any]]:
+        """获取未指定会话ID时使用的会话（最近登录的会话），首次调用时从数据库加载"""
+        if shared_state.is_shared and time.monotonic() - self._default_checked >= self.default_refresh_interval:
+            # 其他worker上的登录同样会改变默认会话；按间隔读取，不是每个请求都访问共享存储
+            self._default_checked = time.monotonic()
+            default_id = await shared_state.get(DEFAULT_SESSION_KEY)
+            if default_id and (self._default is None or self._default['session_id'] != default_id):
+                session = await self.get(default_id)
+                if session is not None:
+                    self._default = session
+                    self._default_loaded = True
+        if not self._default_loaded:
+            self._default_loaded = True
+            row = await db.run(db.get_latest_active_session)
+            if row and self._default is None:
+                self._default = _build_session(row)
+                app_logger.info(f"已从数据库恢复认证会话: {row['session_id']}")
+        return self._default
+
+    def skips(self, path: str) -> bool:
+        """路径是否不需要解析会话"""
+        return any(path == prefix or path.startswith(prefix.rstrip('/') + '/') for prefix in self.skip_paths)
+
+    async def resolve(self, session_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """解析请求使用的会话：指定了会话ID时只使用该会话，不回退到其他账号"""
+        if session_id:
+            return await self.get(session_id)
+        if self.fallback_to_latest:
+            return await self.get_default()
+        return None
+
+    async def register(self, session: Dict[str, Any]) -> None:
+        """
+        登记新登录的会话，并设为当前请求的会话
+
+        新会话同时成为未指定会话ID时的默认会话，与原先"最近一次登录生效"的行为一致
+        """
+        self._remember(session)
+        self._default = session
+        self._default_loaded = True
+        await shared_state.set(DEFAULT_SESSION_KEY, session['session_id'])
+        self.activate(session)
+
+    def activate(self, session: Dict[str, Any]) -> None:
+        """把会话设为当前请求的会话，响应时通过cookie下发会话ID"""
+        ctx = _current.get()
+        if ctx is None:
+            _current.set(_RequestContext(session))
+            return
+        ctx.session = session
+        ctx.issued = session['session_id']
+
+    async def bind(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """按ID加载会话并设为当前请求的会话（用于在其他请求中完成的登录）"""
+        session = await self.get(session_id)
+        if session is not None:
+            self.activate(session)
+        return session
+
+    def current(self) -> Optional[Dict[str, Any]]:
+        """当前请求的会话；不在请求中时使用默认会话"""
+        ctx = _current.get()
+        if ctx is not None:
+            return ctx.session
+        return self._default if self.fallback_to_latest else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取注册表统计（不包含会话ID）"""
+        lookups = self.hits + self.misses
+        return {
+            "cached": len(self._sessions),
+            "max_cached": self.max_cached,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "not_found": self.not_found,
+            "not_found_cached": self.not_found_cached,
+            "evictions": self.evictions,
+            "has_default": self._default is not None,
+            "fallback_to_latest": self.fallback_to_latest
+        }
+
+
+class SessionMiddleware:
+    """
+    按请求解析认证会话的ASGI中间件
+
+    使用纯ASGI实现，保证路由函数与中间件处于同一个上下文，
+    SSE等流式响应在整个响应期间都能读取到会话
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] not in ('http', 'websocket') or session_registry.skips(scope['path']):
+            await self.app(scope, receive, send)
+            return
+
+        conn = HTTPConnection(scope)
+        requested = conn.headers.get(session_registry.header) or conn.cookies.get(session_registry.cookie)
+        ctx = _RequestContext(await session_registry.resolve(requested))
+        token = _current.set(ctx)
+
+        async def send_with_cookie(message):
+            if message['type'] == 'http.response.start' and ctx.issued and ctx.issued != requested:
+                cookie = (
+                    f"{session_registry.cookie}={ctx.issued}; Path=/; HttpOnly; SameSite=Lax; "
+                    f"Max-Age={session_registry.cookie_max_age}"
+                )
+                message = {**message, 'headers': [*message.get('headers', []), (b'set-cookie', cookie.encode('latin-1'))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_cookie)
+        finally:
+            _current.reset(token)
+
+
+# 全局会话注册表实例
+session_registry = SessionRegistry()
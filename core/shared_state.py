@@ -0,0 +1,590 @@
+"""跨worker共享状态模块
+
+uvicorn 以 --workers N 运行时每个进程都有自己的模块级单例，
+缓存、默认会话和请求合并在进程之间互相不可见。共享状态后端提供统一的键值接口：
+- memory：进程内存储（默认，单进程部署，行为与原先一致）
+- sqlite：同一台机器上的多个worker共享一个SQLite文件
+- redis：任何兼容Redis协议（RESP）的服务
+
+值以JSON保存，支持过期时间；另外提供带过期时间的互斥锁，
+用于在多个worker之间合并相同的上游请求（见 SharedState.coalesce）。
+
+接口都是异步的，不在事件循环上做阻塞I/O：sqlite 后端的操作放到专用的单线程执行器中
+（与 db.run 相同），redis 后端使用基于 asyncio 流的RESP客户端
+
+进程内 SingleFlight、任务镜像同步锁和微信扫码登录流程仍按worker各自维护，
+跨worker时最多重复一次相同的工作，不影响结果
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+from core.config import config
+from utils import app_logger
+
+
+class StateBackend:
+    """共享状态存储后端接口"""
+
+    name = "base"
+
+    async def get(self, key: str) -> Any:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def incr(self, key: str) -> int:
+        """原子地把整数值加一并返回新值，键不存在时从0开始"""
+        raise NotImplementedError
+
+    async def acquire(self, key: str, token: str, ttl: float) -> bool:
+        """键不存在（或已过期）时写入token并返回True"""
+        raise NotImplementedError
+
+    async def release(self, key: str, token: str) -> None:
+        """只有持有者（token一致）才能删除锁"""
+        raise NotImplementedError
+
+    async def count(self, prefix: str) -> Optional[int]:
+        """统计前缀下未过期的键数量，后端无法统计时返回None"""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryStateBackend(StateBackend):
+    """
+    进程内存储后端
+
+    过期的键在再次读取时删除；写入后不再读取的键（如签发的二维码、导出任务记录）
+    每写入 PURGE_EVERY 次统一清理一次，与 sqlite 后端相同
+    """
+
+    name = "memory"
+
+    # 每写入多少次清理一次过期的键
+    PURGE_EVERY = 1000
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[Any, Optional[float]]] = {}
+        self._writes = 0
+
+    def _alive(self, key: str) -> bool:
+        item = self._data.get(key)
+        if item is None:
+            return False
+        if item[1] is not None and item[1] <= time.time():
+            del self._data[key]
+            return False
+        return True
+
+    async def get(self, key: str) -> Any:
+        return self._data[key][0] if self._alive(key) else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._data[key] = (value, time.time() + ttl if ttl else None)
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self._purge()
+
+    def _purge(self) -> None:
+        now = time.time()
+        expired = [key for key, (_, expires_at) in self._data.items()
+                   if expires_at is not None and expires_at <= now]
+        for key in expired:
+            del self._data[key]
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    async def incr(self, key: str) -> int:
+        value = (self._data[key][0] if self._alive(key) else 0) + 1
+        self._data[key] = (value, None)
+        return value
+
+    async def acquire(self, key: str, token: str, ttl: float) -> bool:
+        if self._alive(key):
+            return False
+        await self.set(key, token, ttl)
+        return True
+
+    async def release(self, key: str, token: str) -> None:
+        if await self.get(key) == token:
+            await self.delete(key)
+
+    async def count(self, prefix: str) -> Optional[int]:
+        return sum(1 for key in list(self._data) if key.startswith(prefix) and self._alive(key))
+
+
+class SQLiteStateBackend(StateBackend):
+    """
+    SQLite存储后端，同一台机器上的多个worker共享同一个文件
+
+    所有操作在专用的单线程执行器中执行，等待文件锁（busy_timeout）时不阻塞事件循环
+    """
+
+    name = "sqlite"
+
+    # 每写入多少次清理一次过期键
+    PURGE_EVERY = 1000
+
+    def __init__(self, path: str, busy_timeout: int = 5000):
+        self.path = Path(path)
+        self.busy_timeout = busy_timeout
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._writes = 0
+
+    async def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared-state")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(fn, *args))
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # 自动提交模式，加锁时显式使用 BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS shared_state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL
+                )
+            """)
+            self._conn = conn
+            app_logger.info(f"共享状态SQLite已连接: {self.path}")
+        return self._conn
+
+    def _get(self, key: str) -> Any:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT value, expires_at FROM shared_state WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return json.loads(row[0])
+
+    def _set(self, key: str, value: Any, ttl: Optional[float]) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), expires_at)
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                conn.execute("DELETE FROM shared_state WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                             (time.time(),))
+
+    def _delete(self, key: str) -> None:
+        with self._lock:
+            self._connection().execute("DELETE FROM shared_state WHERE key = ?", (key,))
+
+    def _incr(self, key: str) -> int:
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT value FROM shared_state WHERE key = ? "
+                    "AND (expires_at IS NULL OR expires_at > ?)", (key, time.time())
+                ).fetchone()
+                value = (json.loads(row[0]) if row else 0) + 1
+                conn.execute(
+                    "INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, NULL)",
+                    (key, json.dumps(value))
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return value
+
+    def _acquire(self, key: str, token: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM shared_state WHERE key = ? AND expires_at <= ?", (key, now))
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(token), now + ttl)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return cursor.rowcount == 1
+
+    def _release(self, key: str, token: str) -> None:
+        with self._lock:
+            self._connection().execute(
+                "DELETE FROM shared_state WHERE key = ? AND value = ?", (key, json.dumps(token))
+            )
+
+    def _count(self, prefix: str) -> int:
+        with self._lock:
+            return self._connection().execute(
+                "SELECT COUNT(*) FROM shared_state WHERE key >= ? AND key < ? "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (prefix, prefix + '\uffff', time.time())
+            ).fetchone()[0]
+
+    def _close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    async def get(self, key: str) -> Any:
+        return await self._run(self._get, key)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        await self._run(self._set, key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        await self._run(self._delete, key)
+
+    async def incr(self, key: str) -> int:
+        return await self._run(self._incr, key)
+
+    async def acquire(self, key: str, token: str, ttl: float) -> bool:
+        return await self._run(self._acquire, key, token, ttl)
+
+    async def release(self, key: str, token: str) -> None:
+        await self._run(self._release, key, token)
+
+    async def count(self, prefix: str) -> Optional[int]:
+        return await self._run(self._count, prefix)
+
+    async def close(self) -> None:
+        if self._executor is not None:
+            await self._run(self._close)
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+class RedisError(Exception):
+    """Redis协议返回的错误"""
+
+
+class RedisStateBackend(StateBackend):
+    """
+    Redis协议（RESP）存储后端
+
+    只实现用到的少量命令（AUTH、SELECT、GET、SET、DEL、INCR），不依赖第三方客户端；
+    使用一个 asyncio 流连接，命令依次发送，断开时自动重连一次
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, timeout: float = 2.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or '127.0.0.1'
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), timeout=self.timeout
+        )
+        if self.password:
+            await self._send('AUTH', self.password)
+        if self.db:
+            await self._send('SELECT', str(self.db))
+        app_logger.info(f"共享状态Redis已连接: {self.host}:{self.port}/{self.db}")
+
+    def _disconnect(self) -> None:
+        if self._writer is not None:
+            try:
+                self._writer.close()
+            except (OSError, RuntimeError):
+                pass
+        self._reader = None
+        self._writer = None
+
+    @staticmethod
+    def encode(*args: str) -> bytes:
+        """把命令编码为RESP数组"""
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg.encode('utf-8')
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    async def _send(self, *args: str) -> Any:
+        self._writer.write(self.encode(*args))
+        await self._writer.drain()
+        return await self._read()
+
+    async def _read(self) -> Any:
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Redis连接已关闭")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            raise RedisError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2].decode('utf-8')
+        if kind == b'*':
+            length = int(payload)
+            return None if length < 0 else [await self._read() for _ in range(length)]
+        raise RedisError(f"无法解析的响应: {line!r}")
+
+    async def _command(self, *args: str) -> Any:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # 连接和锁属于创建它们的事件循环
+            self._disconnect()
+            self._loop = loop
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._writer is None:
+                        await self._connect()
+                    return await asyncio.wait_for(self._send(*args), timeout=self.timeout)
+                except (OSError, ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    # 超时后连接上可能还有未读取的响应，只能断开重连
+                    self._disconnect()
+                    if attempt:
+                        raise
+
+    async def get(self, key: str) -> Any:
+        value = await self._command('GET', key)
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        args = ['SET', key, json.dumps(value, ensure_ascii=False)]
+        if ttl:
+            args += ['PX', str(max(int(ttl * 1000), 1))]
+        await self._command(*args)
+
+    async def delete(self, key: str) -> None:
+        await self._command('DEL', key)
+
+    async def incr(self, key: str) -> int:
+        return await self._command('INCR', key)
+
+    async def acquire(self, key: str, token: str, ttl: float) -> bool:
+        reply = await self._command('SET', key, json.dumps(token), 'NX', 'PX', str(max(int(ttl * 1000), 1)))
+        return reply == 'OK'
+
+    async def release(self, key: str, token: str) -> None:
+        # GET 与 DEL 之间锁可能恰好过期并被其他worker取得，概率很小且锁本身有过期时间，这里不使用Lua脚本
+        if await self.get(key) == token:
+            await self.delete(key)
+
+    async def count(self, prefix: str) -> Optional[int]:
+        return None
+
+    async def close(self) -> None:
+        self._disconnect()
+
+
+class SharedState:
+    """跨worker共享状态"""
+
+    def __init__(self):
+        self.state_config = config.get('shared_state', {})
+        self.prefix = self.state_config.get('key_prefix', 'dida:')
+        self.lock_ttl = self.state_config.get('lock_ttl', 30)
+        self.lock_poll_interval = self.state_config.get('lock_poll_interval', 0.05)
+        self.lock_poll_max_interval = self.state_config.get('lock_poll_max_interval', 0.5)
+        self.backend = self._build_backend()
+
+        self.leader = 0
+        self.follower_hits = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def _build_backend(self) -> StateBackend:
+        name = self.state_config.get('backend', 'memory')
+        if name == 'sqlite':
+            return SQLiteStateBackend(
+                self.state_config.get('sqlite_path', './output/databases/shared_state.db'),
+                busy_timeout=config.get('database', {}).get('busy_timeout', 5000)
+            )
+        if name == 'redis':
+            return RedisStateBackend(
+                self.state_config.get('redis_url', 'redis://127.0.0.1:6379/0'),
+                timeout=self.state_config.get('redis_timeout', 2.0)
+            )
+        if name != 'memory':
+            app_logger.warning(f"未知的共享状态后端 {name}，使用进程内存储")
+        return MemoryStateBackend()
+
+    @property
+    def is_shared(self) -> bool:
+        """是否在多个进程之间共享"""
+        return not isinstance(self.backend, MemoryStateBackend)
+
+    def key(self, *parts: str) -> str:
+        return self.prefix + ':'.join(parts)
+
+    async def get(self, key: str) -> Any:
+        """读取键值；后端不可用时记录警告并返回None，不影响请求"""
+        try:
+            return await self.backend.get(key)
+        except Exception as e:
+            self.errors += 1
+            app_logger.warning(f"读取共享状态失败 {key}: {e}")
+            return None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        try:
+            await self.backend.set(key, value, ttl)
+        except Exception as e:
+            self.errors += 1
+            app_logger.warning(f"写入共享状态失败 {key}: {e}")
+
+    async def delete(self, key: str) -> None:
+        try:
+            await self.backend.delete(key)
+        except Exception as e:
+            self.errors += 1
+            app_logger.warning(f"删除共享状态失败 {key}: {e}")
+
+    async def incr(self, key: str) -> Optional[int]:
+        """原子加一并返回新值；后端不可用时返回None"""
+        try:
+            return await self.backend.incr(key)
+        except Exception as e:
+            self.errors += 1
+            app_logger.warning(f"更新共享状态失败 {key}: {e}")
+            return None
+
+    async def acquire(self, key: str, token: str, ttl: float) -> bool:
+        """
+        获取带过期时间的互斥锁
+
+        后端不可用时记录警告并返回True：与 coalesce 一致，宁可重复执行也不让工作停止
+        """
+        try:
+            return await self.backend.acquire(key, token, ttl)
+        except Exception as e:
+            self.errors += 1
+            app_logger.warning(f"获取共享锁失败 {key}: {e}")
+            return True
+
+    async def release(self, key: str, token: str) -> None:
+        try:
+            await self.backend.release(key, token)
+        except Exception as e:
+            self.errors += 1
+            app_logger.warning(f"释放共享锁失败 {key}: {e}")
+
+    async def count(self, prefix: str) -> Optional[int]:
+        try:
+            return await self.backend.count(prefix)
+        except Exception as e:
+            self.errors += 1
+            app_logger.warning(f"统计共享状态失败 {prefix}: {e}")
+            return None
+
+    async def coalesce(self, name: str, fn: Callable[[], Awaitable[Any]],
+                       ready: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        跨worker合并相同的调用
+
+        取得锁的worker执行fn（fn负责把结果写入共享状态），其他worker按逐渐变长的间隔
+        检查ready()直到读到结果；锁过期或等待超过 lock_ttl 后自行执行fn。进程内存储时直接执行fn
+
+        Args:
+            name: 合并键
+            fn: 实际执行调用的协程函数
+            ready: 读取其他worker写入的结果的协程函数，尚未就绪时返回None
+        """
+        if not self.is_shared:
+            return await fn()
+
+        lock_key = self.key('lock', name)
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_ttl
+        delay = self.lock_poll_interval
+        while True:
+            try:
+                acquired = await self.backend.acquire(lock_key, token, self.lock_ttl)
+            except Exception as e:
+                self.errors += 1
+                app_logger.warning(f"获取共享锁失败 {name}: {e}")
+                return await fn()
+
+            if acquired:
+                self.leader += 1
+                try:
+                    return await fn()
+                finally:
+                    try:
+                        await self.backend.release(lock_key, token)
+                    except Exception as e:
+                        app_logger.warning(f"释放共享锁失败 {name}: {e}")
+
+            await asyncio.sleep(delay)
+            # 等待间隔逐渐变长，上游请求较慢时不频繁访问共享存储
+            delay = min(delay * 2, self.lock_poll_max_interval)
+            result = await ready()
+            if result is not None:
+                self.follower_hits += 1
+                return result
+            if time.monotonic() > deadline:
+                self.timeouts += 1
+                return await fn()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取共享状态统计"""
+        return {
+            "backend": self.backend.name,
+            "shared": self.is_shared,
+            "coalesce": {
+                "leader": self.leader,
+                "follower_hits": self.follower_hits,
+                "timeouts": self.timeouts
+            },
+            "errors": self.errors,
+            "lock_ttl": self.lock_ttl
+        }
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+
+# 全局共享状态实例
+shared_state = SharedState()
@@ -0,0 +1,54 @@
+"""请求合并模块
+
+相同键的并发调用只执行一次，其余调用者等待并共享同一个结果
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """单飞（single-flight）请求合并器"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行或加入一次调用
+
+        Args:
+            key: 合并键，相同键的并发调用共享结果
+            fn: 实际执行调用的协程函数
+
+        Returns:
+            Any: 调用结果（异常同样会传递给所有等待者）
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            # 以独立任务执行，避免首个调用者被取消时连带取消其他等待者
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t, k=key: self._on_done(k, t))
+
+        return await asyncio.shield(task)
+
+    def _on_done(self, key: Hashable, task: asyncio.Task) -> None:
+        """调用完成后移除记录"""
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # 标记异常已读取，避免所有等待者都被取消时产生告警
+        if not task.cancelled():
+            task.exception()
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取合并统计"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "in_flight": len(self._calls)
+        }
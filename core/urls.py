@@ -64,8 +64,8 @@ DIDA_AUTH_APIS = {
 
 # 滴答清单任务管理API
 DIDA_TASK_APIS = {
-    # 批量检查/获取所有任务接口
-    "get_all_tasks": "/batch/check/0",
+    # 批量检查/获取所有任务接口（需要拼接checkpoint，0表示全量）
+    "get_all_tasks": "/batch/check",  # /batch/check/{checkpoint}
 
     # 获取已完成任务接口（支持分页）
     "get_completed_tasks": "/project/all/closed",
@@ -213,13 +213,14 @@ def build_wechat_qr_url(state: str = None) -> str:
     return f"{WECHAT_URLS['qr_base_url']}?{query_string}"
 
 
-def build_wechat_poll_url(uuid: str, timestamp: int = None) -> str:
+def build_wechat_poll_url(uuid: str, timestamp: int = None, last: int = None) -> str:
     """
     构建微信登录状态轮询URL
     
     Args:
         uuid: 二维码密钥
         timestamp: 时间戳，用于防缓存
+        last: 上一次收到的 wx_errcode，传入后服务端会挂起请求直到状态变化
         
     Returns:
         str: 完整的轮询URL
@@ -228,7 +229,10 @@ def build_wechat_poll_url(uuid: str, timestamp: int = None) -> str:
     if timestamp is None:
         timestamp = int(time.time() * 1000)
     
-    return f"{WECHAT_URLS['poll_login_url']}?uuid={uuid}&_={timestamp}"
+    url = f"{WECHAT_URLS['poll_login_url']}?uuid={uuid}"
+    if last is not None:
+        url += f"&last={last}"
+    return f"{url}&_={timestamp}"
 
 
 def build_dida_api_url(endpoint: str) -> str:
@@ -325,3 +329,47 @@ def get_api_endpoints() -> dict:
         "user_apis": DIDA_USER_APIS,
         "custom_apis": CUSTOM_APIS
     }
+
+
+# 按路径长度倒序排列的 (路径, 端点名称)，首次解析时构建
+_ENDPOINT_PATHS = None
+
+
+def resolve_endpoint_name(url: str) -> str:
+    """
+    根据请求URL反查端点名称，用于上游请求的监控标签
+
+    滴答清单API按 DIDA_*_APIS 中最长匹配的路径前缀返回对应的键（如 get_all_tasks、focus_heatmap），
+    路径前的API版本（/api/v2、/api/v3 等）不参与匹配；
+    微信接口返回 WECHAT_URLS 中的键；无法识别时返回 other，避免标签数量随URL增长
+
+    Args:
+        url: 完整的请求URL（可以带查询参数）
+
+    Returns:
+        str: 端点名称
+    """
+    global _ENDPOINT_PATHS
+    if _ENDPOINT_PATHS is None:
+        paths = {}
+        for apis in (DIDA_AUTH_APIS, DIDA_TASK_APIS, DIDA_PROJECT_APIS, DIDA_STATISTICS_APIS,
+                     DIDA_POMODORO_APIS, DIDA_HABIT_APIS, DIDA_USER_APIS):
+            for name, path in apis.items():
+                paths.setdefault(path, name)
+        _ENDPOINT_PATHS = sorted(paths.items(), key=lambda item: len(item[0]), reverse=True)
+
+    url = str(url).split('?', 1)[0]
+    # 部分接口（如 user_ranking）使用 v3 版本，按 .../api/ 之后的版本段统一去掉
+    api_root = DIDA_API_BASE['base_url'].rsplit('/', 1)[0] + '/'
+    version, _, rest = url[len(api_root):].partition('/') if url.startswith(api_root) else ('', '', '')
+    if version[:1] == 'v' and version[1:].isdigit():
+        path = '/' + rest
+        for prefix, name in _ENDPOINT_PATHS:
+            if path == prefix or path.startswith(prefix + '/'):
+                return name
+        return "other"
+
+    for name, wechat_url in WECHAT_URLS.items():
+        if url == wechat_url or url.startswith(wechat_url + '/'):
+            return name
+    return "other"
@@ -0,0 +1,118 @@
+"""后台计算池模块
+
+把CPU密集的同步函数（如Excel渲染）放到进程池或线程池中执行，
+并限制排队数量，避免阻塞事件循环或无限堆积任务
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+from utils import app_logger
+
+
+class WorkerPoolBusyError(RuntimeError):
+    """计算池排队已满"""
+
+
+class WorkerPool:
+    """带排队上限的计算池"""
+
+    def __init__(self, name: str, mode: str = 'process', max_workers: int = 2, max_queue: int = 4):
+        """
+        Args:
+            name: 计算池名称（用于日志）
+            mode: 执行方式，process（进程池）、thread（线程池）或 inline（在事件循环中直接执行）
+            max_workers: 并行执行的任务数
+            max_queue: 除正在执行的任务外允许排队的任务数
+        """
+        self.name = name
+        self.mode = mode
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> Executor:
+        """首次使用时创建执行器"""
+        if self._executor is None:
+            if self.mode == 'process':
+                # 使用spawn，避免在已有线程的进程中fork
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix=f"{self.name}-worker"
+                )
+            app_logger.info(f"计算池 {self.name} 已创建: mode={self.mode}, max_workers={self.max_workers}")
+        return self._executor
+
+    async def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        提交任务并等待结果
+
+        Raises:
+            WorkerPoolBusyError: 正在执行和排队的任务已达上限
+        """
+        if self._pending >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise WorkerPoolBusyError(f"计算池 {self.name} 繁忙，请稍后重试")
+
+        self._pending += 1
+        if self.mode == 'inline':
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                self._finish(False)
+                raise
+            self._finish(True)
+            return result
+
+        loop = asyncio.get_running_loop()
+        future = self._get_executor().submit(partial(fn, *args, **kwargs))
+        # 在任务真正结束时才释放排队名额：调用方被取消时，已在执行的任务仍占用执行器
+        future.add_done_callback(lambda f: self._on_done(loop, f))
+        return await asyncio.wrap_future(future)
+
+    def _on_done(self, loop: asyncio.AbstractEventLoop, future: Future) -> None:
+        """执行器线程中的完成回调，计数转到事件循环线程中更新"""
+        ok = not future.cancelled() and future.exception() is None
+        try:
+            loop.call_soon_threadsafe(self._finish, ok)
+        except RuntimeError:
+            # 事件循环已关闭（服务退出），直接更新
+            self._finish(ok)
+
+    def _finish(self, ok: bool) -> None:
+        self._pending -= 1
+        if ok:
+            self.completed += 1
+        else:
+            self.failed += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取计算池统计"""
+        return {
+            "name": self.name,
+            "mode": self.mode,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "pending": self._pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected
+        }
+
+    def shutdown(self) -> None:
+        """关闭执行器"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            app_logger.info(f"计算池 {self.name} 已关闭")
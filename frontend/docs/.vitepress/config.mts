@@ -39,6 +39,7 @@ export default defineConfig({
             { text: '微信登录流程', link: '/api/auth/wechat-login-flow' },
             { text: '获取微信二维码', link: '/api/auth/get-wechat-qrcode' },
             { text: '轮询登录状态', link: '/api/auth/poll-login-status' },
+            { text: '订阅登录状态', link: '/api/auth/wechat-login-events' },
             { text: '验证微信登录', link: '/api/auth/validate-wechat-login' },
             { text: '微信登录回调处理', link: '/api/auth/wechat-callback' }
           ]
@@ -49,6 +50,7 @@ export default defineConfig({
           items: [
             { text: '获取所有任务', link: '/api/tasks/get-all-tasks' },
             { text: '获取已完成任务', link: '/api/tasks/get-completed-tasks' },
+            { text: '本地归档已完成任务', link: '/api/tasks/get-local-completed-tasks' },
             { text: '获取垃圾桶任务', link: '/api/tasks/get-trash-tasks' },
             { text: '获取任务统计', link: '/api/tasks/get-tasks-summary' }
           ]
@@ -108,7 +110,8 @@ export default defineConfig({
           collapsed: false,
           items: [
             { text: '导出任务到Excel', link: '/api/custom/export-tasks-excel' },
-            { text: '导出专注记录到Excel', link: '/api/custom/export-focus-excel' }
+            { text: '导出专注记录到Excel', link: '/api/custom/export-focus-excel' },
+            { text: '异步导出任务', link: '/api/custom/export-jobs' }
           ]
         }
       ]
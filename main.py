@@ -1,18 +1,42 @@
 """滴答清单API主应用"""
 import os
+import time
 from contextlib import asynccontextmanager
 
+# 启动耗时从导入本模块开始计算，包含下面所有依赖的导入
+_import_started = time.perf_counter()
+
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
-from core import config, db
+from core import config, db, http_client, response_cache
+from core.loop_monitor import loop_monitor
+from core.metrics import MetricsMiddleware, metrics
+from core.sessions import SessionMiddleware
+from core.shared_state import shared_state
+from core.db_maintenance import db_maintenance
+from core.audit import audit_sink
 from routers import auth, tasks, system, projects, statistics, pomodoros, habits, users, export
-from services import wechat_service
+from services.export_service import render_pool
+from services.export_job_service import export_job_service
+from services.login_flow_service import login_flow_manager
+from services.pomodoro_service import pomodoro_service
 from utils import app_logger
 
 
+def _check_startup_budget() -> None:
+    """记录启动耗时，超出 [app] startup_budget_seconds 时记录警告"""
+    elapsed = time.perf_counter() - _import_started
+    metrics.startup_duration.set(round(elapsed, 3))
+    budget = float(config.app.get('startup_budget_seconds', 0) or 0)
+    if budget and elapsed > budget:
+        app_logger.warning(f"服务启动耗时 {elapsed:.3f}s，超出启动预算 {budget}s，请检查启动时导入的模块")
+    else:
+        app_logger.info(f"服务启动完成，耗时 {elapsed:.3f}s")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
@@ -23,12 +47,35 @@ async def lifespan(app: FastAPI):
     db.init_database()
     app_logger.info("数据库初始化完成")
 
+    # 清理上次运行遗留的导出文件
+    await export_job_service.cleanup_orphans()
+
+    # 启动事件循环延迟监控、数据库定期维护和过期导出文件清理
+    loop_monitor.start()
+    db_maintenance.start()
+    export_job_service.start()
+    audit_sink.start()
+
+    _check_startup_budget()
+
     yield
 
     # 关闭时执行
     app_logger.info("滴答清单API服务关闭中...")
-    await wechat_service.close()
+    await export_job_service.shutdown()
+    await login_flow_manager.shutdown()
+    await response_cache.shutdown()
+    await pomodoro_service.shutdown()
+    await loop_monitor.stop()
+    await db_maintenance.stop()
+    await audit_sink.stop()
+    render_pool.shutdown()
+    await http_client.close()
+    await shared_state.close()
+    db.close()
     app_logger.info("服务已关闭")
+    # 等待后台线程写完队列中的日志
+    await app_logger.complete()
 
 
 # 创建FastAPI应用
@@ -50,6 +97,9 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# 按请求头或cookie解析认证会话（多账号）
+app.add_middleware(SessionMiddleware)
+
 # 添加CORS中间件
 app.add_middleware(
     CORSMiddleware,
@@ -59,6 +109,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 按路由记录请求数、状态码和延迟（最后添加的中间件在最外层，包含会话解析的耗时）
+app.add_middleware(MetricsMiddleware)
+
 # 创建静态文件目录
 static_dir = "static"
 if not os.path.exists(static_dir):
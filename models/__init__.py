@@ -5,6 +5,7 @@ from .base import (
     WeChatValidateRequest,
     WeChatValidateResponse,
     PasswordLoginRequest,
+    SessionBindRequest,
     UserSession,
     ApiResponse,
     TaskItem,
@@ -31,6 +32,7 @@ __all__ = [
     'WeChatValidateRequest',
     'WeChatValidateResponse',
     'PasswordLoginRequest',
+    'SessionBindRequest',
     'UserSession',
     'ApiResponse',
     'TaskItem',
@@ -38,11 +38,17 @@ class WeChatValidateResponse(BaseModel):
     success: bool = Field(..., description="是否成功")
     message: str = Field(..., description="响应消息")
     token: Optional[str] = Field(None, description="认证令牌")
+    session_id: Optional[str] = Field(None, description="会话ID，之后的请求通过 X-Session-Id 请求头或 dida_session cookie 携带")
     user_info: Optional[dict] = Field(None, description="用户信息")
     cookies: Optional[dict] = Field(None, description="响应cookies")
     raw_response: Optional[Union[dict, list]] = Field(None, description="原始响应数据")
 
 
+class SessionBindRequest(BaseModel):
+    """绑定会话请求模型"""
+    session_id: str = Field(..., description="会话ID，来自登录结果或SSE登录成功事件")
+
+
 class UserSession(BaseModel):
     """用户会话模型"""
     session_id: str = Field(..., description="会话ID")
@@ -1,13 +1,24 @@
 """认证相关API路由"""
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import FileResponse
-from models import WeChatQRResponse, WeChatValidateResponse, ApiResponse, PasswordLoginRequest
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import FileResponse, StreamingResponse
+from core.sessions import session_registry
+from models import WeChatQRResponse, WeChatValidateResponse, ApiResponse, PasswordLoginRequest, SessionBindRequest
 from services import wechat_service
+from services.login_flow_service import login_flow_manager, LoginFlowLimitError, UnknownQRCodeError
 from utils import app_logger
+import json
 import os
 
 router = APIRouter(prefix="/auth", tags=["认证"])
 
+# SSE保活间隔（秒）
+SSE_HEARTBEAT_SECONDS = 15
+
+
+def _client_id(request: Request) -> str:
+    """登录流程按客户端IP限制数量"""
+    return request.client.host if request.client else ""
+
 
 @router.get("/wechat/login",
            summary="微信扫码登录页面",
@@ -71,6 +82,7 @@ async def get_wechat_qrcode(
                 detail="获取微信二维码失败，请稍后重试"
             )
         
+        await login_flow_manager.register_issued(qr_response.qr_code_key)
         app_logger.info(f"成功返回微信二维码: {qr_response.qr_code_key}")
         return qr_response
         
@@ -135,31 +147,52 @@ async def validate_wechat_login(
            summary="轮询微信登录状态",
            description="轮询检查二维码是否已被扫码登录")
 async def poll_wechat_login(
+    request: Request,
     qr_code_key: str = Query(..., description="二维码密钥（16位字符）"),
-    max_attempts: int = Query(default=60, description="最大轮询次数，默认60次（约5分钟）")
+    max_attempts: int = Query(default=60, deprecated=True,
+                              description="已弃用，登录时长由 config.toml [wechat_login] flow_timeout 控制")
 ) -> WeChatValidateResponse:
     """
     轮询微信登录状态
 
     - **qr_code_key**: 二维码密钥（16位字符）
-    - **max_attempts**: 最大轮询次数，默认60次（约5分钟）
 
-    这个接口会持续轮询微信服务器，检查二维码是否已被扫码登录
+    这个接口会等待二维码登录流程结束（成功、失败或过期）后返回结果。
+    与 `/auth/wechat/events` 共享同一个后台长轮询任务，总时长不超过
+    config.toml [wechat_login] flow_timeout；客户端断开后流程会被取消。
+    二维码不是由 `/auth/wechat/qrcode` 签发或已过期时返回 404
     """
     try:
         app_logger.info(f"开始轮询微信登录状态，qr_code_key: {qr_code_key}")
 
-        result = await wechat_service.poll_qr_status(qr_code_key, max_attempts)
-
-        if not result:
-            raise HTTPException(
-                status_code=500,
-                detail="轮询微信登录状态失败"
+        flow = await login_flow_manager.get_or_start(qr_code_key, _client_id(request))
+
+        async for event in login_flow_manager.subscribe(qr_code_key, heartbeat=SSE_HEARTBEAT_SECONDS):
+            if event is None and await request.is_disconnected():
+                app_logger.info(f"客户端已断开，停止等待登录结果: {qr_code_key}")
+                break
+
+        result = flow.result
+        if result is not None and result.session_id:
+            # 登录在后台流程中完成，把新会话绑定到本次请求，响应时下发会话cookie
+            await session_registry.bind(result.session_id)
+        if result is None:
+            result = WeChatValidateResponse(
+                success=False,
+                message=flow.message,
+                token=None,
+                user_info=None,
+                cookies=None,
+                raw_response={"error": flow.status}
             )
 
         app_logger.info(f"轮询完成，结果: {result.success}")
         return result
 
+    except UnknownQRCodeError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except LoginFlowLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
@@ -170,6 +203,55 @@ async def poll_wechat_login(
         )
 
 
+@router.get("/wechat/events",
+           summary="订阅微信登录状态（SSE）",
+           description="以Server-Sent Events推送二维码登录状态变化，替代反复请求轮询接口")
+async def wechat_login_events(
+    request: Request,
+    qr_code_key: str = Query(..., description="二维码密钥（16位字符）")
+):
+    """
+    订阅微信登录状态
+
+    服务端为每个二维码只启动一个后台轮询任务，状态变化以 SSE 推送：
+
+    ```
+    event: status
+    data: {"qr_code_key": "...", "status": "scanned", "message": "已扫码，请在手机上确认登录", ...}
+    ```
+
+    - **status**: waiting（等待扫码）、scanned（已扫码）、confirmed（已确认，正在登录）、
+      success（登录成功）、failed（登录失败）、expired（二维码过期）
+    - 进入 success / failed / expired 后服务端关闭连接
+    - 事件中不包含令牌和cookie；success 事件带有新会话的 **session_id**，
+      页面通过 `POST /auth/session/bind` 换取会话cookie
+    - 二维码不是由 `/auth/wechat/qrcode` 签发或已过期时返回 404
+    - 进行中的登录流程达到上限时返回 429；同一客户端的旧二维码会被取消
+    """
+    app_logger.info(f"订阅微信登录状态，qr_code_key: {qr_code_key}")
+
+    try:
+        await login_flow_manager.get_or_start(qr_code_key, _client_id(request))
+    except UnknownQRCodeError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except LoginFlowLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+    async def event_stream():
+        async for event in login_flow_manager.subscribe(qr_code_key, heartbeat=SSE_HEARTBEAT_SECONDS):
+            if event is None:
+                # 保活注释，防止代理因空闲断开连接
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: status\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/wechat/callback",
            summary="微信登录回调处理",
            description="处理微信扫码后的回调，提取code参数")
@@ -218,6 +300,44 @@ async def wechat_callback(
         }
 
 
+@router.post("/session/bind",
+            response_model=ApiResponse,
+            summary="绑定认证会话",
+            description="把已登录的会话ID写入当前客户端的会话cookie")
+async def bind_session(bind_request: SessionBindRequest) -> ApiResponse:
+    """
+    绑定认证会话
+
+    - **session_id**: 会话ID，来自登录结果或 `/auth/wechat/events` 的 success 事件
+
+    扫码登录在后台流程中完成，SSE响应无法设置cookie；页面收到 success 事件后调用本接口，
+    服务端通过 `Set-Cookie: dida_session={会话ID}` 下发会话ID。会话不存在或已失效时返回 404
+    """
+    try:
+        session = await session_registry.bind(bind_request.session_id)
+        if session is None:
+            raise HTTPException(
+                status_code=404,
+                detail="会话不存在或已失效，请重新登录"
+            )
+
+        app_logger.info("已绑定认证会话到当前客户端")
+        return ApiResponse(
+            code=200,
+            message="绑定会话成功",
+            data={"session_id": session['session_id']}
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        app_logger.error(f"绑定认证会话时发生错误: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"服务器内部错误: {str(e)}"
+        )
+
+
 @router.post("/password/login",
             summary="密码登录",
             description="使用手机号/邮箱，密码进行登录")
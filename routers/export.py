@@ -1,19 +1,69 @@
 """自定义导出功能API路由"""
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
 import io
+import os
 import urllib.parse
 from services.export_service import export_service
+from services.export_job_service import export_job_service
 from services.dida_service import dida_service
 from utils import app_logger
 
 router = APIRouter(prefix="/custom", tags=["自定义接口"])
 
 
+def _iter_file(path: str, chunk_size: int = 64 * 1024):
+    """分块读取流式导出生成的临时文件"""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _remove_temp_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        app_logger.warning(f"删除导出临时文件失败: {e}")
+
+
+class TempFileResponse(StreamingResponse):
+    """
+    分块发送临时文件，响应结束后删除文件
+
+    删除放在 __call__ 的 finally 中：客户端在开始读取前断开、发送中断开
+    或发送失败时同样会删除，不依赖生成器是否被迭代
+    """
+
+    def __init__(self, path: str, **kwargs):
+        self.path = path
+        super().__init__(_iter_file(path), **kwargs)
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await run_in_threadpool(_remove_temp_file, self.path)
+
+
+def _file_response(result: dict, headers: dict) -> StreamingResponse:
+    """根据导出结果构建文件响应（流式模式发送临时文件，发送后删除）"""
+    if 'path' in result:
+        return TempFileResponse(result['path'], media_type=result['content_type'], headers=headers)
+    return StreamingResponse(io.BytesIO(result['content']), media_type=result['content_type'], headers=headers)
+
+
 @router.get("/export/tasks/excel",
            summary="导出任务到Excel",
            description="导出所有任务到Excel文件，包含全部任务、已完成任务、放弃任务、垃圾桶任务四个工作表")
-async def export_tasks_to_excel():
+async def export_tasks_to_excel(
+    stream: bool = Query(False, description="流式模式：逐行写入只写工作簿并分块发送，内存占用与任务数量无关")
+):
     """
     导出任务到Excel
 
@@ -31,6 +81,12 @@ async def export_tasks_to_excel():
     - 提醒设置：提醒配置、排除日期
     - 层级关系：父任务、子任务关系
     - 其他属性：标签、附件、评论数量等
+
+    四类数据并发获取（并发上限见 `config.toml [export] max_concurrency`），
+    单类数据获取失败不影响其他工作表，各阶段耗时通过 `Server-Timing` 响应头返回
+
+    传入 `stream=true` 使用流式模式：不构建DataFrame，逐行写入只写工作簿后分块发送，
+    导出大账号时内存占用保持平稳
     
     **注意**: 需要先调用认证接口设置会话
     """
@@ -46,12 +102,12 @@ async def export_tasks_to_excel():
             )
         
         # 调用导出服务
-        result = await export_service.export_tasks_to_excel()
+        result = await export_service.export_tasks_to_excel(streaming=stream)
         
         if 'error' in result:
             app_logger.error(f"导出任务失败: {result['error']}")
             raise HTTPException(
-                status_code=500,
+                status_code=503 if result.get('busy') else 500,
                 detail=f"导出失败: {result['error']}"
             )
         
@@ -60,14 +116,18 @@ async def export_tasks_to_excel():
         # 对文件名进行URL编码以支持中文
         encoded_filename = urllib.parse.quote(result['filename'], safe='')
 
-        # 返回文件下载响应
-        return StreamingResponse(
-            io.BytesIO(result['content']),
-            media_type=result['content_type'],
-            headers={
-                "Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}"
-            }
+        # 各获取阶段的耗时通过 Server-Timing 头返回
+        server_timing = ", ".join(
+            f"{name};dur={stage['elapsed'] * 1000:.0f}"
+            for name, stage in result.get('stages', {}).items()
         )
+
+        # 返回文件下载响应
+        return _file_response(result, {
+            "Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}",
+            "Content-Length": str(result['size']),
+            "Server-Timing": server_timing
+        })
         
     except HTTPException:
         raise
@@ -167,7 +227,9 @@ async def get_export_info():
 @router.get("/export/focus/excel",
            summary="导出专注记录到Excel",
            description="导出所有专注记录到Excel文件，包含完整的专注时间线数据")
-async def export_focus_records_to_excel():
+async def export_focus_records_to_excel(
+    stream: bool = Query(False, description="流式模式：逐行写入只写工作簿并分块发送，内存占用与记录数量无关")
+):
     """
     导出专注记录到Excel
 
@@ -186,6 +248,7 @@ async def export_focus_records_to_excel():
     **注意**:
     - 需要先调用认证接口设置会话
     - 会自动分页获取所有历史专注记录
+    - 传入 `stream=true` 使用流式模式，内存占用与记录数量无关
     """
     try:
         app_logger.info("请求导出专注记录到Excel")
@@ -199,12 +262,12 @@ async def export_focus_records_to_excel():
             )
 
         # 调用导出服务
-        result = await export_service.export_focus_records_to_excel()
+        result = await export_service.export_focus_records_to_excel(streaming=stream)
 
         if 'error' in result:
             app_logger.error(f"导出专注记录失败: {result['error']}")
             raise HTTPException(
-                status_code=500,
+                status_code=503 if result.get('busy') else 500,
                 detail=f"导出失败: {result['error']}"
             )
 
@@ -214,13 +277,10 @@ async def export_focus_records_to_excel():
         encoded_filename = urllib.parse.quote(result['filename'], safe='')
 
         # 返回文件下载响应
-        return StreamingResponse(
-            io.BytesIO(result['content']),
-            media_type=result['content_type'],
-            headers={
-                "Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}"
-            }
-        )
+        return _file_response(result, {
+            "Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}",
+            "Content-Length": str(result['size'])
+        })
 
     except HTTPException:
         raise
@@ -284,6 +344,12 @@ async def get_focus_export_info():
                         stats["focus_records_count_estimate"] = first_page_count
                 else:
                     stats["focus_records_count_estimate"] = "无法预估"
+
+            # 本地归档状态，导出时只需同步高水位之后的新记录
+            from services.focus_archive_service import focus_archive_service
+            archive_state = await focus_archive_service.get_state(auth_token)
+            stats["archived_records"] = archive_state['records']
+            stats["archive_backfill_done"] = bool(archive_state['backfill_done'])
         except Exception as e:
             app_logger.warning(f"获取专注记录统计失败: {e}")
             stats["focus_records_count_estimate"] = "获取失败"
@@ -298,3 +364,87 @@ async def get_focus_export_info():
             "message": f"服务器内部错误: {str(e)}",
             "auth_status": False
         }
+
+
+@router.post("/export/jobs",
+            summary="提交异步导出任务",
+            description="提交导出任务后立即返回任务ID，数据获取和渲染在后台执行，完成后通过下载链接获取文件")
+async def submit_export_job(
+    kind: str = Query("tasks", description="导出类型：tasks（任务）或 focus（专注记录）")
+):
+    """
+    提交异步导出任务
+
+    返回任务状态，包含 **job_id**，之后通过 `GET /custom/export/jobs/{job_id}` 查询进度：
+    - **progress.pages_fetched**: 已获取的上游页数
+    - **progress.rows_written**: 已写入的行数（渲染完成后更新）
+
+    完成的文件保存在服务器上（`config.toml [export_jobs]`），在有效期内相同会话提交的同类导出
+    会直接返回已有任务（`reused=true`），不会重复获取和渲染
+
+    **注意**: 需要先调用认证接口设置会话
+    """
+    try:
+        app_logger.info(f"请求提交导出任务: {kind}")
+
+        result = await export_job_service.submit(kind)
+
+        if 'error' in result:
+            if not dida_service.get_session_status()["has_session"]:
+                status_code = 401
+            elif result.get('busy'):
+                status_code = 503
+            else:
+                status_code = 400
+            raise HTTPException(status_code=status_code, detail=result['error'])
+
+        return result
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        app_logger.error(f"提交导出任务时发生未知错误: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"服务器内部错误: {str(e)}"
+        )
+
+
+@router.get("/export/jobs/{job_id}",
+           summary="查询导出任务状态",
+           description="查询异步导出任务的状态和进度")
+async def get_export_job(job_id: str):
+    """
+    查询导出任务状态
+
+    - **status**: pending（排队中）、running（执行中）、completed（已完成）、failed（失败）
+    - **download_url**: 任务完成后的下载地址
+    - **expires_at**: 文件过期时间（Unix时间戳），过期后任务和文件会被清理
+
+    任务只对提交它的会话可见，其他会话查询时返回404
+    """
+    job = await export_job_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="导出任务不存在或已过期")
+    return job
+
+
+@router.get("/export/jobs/{job_id}/download",
+           summary="下载导出文件",
+           description="下载已完成的异步导出任务生成的Excel文件")
+async def download_export_job(job_id: str):
+    """
+    下载导出文件
+
+    文件在有效期内可重复下载，只有提交任务的会话可以下载
+    """
+    job = await export_job_service.get_artifact(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="导出文件不存在、未完成或已过期")
+
+    encoded_filename = urllib.parse.quote(job['filename'], safe='')
+    return FileResponse(
+        job['path'],
+        media_type=job['content_type'],
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}"}
+    )
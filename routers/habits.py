@@ -1,8 +1,10 @@
 """习惯管理相关API路由"""
-from fastapi import APIRouter
+from typing import Optional
+from fastapi import APIRouter, Header
 from fastapi.responses import Response
 # 不再需要响应模型导入
 from services import habit_service, dida_service
+from core.cache import is_no_cache
 from utils import app_logger
 
 router = APIRouter(prefix="/habits", tags=["习惯管理"])
@@ -11,7 +13,9 @@ router = APIRouter(prefix="/habits", tags=["习惯管理"])
 @router.get("/all",
            summary="获取所有习惯",
            description="获取当前用户的所有习惯列表")
-async def get_all_habits():
+async def get_all_habits(
+    cache_control: Optional[str] = Header(None, description="传入 no-cache 时跳过缓存直接请求上游")
+):
     """
     获取所有习惯
     
@@ -36,7 +40,7 @@ async def get_all_habits():
         csrf_token = current_session['csrf_token']
         
         # 调用习惯服务
-        result = await habit_service.get_habits(auth_token, csrf_token)
+        result = await habit_service.get_habits(auth_token, csrf_token, use_cache=not is_no_cache(cache_control))
         
         if not result:
             return {"error": "service_error", "message": "获取习惯列表失败，请稍后重试"}
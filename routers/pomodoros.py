@@ -2,6 +2,7 @@
 from fastapi import APIRouter, Query
 from datetime import datetime
 from services import pomodoro_service, dida_service
+from services.focus_archive_service import focus_archive_service
 from utils import app_logger
 
 router = APIRouter(prefix="/pomodoros", tags=["番茄专注"])
@@ -166,6 +167,8 @@ async def get_focus_timeline(
             app_logger.info(f"专注记录时间线获取失败: {result.get('error')}")
         else:
             app_logger.info("专注记录时间线获取完成")
+            # 顺带写入本地归档，供 source=local 的统计使用
+            await focus_archive_service.archive(auth_token, result)
 
         # 直接返回原始响应
         return result
@@ -180,7 +183,8 @@ async def get_focus_timeline(
            description="获取指定日期范围内的专注趋势热力图数据")
 async def get_focus_heatmap(
     start_date: str = Query(..., description="开始日期，格式: YYYYMMDD", example="20231201"),
-    end_date: str = Query(..., description="结束日期，格式: YYYYMMDD", example="20231207")
+    end_date: str = Query(..., description="结束日期，格式: YYYYMMDD", example="20231207"),
+    source: str = Query("upstream", pattern="^(upstream|local)$", description="数据来源：upstream(上游统计接口) 或 local(从本地专注记录归档计算)")
 ):
     """
     获取专注趋势热力图
@@ -189,10 +193,14 @@ async def get_focus_heatmap(
     - 每日专注时长
     - 日期和时区信息
 
+    **数据来源**:
+    - upstream（默认）: 请求上游统计接口（过去的日期按天缓存）
+    - local: 从本地专注记录归档计算，不消耗上游请求；计算前会按 [focus_archive] 配置同步最新记录
+
     **注意**: 需要先完成微信登录获取认证会话
     """
     try:
-        app_logger.info(f"请求获取专注趋势热力图，日期范围: {start_date} - {end_date}")
+        app_logger.info(f"请求获取专注趋势热力图，日期范围: {start_date} - {end_date}，来源: {source}")
 
         # 验证日期格式
         try:
@@ -211,6 +219,12 @@ async def get_focus_heatmap(
         auth_token = current_session['auth_token']
         csrf_token = current_session['csrf_token']
 
+        # 从本地归档计算
+        if source == "local":
+            result = await focus_archive_service.get_heatmap(auth_token, csrf_token, start_date, end_date)
+            app_logger.info("专注趋势热力图本地计算完成")
+            return result
+
         # 调用番茄专注服务
         result = await pomodoro_service.get_focus_heatmap(auth_token, csrf_token, start_date, end_date)
 
@@ -236,7 +250,8 @@ async def get_focus_heatmap(
            description="获取指定日期范围内按时间段分布的专注数据")
 async def get_focus_time_distribution(
     start_date: str = Query(..., description="开始日期，格式: YYYYMMDD", example="20250526"),
-    end_date: str = Query(..., description="结束日期，格式: YYYYMMDD", example="20250601")
+    end_date: str = Query(..., description="结束日期，格式: YYYYMMDD", example="20250601"),
+    source: str = Query("upstream", pattern="^(upstream|local)$", description="数据来源：upstream(上游统计接口) 或 local(从本地专注记录归档计算)")
 ):
     """
     获取专注时间分布
@@ -245,10 +260,14 @@ async def get_focus_time_distribution(
     - 每日的时间段专注分布
     - 每小时的专注时长统计
 
+    **数据来源**:
+    - upstream（默认）: 请求上游统计接口（过去的日期按天缓存）
+    - local: 从本地专注记录归档计算，不消耗上游请求；计算前会按 [focus_archive] 配置同步最新记录
+
     **注意**: 需要先完成微信登录获取认证会话
     """
     try:
-        app_logger.info(f"请求获取专注时间分布，日期范围: {start_date} - {end_date}")
+        app_logger.info(f"请求获取专注时间分布，日期范围: {start_date} - {end_date}，来源: {source}")
 
         # 验证日期格式
         try:
@@ -267,6 +286,12 @@ async def get_focus_time_distribution(
         auth_token = current_session['auth_token']
         csrf_token = current_session['csrf_token']
 
+        # 从本地归档计算
+        if source == "local":
+            result = await focus_archive_service.get_time_distribution(auth_token, csrf_token, start_date, end_date)
+            app_logger.info("专注时间分布本地计算完成")
+            return result
+
         # 调用番茄专注服务
         result = await pomodoro_service.get_focus_time_distribution(auth_token, csrf_token, start_date, end_date)
 
@@ -292,7 +317,8 @@ async def get_focus_time_distribution(
            description="获取指定日期范围内按小时分布的专注时间统计")
 async def get_focus_hour_distribution(
     start_date: str = Query(..., description="开始日期，格式: YYYYMMDD", example="20250601"),
-    end_date: str = Query(..., description="结束日期，格式: YYYYMMDD", example="20250630")
+    end_date: str = Query(..., description="结束日期，格式: YYYYMMDD", example="20250630"),
+    source: str = Query("upstream", pattern="^(upstream|local)$", description="数据来源：upstream(上游统计接口) 或 local(从本地专注记录归档计算)")
 ):
     """
     获取专注时间按小时分布
@@ -301,10 +327,14 @@ async def get_focus_hour_distribution(
     - 每小时的总专注时长（分钟）
     - 24小时制的时间分布
 
+    **数据来源**:
+    - upstream（默认）: 请求上游统计接口（过去的日期按天缓存）
+    - local: 从本地专注记录归档计算，不消耗上游请求；计算前会按 [focus_archive] 配置同步最新记录
+
     **注意**: 需要先完成微信登录获取认证会话
     """
     try:
-        app_logger.info(f"请求获取专注时间按小时分布，日期范围: {start_date} - {end_date}")
+        app_logger.info(f"请求获取专注时间按小时分布，日期范围: {start_date} - {end_date}，来源: {source}")
 
         # 验证日期格式
         try:
@@ -323,6 +353,12 @@ async def get_focus_hour_distribution(
         auth_token = current_session['auth_token']
         csrf_token = current_session['csrf_token']
 
+        # 从本地归档计算
+        if source == "local":
+            result = await focus_archive_service.get_hour_distribution(auth_token, csrf_token, start_date, end_date)
+            app_logger.info("专注时间按小时分布本地计算完成")
+            return result
+
         # 调用番茄专注服务
         result = await pomodoro_service.get_focus_hour_distribution(auth_token, csrf_token, start_date, end_date)
 
@@ -1,6 +1,8 @@
 """清单管理相关API路由"""
-from fastapi import APIRouter
+from typing import Optional
+from fastapi import APIRouter, Header
 from services import project_service, dida_service
+from core.cache import is_no_cache
 from utils import app_logger
 
 router = APIRouter(prefix="/projects", tags=["清单管理"])
@@ -9,7 +11,9 @@ router = APIRouter(prefix="/projects", tags=["清单管理"])
 @router.get("/all",
            summary="获取所有项目/清单",
            description="获取当前用户的所有项目/清单列表")
-async def get_all_projects():
+async def get_all_projects(
+    cache_control: Optional[str] = Header(None, description="传入 no-cache 时跳过缓存直接请求上游")
+):
     """
     获取所有项目/清单
     
@@ -34,7 +38,7 @@ async def get_all_projects():
         csrf_token = current_session['csrf_token']
 
         # 调用项目服务
-        result = await project_service.get_projects(auth_token, csrf_token)
+        result = await project_service.get_projects(auth_token, csrf_token, use_cache=not is_no_cache(cache_control))
 
         if not result:
             return {"error": "service_error", "message": "获取项目列表失败，请稍后重试"}
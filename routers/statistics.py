@@ -1,7 +1,9 @@
 """统计相关API路由"""
-from fastapi import APIRouter, Query
+from typing import Optional
+from fastapi import APIRouter, Query, Header
 from datetime import datetime
 from services import statistics_service, dida_service
+from core.cache import is_no_cache
 from utils import app_logger
 
 router = APIRouter(prefix="/statistics", tags=["统计分析"])
@@ -10,7 +12,9 @@ router = APIRouter(prefix="/statistics", tags=["统计分析"])
 @router.get("/ranking",
            summary="获取用户排名统计",
            description="获取用户在滴答清单中的排名和基本统计信息")
-async def get_user_ranking():
+async def get_user_ranking(
+    cache_control: Optional[str] = Header(None, description="传入 no-cache 时跳过缓存直接请求上游")
+):
     """
     获取用户排名统计
     
@@ -35,7 +39,7 @@ async def get_user_ranking():
         csrf_token = current_session['csrf_token']
 
         # 调用统计服务
-        result = await statistics_service.get_user_ranking(auth_token, csrf_token)
+        result = await statistics_service.get_user_ranking(auth_token, csrf_token, use_cache=not is_no_cache(cache_control))
 
         if not result:
             return {"error": "service_error", "message": "获取用户排名统计失败，请稍后重试"}
@@ -57,7 +61,9 @@ async def get_user_ranking():
 @router.get("/general",
            summary="获取通用统计信息",
            description="获取概览、成就值、趋势等通用统计信息")
-async def get_general_statistics():
+async def get_general_statistics(
+    cache_control: Optional[str] = Header(None, description="传入 no-cache 时跳过缓存直接请求上游")
+):
     """
     获取通用统计信息
     
@@ -83,7 +89,7 @@ async def get_general_statistics():
         csrf_token = current_session['csrf_token']
 
         # 调用统计服务
-        result = await statistics_service.get_general_statistics(auth_token, csrf_token)
+        result = await statistics_service.get_general_statistics(auth_token, csrf_token, use_cache=not is_no_cache(cache_control))
 
         if not result:
             return {"error": "service_error", "message": "获取通用统计信息失败，请稍后重试"}
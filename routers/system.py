@@ -1,7 +1,12 @@
 """系统相关API路由"""
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
 from typing import Dict, Any
-from core import urls
+from core import urls, http_client, response_cache
+from core.cache import day_cache
+from core.shared_state import shared_state
+from core.loop_monitor import loop_monitor
+from core.metrics import metrics, CONTENT_TYPE
 from models import ApiResponse
 from utils import app_logger
 
@@ -146,6 +151,162 @@ async def get_doc_urls() -> ApiResponse:
         )
 
 
+@router.get("/upstream",
+           response_model=ApiResponse,
+           summary="获取上游请求统计",
+           description="获取共享上游连接池配置、并发请求合并和响应缓存的命中/未命中计数")
+async def get_upstream_stats() -> ApiResponse:
+    """
+    获取上游请求统计
+
+    返回共享HTTP客户端的连接池配置，以及相同GET请求合并（single-flight）的统计：
+    - **hits**: 加入已有在途请求的调用次数
+    - **misses**: 真正发往上游的请求次数
+    - **in_flight**: 当前在途的合并请求数
+
+    以及只读接口响应缓存（cache）的条目数、命中、过期命中、未命中和绕过次数，
+    专注统计按天缓存（day_cache）的条目数和按天计的命中、未命中次数，
+    以及跨worker共享状态（shared_state）的后端类型和请求合并次数
+    """
+    try:
+        return ApiResponse(
+            code=200,
+            message="获取上游请求统计成功",
+            data={
+                **http_client.get_stats(),
+                "cache": await response_cache.get_stats(),
+                "day_cache": await day_cache.get_stats(),
+                "shared_state": shared_state.get_stats()
+            }
+        )
+
+    except Exception as e:
+        app_logger.error(f"获取上游请求统计时发生错误: {e}")
+        return ApiResponse(
+            code=500,
+            message=f"获取上游请求统计失败: {str(e)}",
+            data=None
+        )
+
+
+@router.get("/metrics",
+           response_class=PlainTextResponse,
+           summary="获取监控指标",
+           description="以Prometheus文本格式输出路由和上游请求的请求数、状态码和延迟直方图")
+async def get_metrics() -> PlainTextResponse:
+    """
+    获取监控指标（Prometheus文本格式）
+
+    - **dida_http_requests_total / dida_http_request_duration_seconds**:
+      按路由模板（如 /tasks/completed）统计的请求数、状态码和延迟
+    - **dida_upstream_requests_total / dida_upstream_request_duration_seconds**:
+      按上游端点（core/urls.py 中 DIDA_*_APIS 的键，如 get_all_tasks）统计的请求数、状态码和延迟，
+      status 为 error 表示请求异常（超时、连接失败等）
+    - **dida_http_requests_in_progress**: 正在处理的请求数
+    """
+    return PlainTextResponse(metrics.render(), media_type=CONTENT_TYPE)
+
+
+@router.get("/loop-lag",
+           response_model=ApiResponse,
+           summary="获取事件循环延迟",
+           description="获取最近采样窗口内的事件循环延迟，以及Excel渲染计算池的状态")
+async def get_loop_lag() -> ApiResponse:
+    """
+    获取事件循环延迟
+
+    监控任务按固定间隔睡眠，实际唤醒时间与预期时间之差即为事件循环延迟（毫秒）：
+    - **last_ms / avg_ms / p50_ms / p99_ms / max_ms**: 延迟统计
+    - **render_pool**: Excel渲染计算池的执行方式、排队和拒绝次数
+
+    将 [export] render_executor 设为 inline 可对比渲染在事件循环中执行时的延迟
+    """
+    try:
+        from services.export_service import render_pool
+
+        return ApiResponse(
+            code=200,
+            message="获取事件循环延迟成功",
+            data={
+                **loop_monitor.get_stats(),
+                "render_pool": render_pool.get_stats()
+            }
+        )
+
+    except Exception as e:
+        app_logger.error(f"获取事件循环延迟时发生错误: {e}")
+        return ApiResponse(
+            code=500,
+            message=f"获取事件循环延迟失败: {str(e)}",
+            data=None
+        )
+
+
+@router.get("/sessions",
+           response_model=ApiResponse,
+           summary="获取认证会话统计",
+           description="获取认证会话注册表的缓存数量、命中率和淘汰次数")
+async def get_sessions() -> ApiResponse:
+    """
+    获取认证会话统计
+
+    - **cached / max_cached**: 内存中的会话数量和上限
+    - **hits / misses / hit_rate**: 按会话ID查找的命中情况，未命中时从数据库加载
+    - **not_found**: 请求指定的会话不存在或已失效的次数
+    - **not_found_cached**: 其中命中"不存在"缓存、未查询数据库的次数（`not_found_ttl`）
+    - **has_default**: 是否有未指定会话ID时使用的默认会话
+    """
+    try:
+        from core.sessions import session_registry
+
+        return ApiResponse(
+            code=200,
+            message="获取认证会话统计成功",
+            data=session_registry.get_stats()
+        )
+
+    except Exception as e:
+        app_logger.error(f"获取认证会话统计时发生错误: {e}")
+        return ApiResponse(
+            code=500,
+            message=f"获取认证会话统计失败: {str(e)}",
+            data=None
+        )
+
+
+@router.get("/login-flows",
+           response_model=ApiResponse,
+           summary="获取登录流程统计",
+           description="获取进行中的微信扫码登录流程数量、订阅者数量和上限配置")
+async def get_login_flows() -> ApiResponse:
+    """
+    获取登录流程统计
+
+    - **active / finished**: 进行中和已结束（保留期内）的流程数
+    - **subscribers / clients**: 当前订阅者连接数和进行中流程涉及的客户端数
+    - **by_status**: 各状态的流程数
+    - **started / rejected / replaced / abandoned**: 启动、因全局上限被拒绝、
+      被同一客户端的新二维码替换、因页面关闭（或一直没有订阅）被取消的累计次数
+    - **unknown**: 请求的二维码不是本服务签发的或已过期、被拒绝的次数
+    """
+    try:
+        from services.login_flow_service import login_flow_manager
+
+        return ApiResponse(
+            code=200,
+            message="获取登录流程统计成功",
+            data=login_flow_manager.get_stats()
+        )
+
+    except Exception as e:
+        app_logger.error(f"获取登录流程统计时发生错误: {e}")
+        return ApiResponse(
+            code=500,
+            message=f"获取登录流程统计失败: {str(e)}",
+            data=None
+        )
+
+
 @router.get("/info",
            response_model=ApiResponse,
            summary="获取系统信息",
@@ -1,8 +1,11 @@
 """任务相关API路由"""
+import json
 from fastapi import APIRouter, HTTPException, Query, Body
+from fastapi.responses import StreamingResponse
 from typing import Optional
 from models import ApiResponse
 from services import dida_service
+from services.closed_task_archive_service import closed_task_archive_service
 from utils import app_logger
 
 router = APIRouter(prefix="/tasks", tags=["任务管理"])
@@ -33,7 +36,7 @@ async def set_auth_session(
                 detail="认证令牌和CSRF令牌不能为空"
             )
         
-        session_id = dida_service.set_auth_session(auth_token, csrf_token)
+        session_id = await dida_service.set_auth_session(auth_token, csrf_token)
         
         return ApiResponse(
             code=200,
@@ -57,7 +60,9 @@ async def set_auth_session(
 @router.get("/all",
            summary="获取所有任务",
            description="获取当前用户的所有任务列表")
-async def get_all_tasks():
+async def get_all_tasks(
+    full_sync: bool = Query(False, description="是否强制全量同步（忽略本地checkpoint）")
+):
     """
     获取所有任务
     
@@ -66,13 +71,16 @@ async def get_all_tasks():
     - 任务状态（0=未完成，2=已完成）
     - 优先级、创建时间、修改时间
     - 项目ID、标签等信息
+
+    **增量同步**: 服务端在本地SQLite中维护任务镜像，只向上游请求自上次checkpoint以来的变更，
+    响应结构与上游 `/batch/check/0` 一致；传入 `full_sync=true` 可强制全量同步
     
     **注意**: 需要先调用 `/tasks/set-auth` 设置认证会话
     """
     try:
-        app_logger.info("请求获取所有任务")
+        app_logger.info(f"请求获取所有任务，全量同步: {full_sync}")
         
-        result = await dida_service.get_all_tasks()
+        result = await dida_service.get_all_tasks(full_sync=full_sync)
 
         if not result:
             return {"error": "获取任务失败，请稍后重试"}
@@ -222,6 +230,60 @@ async def get_completed_tasks(
         return {"error": "server_error", "message": f"服务器内部错误: {str(e)}"}
 
 
+@router.get("/completed/local",
+           summary="从本地归档获取已完成/已放弃任务",
+           description="从本地归档按completedTime倒序分页读取已完成或已放弃的任务")
+async def get_local_completed_tasks(
+    status: str = Query("Completed", pattern="^(Completed|Abandoned)$", description="任务状态：Completed(已完成) 或 Abandoned(已放弃)"),
+    limit: int = Query(50, ge=1, le=1000, description="每页任务数量，默认50"),
+    offset: int = Query(0, ge=0, description="跳过的任务数量"),
+    refresh: bool = Query(False, description="读取前是否先同步completedTime高水位之后关闭的任务")
+):
+    """
+    从本地归档获取已完成/已放弃任务
+
+    已关闭的任务按账号和状态归档在本地SQLite中，并记录见过的最新 completedTime（高水位）：
+    - 归档为空时自动执行一次全量同步（按时间窗口并发获取全部历史）
+    - **refresh=true** 时只请求高水位之后关闭的任务，通常只需一次上游请求
+    - 每隔 [closed_archive] full_sync_interval_hours 小时全量同步一次，去掉被重新打开的任务
+
+    **响应格式**:
+    ```json
+    {
+        "status": "Completed",
+        "total": 1520,          // 归档中该状态的任务总数
+        "offset": 0,
+        "tasks": [...],         // 按completedTime倒序
+        "newest_completed_time": "2025-03-15T13:30:54.000+0000",
+        "last_full_sync_at": "2025-03-15 21:30:54.123456",
+        "sync": {...}           // 本次同步结果，未同步时为null
+    }
+    ```
+
+    **注意**: 需要先完成微信登录获取认证会话
+    """
+    try:
+        app_logger.info(f"请求从本地归档获取{status}任务，limit: {limit}, offset: {offset}, refresh: {refresh}")
+
+        # 检查认证状态
+        session_status = dida_service.get_session_status()
+        if not session_status["has_session"]:
+            return {"error": "no_auth_session", "message": "未设置认证会话，请先完成微信登录"}
+
+        result = await closed_task_archive_service.get_tasks(status, limit, offset, refresh=refresh)
+
+        if 'error' in result:
+            app_logger.info(f"本地{status}任务获取失败: {result.get('error')}")
+        else:
+            app_logger.info(f"本地{status}任务获取完成，返回 {len(result['tasks'])} 条，共 {result['total']} 条")
+
+        return result
+
+    except Exception as e:
+        app_logger.error(f"从本地归档获取{status}任务时发生未知错误: {e}")
+        return {"error": "server_error", "message": f"服务器内部错误: {str(e)}"}
+
+
 @router.get("/trash",
            summary="获取垃圾桶任务",
            description="获取垃圾桶中的任务列表")
@@ -274,3 +336,41 @@ async def get_trash_tasks(
     except Exception as e:
         app_logger.error(f"获取垃圾桶任务时发生未知错误: {e}")
         return {"error": "server_error", "message": f"服务器内部错误: {str(e)}"}
+
+
+@router.get("/trash/stream",
+           summary="流式获取全部垃圾桶任务",
+           description="沿next游标获取垃圾桶中的全部任务，以NDJSON（每行一个任务）边获取边返回")
+async def stream_trash_tasks(
+    page_size: Optional[int] = Query(None, ge=1, le=500, description="每页任务数量，默认取 config.toml [trash] page_size"),
+    task_type: int = Query(1, description="任务类型，默认1")
+):
+    """
+    流式获取全部垃圾桶任务
+
+    服务端沿响应中的 **next** 游标逐页获取，每获取一页就把其中的任务写出，
+    响应类型为 `application/x-ndjson`，每行一个任务JSON对象。
+
+    中途某一页获取失败时，最后一行为 `{"error": "..."}`
+
+    **注意**: 需要先完成微信登录获取认证会话
+    """
+    app_logger.info(f"请求流式获取垃圾桶任务，page_size: {page_size}, type: {task_type}")
+
+    # 检查认证状态
+    session_status = dida_service.get_session_status()
+    if not session_status["has_session"]:
+        return {"error": "no_auth_session", "message": "未设置认证会话，请先完成微信登录"}
+
+    async def iter_lines():
+        count = 0
+        try:
+            async for page in dida_service.iter_trash_pages(page_size, task_type):
+                yield ''.join(json.dumps(task, ensure_ascii=False) + '\n' for task in page)
+                count += len(page)
+            app_logger.info(f"垃圾桶任务流式返回完成，任务数: {count}")
+        except Exception as e:
+            app_logger.error(f"流式获取垃圾桶任务时发生错误: {e}")
+            yield json.dumps({"error": str(e)}, ensure_ascii=False) + '\n'
+
+    return StreamingResponse(iter_lines(), media_type="application/x-ndjson")
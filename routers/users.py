@@ -1,6 +1,8 @@
 """用户相关API路由"""
-from fastapi import APIRouter
+from typing import Optional
+from fastapi import APIRouter, Header
 from services import user_service, dida_service
+from core.cache import is_no_cache
 from utils import app_logger
 
 router = APIRouter(prefix="/users", tags=["用户信息"])
@@ -9,7 +11,9 @@ router = APIRouter(prefix="/users", tags=["用户信息"])
 @router.get("/profile",
            summary="获取用户信息",
            description="获取当前登录用户的详细信息")
-async def get_user_profile():
+async def get_user_profile(
+    cache_control: Optional[str] = Header(None, description="传入 no-cache 时跳过缓存直接请求上游")
+):
     """
     获取用户信息
     
@@ -36,7 +40,7 @@ async def get_user_profile():
         csrf_token = current_session['csrf_token']
         
         # 调用用户服务
-        result = await user_service.get_user_profile(auth_token, csrf_token)
+        result = await user_service.get_user_profile(auth_token, csrf_token, use_cache=not is_no_cache(cache_control))
         
         if not result:
             return {"error": "service_error", "message": "获取用户信息失败，请稍后重试"}
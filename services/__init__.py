@@ -7,6 +7,7 @@ from .pomodoro_service import pomodoro_service
 from .habit_service import habit_service
 from .user_service import user_service
 from .export_service import export_service
+from .export_job_service import export_job_service
 
 __all__ = [
     'wechat_service',
@@ -16,5 +17,6 @@ __all__ = [
     'pomodoro_service',
     'habit_service',
     'user_service',
-    'export_service'
+    'export_service',
+    'export_job_service'
 ]
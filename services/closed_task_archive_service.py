@@ -0,0 +1,243 @@
+"""已完成/已放弃任务归档服务模块
+
+已关闭的任务几乎不会再变化，按账号和状态归档到本地SQLite，
+并记录见过的最新 completedTime（高水位，没有任何任务时为同步时间）：
+- 首次同步和定期全量同步：按时间窗口并发获取全部历史，替换归档；
+  历史从账号注册时间开始
+- 之后的同步：只请求高水位之后关闭的任务（通常一次请求），按ID写入或更新
+
+导出和 /tasks/completed/local 都从归档读取
+"""
+import asyncio
+import time
+import weakref
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core import config, db
+from core.cache import make_session_key
+from services.dida_service import dida_service
+from services.user_service import user_service
+from utils import app_logger
+
+# /project/all/closed 每页返回的任务数量
+CLOSED_PAGE_SIZE = 50
+
+CLOSED_STATUSES = ("Completed", "Abandoned")
+
+
+class ClosedTaskArchiveService:
+    """已完成/已放弃任务归档服务类"""
+
+    def __init__(self):
+        self.archive_config = config.get('closed_archive', {})
+        # 只在同步进行中保留锁，账号数量增长时不累积
+        self._locks: "weakref.WeakValueDictionary[Tuple[str, str], asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    @staticmethod
+    def _utcnow() -> datetime:
+        return datetime.now(timezone.utc).replace(tzinfo=None)
+
+    def _closed_task_windows(self, since: Optional[datetime] = None) -> List[Tuple[str, str]]:
+        """
+        把 since（默认 history_start）至今的时间范围切分为多个窗口
+
+        Returns:
+            list: (from, to) 列表，格式为接口需要的 YYYY-MM-DD HH:MM:SS（UTC），从新到旧排列
+        """
+        window = timedelta(days=self.archive_config.get('window_days', 90))
+        start = since or datetime.strptime(self.archive_config.get('history_start', '2015-01-01'), '%Y-%m-%d')
+        # 上限多留一天，避免时区差异漏掉最新的任务
+        end = self._utcnow() + timedelta(days=1)
+
+        windows = []
+        while end > start:
+            window_start = max(start, end - window)
+            windows.append((window_start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S')))
+            end = window_start
+        return windows
+
+    async def _history_start(self, session: Dict[str, Any]) -> datetime:
+        """
+        全量同步的起始时间：账号注册时间（前一天）与 history_start 中较晚的一个
+
+        获取用户信息失败或没有注册时间时使用 history_start
+        """
+        start = datetime.strptime(self.archive_config.get('history_start', '2015-01-01'), '%Y-%m-%d')
+        if not self.archive_config.get('start_from_account_created', True):
+            return start
+        try:
+            profile = await user_service.get_user_profile(session['auth_token'], session['csrf_token'])
+            created = (profile or {}).get('createdTime') if isinstance(profile, dict) else None
+            if created:
+                return max(start, datetime.strptime(str(created)[:10], '%Y-%m-%d') - timedelta(days=1))
+        except Exception as e:
+            app_logger.warning(f"获取账号注册时间失败，从 {start:%Y-%m-%d} 开始同步: {e}")
+        return start
+
+    async def _crawl_window(self, status: str, window_from: str, window_to: str,
+                            on_page: Optional[Callable[[], None]] = None) -> List[Dict]:
+        """在单个时间窗口内按completedTime游标分页获取"""
+        tasks: List[Dict] = []
+        to = window_to
+
+        while True:
+            result = await dida_service.get_completed_tasks(to, status, from_time=window_from)
+            if on_page:
+                on_page()
+            if not isinstance(result, list):
+                raise RuntimeError(f"窗口 {window_from} ~ {window_to} 获取失败: {result}")
+
+            tasks.extend(result)
+
+            # 返回的任务数少于一页，说明该窗口已取完
+            if len(result) < CLOSED_PAGE_SIZE:
+                return tasks
+
+            # 使用最后一个任务的completedTime作为下次分页参数
+            to = result[-1].get('completedTime')
+            if not to:
+                app_logger.info("最后一个任务没有completedTime，停止分页")
+                return tasks
+
+    async def _crawl(self, status: str, windows: List[Tuple[str, str]],
+                     on_page: Optional[Callable[[], None]] = None) -> Tuple[List[Dict], int]:
+        """
+        并发获取多个时间窗口
+
+        接口每页最多返回50条，单一游标只能串行翻页；窗口之间并发获取（并发上限 window_concurrency），
+        窗口内仍按游标翻页，最后按任务ID去重。
+        全量同步会替换整个归档，因此不能因为中间有一段空窗口就跳过更早的窗口，
+        获取范围只由 _history_start（账号注册时间）限制
+
+        Returns:
+            tuple: (任务列表, 失败的窗口数)
+        """
+        semaphore = asyncio.Semaphore(max(1, self.archive_config.get('window_concurrency', 4)))
+
+        async def crawl(window_from: str, window_to: str) -> List[Dict]:
+            async with semaphore:
+                return await self._crawl_window(status, window_from, window_to, on_page)
+
+        results = await asyncio.gather(*(crawl(f, t) for f, t in windows), return_exceptions=True)
+
+        merged: Dict[str, Dict] = {}
+        failed = 0
+        for result in results:
+            if isinstance(result, Exception):
+                failed += 1
+                app_logger.warning(f"获取{status}任务失败: {result}")
+                continue
+            for task in result:
+                merged.setdefault(task.get('id'), task)
+        return list(merged.values()), failed
+
+    @staticmethod
+    def _parse_completed_time(value: str) -> datetime:
+        """completedTime（2025-03-15T13:30:54.000+0000）转为UTC时间"""
+        return datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')
+
+    async def refresh(self, status: str, on_page: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+        """
+        同步某个状态的已关闭任务到归档
+
+        Args:
+            status: Completed 或 Abandoned
+            on_page: 每请求一页时调用，用于统计进度
+
+        Returns:
+            dict: 同步方式、写入条数和耗时；失败时包含error
+        """
+        session = dida_service.current_session
+        if not session:
+            return {"error": "no_auth_session"}
+        account_key = make_session_key(session['auth_token'])
+
+        lock = self._locks.get((account_key, status))
+        if lock is None:
+            lock = self._locks[(account_key, status)] = asyncio.Lock()
+        async with lock:
+            started = time.perf_counter()
+            state = await db.run(db.get_closed_task_state, account_key, status)
+            high_water = state['newest_completed_time'] if state else None
+
+            full_sync = high_water is None
+            if not full_sync and state.get('last_full_sync_at'):
+                interval = self.archive_config.get('full_sync_interval_hours', 168) * 3600
+                last_full = datetime.fromisoformat(str(state['last_full_sync_at']))
+                full_sync = (datetime.now() - last_full).total_seconds() > interval
+
+            if full_sync:
+                windows = self._closed_task_windows(await self._history_start(session))
+            else:
+                # 从高水位（含）开始取，边界上的任务重复写入即可
+                windows = [(
+                    self._parse_completed_time(high_water).strftime('%Y-%m-%d %H:%M:%S'),
+                    (self._utcnow() + timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+                )]
+
+            crawl_started = self._utcnow()
+            tasks, failed = await self._crawl(status, windows, on_page)
+            if failed:
+                # 有窗口失败时不推进高水位，也不替换归档
+                if full_sync and tasks:
+                    await db.run(db.save_closed_tasks, account_key, status, tasks, high_water)
+                return {"error": f"{failed} 个时间窗口获取失败", "mode": "full" if full_sync else "incremental"}
+
+            newest = max(
+                [t['completedTime'] for t in tasks if t.get('completedTime')] + ([high_water] if high_water else []),
+                default=None
+            )
+            if newest is None:
+                # 该状态没有任何任务（如大多数账号的放弃任务）时以同步时间作为高水位，
+                # 之后按增量同步只请求一次，不再每次重复全量获取；提前一天抵消与上游的时钟差
+                newest = (crawl_started - timedelta(days=1)).strftime('%Y-%m-%dT%H:%M:%S.000+0000')
+            written = await db.run(db.save_closed_tasks, account_key, status, tasks, newest, full_sync)
+            if written < 0:
+                return {"error": "写入归档失败"}
+
+            elapsed = round(time.perf_counter() - started, 3)
+            app_logger.info(
+                f"{status}任务归档同步完成: {'全量' if full_sync else '增量'}，"
+                f"{len(windows)} 个时间窗口，写入 {written} 条，高水位 {newest}，耗时 {elapsed}s"
+            )
+            return {"mode": "full" if full_sync else "incremental", "written": written,
+                    "newest_completed_time": newest, "elapsed": elapsed}
+
+    async def get_tasks(self, status: str, limit: Optional[int] = None, offset: int = 0,
+                        refresh: bool = True,
+                        on_page: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+        """
+        从归档读取已关闭任务（按completedTime倒序）
+
+        Args:
+            status: Completed 或 Abandoned
+            limit: 返回条数，None表示全部
+            offset: 跳过条数
+            refresh: 读取前是否先同步高水位之后的新任务；归档为空时总是同步
+        """
+        session = dida_service.current_session
+        if not session:
+            return {"error": "no_auth_session", "message": "未设置认证会话，请先完成微信登录"}
+        account_key = make_session_key(session['auth_token'])
+
+        sync = None
+        state = await db.run(db.get_closed_task_state, account_key, status)
+        if refresh or state is None:
+            sync = await self.refresh(status, on_page)
+
+        tasks, total = await db.run(db.get_closed_tasks, account_key, status, limit, offset)
+        state = await db.run(db.get_closed_task_state, account_key, status)
+        return {
+            "status": status,
+            "total": total,
+            "offset": offset,
+            "tasks": tasks,
+            "newest_completed_time": state['newest_completed_time'] if state else None,
+            "last_full_sync_at": str(state['last_full_sync_at']) if state and state['last_full_sync_at'] else None,
+            "sync": sync
+        }
+
+
+# 全局已关闭任务归档服务实例
+closed_task_archive_service = ClosedTaskArchiveService()
@@ -1,10 +1,14 @@
 """滴答清单API服务模块"""
+import asyncio
 import uuid
 import time
-from typing import Optional, Dict, Any, List
-import httpx
+import weakref
+from datetime import datetime
+from typing import Optional, Dict, Any, List, AsyncIterator
 from utils import app_logger
-from core import config, db, urls
+from core import config, db, urls, http_client
+from core.cache import make_session_key
+from core.sessions import session_registry, session_cookies
 from models import TasksResponse, TaskItem
 
 
@@ -13,48 +17,53 @@ class DidaAPIService:
     
     def __init__(self):
         self.request_config = config.get('request_config', {})
-        self.client = httpx.AsyncClient(timeout=self.request_config.get('timeout', 30.0))
-        
-        # 从数据库获取当前活跃的认证会话
-        self.current_session = None
-        self._load_active_session()
-    
-    def _load_active_session(self):
-        """从数据库加载活跃的认证会话"""
-        try:
-            # 从数据库获取最新的活跃会话
-            session_data = db.get_latest_active_session()
-            if session_data:
-                self.current_session = {
-                    'session_id': session_data['session_id'],
-                    'auth_token': session_data['token'],
-                    'csrf_token': session_data['csrf_token'],
-                    'is_active': session_data['is_active']
-                }
-                app_logger.info(f"已从数据库恢复认证会话: {session_data['session_id']}")
-            else:
-                app_logger.info("数据库中没有找到活跃的认证会话")
-        except Exception as e:
-            app_logger.error(f"加载认证会话失败: {e}")
-    
-    def set_auth_session(self, auth_token: str, csrf_token: str) -> str:
-        """设置认证会话"""
-        session_id = str(uuid.uuid4())
-        self.current_session = {
+        self.client = http_client
+        self.task_mirror_config = config.get('task_mirror', {})
+        # 只在同步进行中（有协程持有或等待）时保留锁，多账号部署下不会无限增长
+        self._mirror_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    @property
+    def current_session(self) -> Optional[Dict[str, Any]]:
+        """当前请求的认证会话，由会话注册表按请求头或cookie解析"""
+        return session_registry.current()
+
+    async def set_auth_session(self, auth_token: str, csrf_token: str,
+                               cookies: Optional[Dict[str, str]] = None,
+                               session_id: Optional[str] = None) -> str:
+        """
+        设置认证会话
+
+        新会话保存到数据库并登记到会话注册表，作为当前请求的会话，
+        响应时通过cookie下发会话ID；之后的请求携带该会话ID即可使用这个账号
+
+        Args:
+            auth_token: 认证令牌（t cookie值）
+            csrf_token: CSRF令牌
+            cookies: 登录时返回的全部cookie，之后请求上游时一并携带
+            session_id: 会话ID，为None时生成新的ID
+
+        Returns:
+            str: 会话ID
+        """
+        session_id = session_id or str(uuid.uuid4())
+
+        # 保存到数据库
+        await db.run(db.save_user_session, {
             'session_id': session_id,
-            'auth_token': auth_token,
+            'token': auth_token,
             'csrf_token': csrf_token,
+            'cookies': cookies or {},
             'is_active': True
-        }
-        
-        # 保存到数据库
-        db.save_user_session({
+        })
+
+        await session_registry.register({
             'session_id': session_id,
-            'token': auth_token,
+            'auth_token': auth_token,
             'csrf_token': csrf_token,
+            'cookies': session_cookies(cookies),
             'is_active': True
         })
-        
+
         app_logger.info(f"设置认证会话成功: {session_id}")
         return session_id
 
@@ -109,46 +118,153 @@ class DidaAPIService:
         if not self.current_session:
             raise ValueError("未设置认证会话，请先登录")
         
+        # 先带上该会话登录时返回的其他cookie，认证相关的两个值以会话字段为准
         cookies = {
+            **(self.current_session.get('cookies') or {}),
             't': self.current_session['auth_token'],
             '_csrf_token': self.current_session['csrf_token']
         }
         
         return cookies
 
-    async def get_all_tasks(self) -> dict:
+    async def get_all_tasks(self, full_sync: bool = False) -> dict:
         """
         获取所有任务
 
+        启用任务镜像时，只向 /batch/check/{checkpoint} 请求自上次同步以来的增量，
+        应用到本地SQLite镜像后再从镜像组装完整响应
+
+        Args:
+            full_sync: 是否强制从checkpoint 0全量同步
+
+        Returns:
+            dict: 与 /batch/check/0 结构一致的响应数据
+        """
+        if not self.current_session:
+            return {"error": "no_auth_session", "message": "未设置认证会话，请先登录"}
+
+        if not self.task_mirror_config.get('enabled', True):
+            return await self._fetch_batch_check(0)
+
+        account_key = make_session_key(self.current_session['auth_token'])
+        lock = self._mirror_locks.get(account_key)
+        if lock is None:
+            lock = self._mirror_locks[account_key] = asyncio.Lock()
+
+        async with lock:
+            return await self._sync_task_mirror(account_key, full_sync)
+
+    async def _sync_task_mirror(self, account_key: str, full_sync: bool) -> dict:
+        """同步任务镜像并返回镜像中的完整数据"""
+        state = await db.run(db.get_task_mirror_state, account_key)
+
+        if state and not full_sync:
+            # 定期全量同步，用于清理增量中无法体现的清单删除等变化
+            full_sync_interval = self.task_mirror_config.get('full_sync_interval_hours', 24) * 3600
+            last_full_sync = state.get('last_full_sync_at')
+            if last_full_sync:
+                elapsed = (datetime.now() - datetime.fromisoformat(str(last_full_sync))).total_seconds()
+                full_sync = elapsed >= full_sync_interval
+            else:
+                full_sync = True
+        else:
+            full_sync = True
+
+        checkpoint = 0 if full_sync else state['checkpoint']
+        response_data = await self._fetch_batch_check(checkpoint)
+        if 'error' in response_data:
+            return response_data
+
+        sync_bean = response_data.get('syncTaskBean') or {}
+        updates = (sync_bean.get('update') or []) + (sync_bean.get('add') or [])
+        deleted_ids = [item.get('taskId') for item in (sync_bean.get('delete') or []) if item.get('taskId')]
+        new_checkpoint = response_data.get('checkPoint', checkpoint)
+
+        snapshot = self._merge_mirror_snapshot(
+            {} if full_sync else state['snapshot'],
+            response_data
+        )
+
+        applied = await db.run(
+            db.apply_task_mirror_changes,
+            account_key, new_checkpoint, updates, deleted_ids, snapshot, full_sync=full_sync
+        )
+        if not applied:
+            # 镜像写入失败时直接返回上游数据，保证接口可用（增量结果不完整，不能直接返回）
+            return response_data if full_sync else await self._fetch_batch_check(0)
+
+        tasks = await db.run(db.get_mirrored_tasks, account_key)
+        app_logger.info(
+            f"任务镜像同步完成，checkpoint: {checkpoint} -> {new_checkpoint}，"
+            f"增量 {len(updates)} 条，删除 {len(deleted_ids)} 条，镜像共 {len(tasks)} 条"
+        )
+
+        return {
+            **snapshot,
+            'checkPoint': new_checkpoint,
+            'syncTaskBean': {
+                'update': tasks,
+                'tagUpdate': [],
+                'delete': [],
+                'add': [],
+                'empty': len(tasks) == 0
+            }
+        }
+
+    def _merge_mirror_snapshot(self, snapshot: Dict[str, Any], response_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        合并非任务部分（projectProfiles、tags等）
+
+        带id的列表按id合并，其他非空值直接覆盖；全量同步时传入空快照即为整体替换
+        """
+        merged = dict(snapshot)
+        for key, value in response_data.items():
+            if key in ('syncTaskBean', 'checkPoint') or value is None:
+                continue
+
+            existing = merged.get(key)
+            if isinstance(value, list) and isinstance(existing, list) \
+                    and all(isinstance(item, dict) and 'id' in item for item in value + existing):
+                items = {item['id']: item for item in existing}
+                items.update({item['id']: item for item in value})
+                merged[key] = list(items.values())
+            elif value != [] or key not in merged:
+                merged[key] = value
+
+        return merged
+
+    async def _fetch_batch_check(self, checkpoint: int = 0) -> dict:
+        """
+        请求 /batch/check/{checkpoint}
+
+        Args:
+            checkpoint: 上次同步返回的checkPoint，0表示全量
+
         Returns:
             dict: 原始响应数据
         """
         try:
-            if not self.current_session:
-                return {"error": "no_auth_session", "message": "未设置认证会话，请先登录"}
-
             # 使用统一的URL构建函数
-            url = urls.build_dida_api_url(urls.DIDA_TASK_APIS["get_all_tasks"])
+            url = urls.build_dida_api_url(f"{urls.DIDA_TASK_APIS['get_all_tasks']}/{checkpoint}")
 
             # 获取认证头和cookies
             headers = self._get_auth_headers()
             cookies = self._get_auth_cookies()
 
             app_logger.info(f"请求获取所有任务: {url}")
-            app_logger.debug(f"请求头: {headers}")
 
             # 发送请求
             response = await self.client.get(url, headers=headers, cookies=cookies)
 
             # 记录响应信息
             app_logger.info(f"任务响应状态码: {response.status_code}")
-            app_logger.debug(f"任务响应头: {dict(response.headers)}")
 
             if response.status_code == 200:
                 # 解析响应数据
                 response_data = response.json()
-                app_logger.info(f"成功获取任务数据，响应长度: {len(str(response_data))}")
-                app_logger.debug(f"任务响应数据: {response_data}")
+                sync_bean = response_data.get('syncTaskBean') if isinstance(response_data, dict) else None
+                update = (sync_bean or {}).get('update') or []
+                app_logger.info(f"成功获取任务数据，任务数量: {len(update)}")
 
                 # 直接返回原始响应
                 return response_data
@@ -161,7 +277,13 @@ class DidaAPIService:
             app_logger.error(f"获取任务时发生错误: {e}")
             return {"error": str(e)}
 
-    async def get_completed_tasks(self, to: Optional[str] = None, status: str = "Completed") -> dict:
+    @staticmethod
+    def _format_closed_time(value: str) -> str:
+        """将completedTime格式（2025-03-15T13:30:54.000+0000）转换为接口需要的格式（2025-03-15 13:30:54）"""
+        return value.replace('T', ' ').replace('.000+0000', '')
+
+    async def get_completed_tasks(self, to: Optional[str] = None, status: str = "Completed",
+                                  from_time: Optional[str] = None) -> dict:
         """
         获取已完成或已放弃的任务（支持分页）
 
@@ -174,6 +296,7 @@ class DidaAPIService:
             status: 任务状态，支持以下值：
                    - "Completed": 已完成的任务
                    - "Abandoned": 已放弃的任务
+            from_time: 时间范围下限，格式与to相同，为None时不限制
 
         Returns:
             dict: 原始响应数据，包含任务列表
@@ -195,7 +318,7 @@ class DidaAPIService:
 
             # 构建查询参数
             params = {
-                "from": "",  # 固定为空
+                "from": self._format_closed_time(from_time) if from_time else "",
                 "status": status  # 支持Completed或Abandoned
             }
 
@@ -203,8 +326,7 @@ class DidaAPIService:
             if to:
                 # 将completedTime格式转换为滴答清单API需要的格式
                 # 从 2025-03-15T13:30:54.000+0000 转换为 2025-03-15 13:30:54
-                formatted_to = to.replace('T', ' ').replace('.000+0000', '')
-                params["to"] = formatted_to
+                params["to"] = self._format_closed_time(to)
             # 第一次请求不添加to参数
 
             # 获取认证头和cookies
@@ -213,21 +335,18 @@ class DidaAPIService:
 
             app_logger.info(f"请求获取已完成任务: {base_url}")
             app_logger.info(f"查询参数: {params}")
-            app_logger.debug(f"请求头: {headers}")
 
             # 发送请求
             response = await self.client.get(base_url, headers=headers, cookies=cookies, params=params)
 
             # 记录响应信息
             app_logger.info(f"已完成任务响应状态码: {response.status_code}")
-            app_logger.debug(f"已完成任务响应头: {dict(response.headers)}")
 
             if response.status_code == 200:
                 # 解析响应数据
                 response_data = response.json()
                 task_count = len(response_data) if isinstance(response_data, list) else 0
                 app_logger.info(f"成功获取已完成任务数据，任务数量: {task_count}")
-                app_logger.debug(f"已完成任务响应数据: {response_data}")
 
                 # 直接返回原始响应
                 return response_data
@@ -240,13 +359,14 @@ class DidaAPIService:
             app_logger.error(f"获取已完成任务时发生错误: {e}")
             return {"error": str(e)}
 
-    async def get_trash_tasks(self, limit: int = 50, task_type: int = 1) -> dict:
+    async def get_trash_tasks(self, limit: int = 50, task_type: int = 1, next_cursor: Optional[int] = None) -> dict:
         """
         获取垃圾桶中的任务
 
         Args:
             limit: 每页任务数量，默认50
             task_type: 任务类型，默认1
+            next_cursor: 分页游标，使用上一页响应中的next字段，为None时获取第一页
 
         Returns:
             dict: 原始响应数据，包含垃圾桶任务列表
@@ -270,6 +390,8 @@ class DidaAPIService:
                 "limit": limit,
                 "type": task_type
             }
+            if next_cursor:
+                params["next"] = next_cursor
 
             # 获取认证头和cookies
             headers = self._get_auth_headers()
@@ -277,21 +399,18 @@ class DidaAPIService:
 
             app_logger.info(f"请求获取垃圾桶任务: {base_url}")
             app_logger.info(f"查询参数: {params}")
-            app_logger.debug(f"请求头: {headers}")
 
             # 发送请求
             response = await self.client.get(base_url, headers=headers, cookies=cookies, params=params)
 
             # 记录响应信息
             app_logger.info(f"垃圾桶任务响应状态码: {response.status_code}")
-            app_logger.debug(f"垃圾桶任务响应头: {dict(response.headers)}")
 
             if response.status_code == 200:
                 # 解析响应数据
                 response_data = response.json()
                 task_count = len(response_data.get('tasks', [])) if isinstance(response_data, dict) else 0
                 app_logger.info(f"成功获取垃圾桶任务数据，任务数量: {task_count}")
-                app_logger.debug(f"垃圾桶任务响应数据: {response_data}")
 
                 # 直接返回原始响应
                 return response_data
@@ -304,9 +423,47 @@ class DidaAPIService:
             app_logger.error(f"获取垃圾桶任务时发生错误: {e}")
             return {"error": str(e)}
 
-    async def close(self):
-        """关闭HTTP客户端"""
-        await self.client.aclose()
+    async def iter_trash_pages(self, page_size: Optional[int] = None,
+                               task_type: int = 1) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        逐页获取垃圾桶中的全部任务
+
+        沿响应中的next游标一直翻页，直到next为0、返回空页或游标不再变化，
+        每次只产生一页任务，调用方可以边获取边处理
+
+        Args:
+            page_size: 每页任务数量，默认取 [trash] page_size
+            task_type: 任务类型，默认1
+
+        Yields:
+            list: 一页任务
+
+        Raises:
+            RuntimeError: 某一页获取失败
+        """
+        trash_config = config.get('trash', {})
+        page_size = page_size or trash_config.get('page_size', 50)
+        max_pages = trash_config.get('max_pages', 1000)
+
+        next_cursor = None
+        seen_cursors = set()
+
+        for page in range(1, max_pages + 1):
+            result = await self.get_trash_tasks(page_size, task_type, next_cursor)
+            if not isinstance(result, dict) or 'error' in result:
+                raise RuntimeError(f"获取垃圾桶任务第 {page} 页失败: {result}")
+
+            tasks = result.get('tasks') or []
+            if tasks:
+                yield tasks
+
+            next_cursor = result.get('next')
+            if not tasks or not next_cursor or next_cursor in seen_cursors:
+                app_logger.info(f"垃圾桶任务翻页完成，共 {page} 页")
+                return
+            seen_cursors.add(next_cursor)
+
+        app_logger.warning(f"垃圾桶任务翻页达到上限 {max_pages} 页，停止获取")
 
 
 # 全局滴答清单API服务实例
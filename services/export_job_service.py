@@ -0,0 +1,304 @@
+"""异步导出任务服务
+
+提交导出后立即返回任务ID，数据获取和渲染在后台执行；
+生成的文件保存在 output/exports 下，在TTL内相同会话的相同导出直接复用
+
+任务记录同时写入共享状态（core.shared_state），多worker部署时任何worker都能查询任务进度和下载文件；
+产物目录需要在各worker之间共享（sqlite 后端的同一台机器上即满足）
+"""
+import asyncio
+import os
+import shutil
+import time
+import uuid
+from typing import Dict, Any, Optional
+
+from core import config
+from core.cache import make_session_key
+from core.shared_state import shared_state
+from services.dida_service import dida_service
+from services.export_service import export_service
+from utils import app_logger
+
+
+class ExportJobService:
+    """异步导出任务服务类"""
+
+    KINDS = ('tasks', 'focus')
+
+    def __init__(self):
+        self.job_config = config.get('export_jobs', {})
+        self.artifact_dir = self.job_config.get('artifact_dir', './output/exports')
+        self.artifact_ttl = self.job_config.get('artifact_ttl_minutes', 30) * 60
+        self.max_jobs = self.job_config.get('max_jobs', 100)
+        self.publish_interval = self.job_config.get('progress_publish_interval', 1.0)
+        self.cleanup_interval = self.job_config.get('cleanup_interval_minutes', 5) * 60
+
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _job_key(job_id: str) -> str:
+        return shared_state.key('export_job', job_id)
+
+    @staticmethod
+    def _index_key(session_key: str, kind: str) -> str:
+        return shared_state.key('export_job_index', session_key, kind)
+
+    async def _publish(self, job: Dict[str, Any]) -> None:
+        """
+        把任务记录写入共享状态
+
+        记录在任务结束后保留 artifact_ttl；执行中的任务每隔 publish_interval 秒刷新一次，
+        所在worker退出后记录在 artifact_ttl 后过期
+        """
+        record = {**job, "progress": dict(job['progress'])}
+        await shared_state.set(self._job_key(job['job_id']), record, self.artifact_ttl)
+        await shared_state.set(self._index_key(job['session_key'], job['kind']), job['job_id'], self.artifact_ttl)
+
+    async def _publish_progress(self, job: Dict[str, Any]) -> None:
+        """执行期间定期发布进度，其他worker查询时看到的进度最多落后 publish_interval 秒"""
+        while True:
+            await asyncio.sleep(self.publish_interval)
+            await self._publish(job)
+
+    async def _load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """读取任务记录：本worker执行的任务直接读内存，否则读共享状态"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        return await shared_state.get(self._job_key(job_id))
+
+    async def submit(self, kind: str) -> Dict[str, Any]:
+        """
+        提交导出任务
+
+        Args:
+            kind: 导出类型，tasks（任务）或 focus（专注记录）
+
+        Returns:
+            dict: 任务状态；相同会话已有进行中或未过期的同类任务时直接返回该任务
+        """
+        if kind not in self.KINDS:
+            return {"error": f"不支持的导出类型: {kind}"}
+
+        session = dida_service.current_session
+        if not session:
+            return {"error": "未设置认证会话，请先完成登录"}
+
+        self.cleanup_expired()
+        session_key = make_session_key(session['auth_token'])
+
+        existing = await self._find_reusable(session_key, kind)
+        if existing is not None:
+            app_logger.info(f"复用导出任务 {existing['job_id']}（{kind}，状态: {existing['status']}）")
+            return {**self._public(existing), "reused": True}
+
+        if len(self._jobs) >= self.max_jobs:
+            return {"error": "导出任务过多，请稍后重试", "busy": True}
+
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "kind": kind,
+            "session_key": session_key,
+            "status": "pending",
+            "progress": {"pages_fetched": 0, "rows_written": 0},
+            "created_at": time.time(),
+            "finished_at": None,
+            "filename": None,
+            "content_type": None,
+            "path": None,
+            "size": None,
+            "error": None
+        }
+        self._jobs[job_id] = job
+        await self._publish(job)
+        self._tasks[job_id] = asyncio.create_task(self._run(job))
+        app_logger.info(f"已提交导出任务 {job_id}（{kind}）")
+        return {**self._public(job), "reused": False}
+
+    async def _owned_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        获取属于当前会话的任务
+
+        任务只对提交它的会话可见；其他会话（或未登录）查询时与任务不存在一样返回None，
+        不泄露任务是否存在
+        """
+        self.cleanup_expired()
+        job = await self._load(job_id)
+        session = dida_service.current_session
+        if job is None or not session or job['session_key'] != make_session_key(session['auth_token']):
+            return None
+        return job
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """获取当前会话的任务状态（不含服务器文件路径）"""
+        job = await self._owned_job(job_id)
+        return self._public(job) if job else None
+
+    async def get_artifact(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """获取当前会话已完成任务的文件信息，未完成或文件已清理时返回None"""
+        job = await self._owned_job(job_id)
+        if not job or job['status'] != 'completed' or not job['path'] or not os.path.exists(job['path']):
+            return None
+        return job
+
+    async def _find_reusable(self, session_key: str, kind: str) -> Optional[Dict[str, Any]]:
+        """查找同一会话可复用的同类任务（包括其他worker执行的任务）"""
+        candidates = [job for job in self._jobs.values()
+                      if job['session_key'] == session_key and job['kind'] == kind]
+        if not candidates:
+            job_id = await shared_state.get(self._index_key(session_key, kind))
+            job = await shared_state.get(self._job_key(job_id)) if job_id else None
+            candidates = [job] if job else []
+        for job in candidates:
+            if job['status'] in ('pending', 'running'):
+                return job
+            if job['status'] == 'completed' and job['path'] and os.path.exists(job['path']):
+                return job
+        return None
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        """在后台执行导出，并把结果文件移动到产物目录"""
+        job['status'] = 'running'
+        await self._publish(job)
+        publisher = asyncio.create_task(self._publish_progress(job))
+        try:
+            if job['kind'] == 'tasks':
+                result = await export_service.export_tasks_to_excel(streaming=True, progress=job['progress'])
+            else:
+                result = await export_service.export_focus_records_to_excel(streaming=True, progress=job['progress'])
+
+            if 'error' in result:
+                job['status'] = 'failed'
+                job['error'] = result['error']
+                app_logger.error(f"导出任务 {job['job_id']} 失败: {result['error']}")
+                return
+
+            path = os.path.join(self.artifact_dir, f"{job['job_id']}.xlsx")
+            # 临时目录与产物目录可能不在同一文件系统，move 会退化为复制，放到线程中执行
+            await asyncio.to_thread(self._move_artifact, result['path'], path)
+
+            job.update({
+                "status": "completed",
+                "filename": result['filename'],
+                "content_type": result['content_type'],
+                "path": path,
+                "size": result['size']
+            })
+            app_logger.info(f"导出任务 {job['job_id']} 完成，文件大小: {result['size']} 字节")
+
+        except asyncio.CancelledError:
+            job['status'] = 'failed'
+            job['error'] = "导出任务已取消"
+            raise
+        except Exception as e:
+            job['status'] = 'failed'
+            job['error'] = str(e)
+            app_logger.error(f"导出任务 {job['job_id']} 发生错误: {e}")
+        finally:
+            publisher.cancel()
+            job['finished_at'] = time.time()
+            self._tasks.pop(job['job_id'], None)
+            await self._publish(job)
+
+    def cleanup_expired(self) -> int:
+        """删除超过TTL的已结束任务及其文件，返回清理数量"""
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job['finished_at'] is not None and now - job['finished_at'] > self.artifact_ttl
+        ]
+        for job_id in expired:
+            job = self._jobs.pop(job_id)
+            self._remove_file(job.get('path'))
+
+        if expired:
+            app_logger.info(f"已清理 {len(expired)} 个过期导出任务")
+        return len(expired)
+
+    async def cleanup_orphans(self) -> None:
+        """
+        删除产物目录中不属于任何任务的文件（如服务重启前遗留的文件）
+
+        多worker共享产物目录时，其他worker的任务记录仍在共享状态中，对应的文件保留；
+        只删除任务记录不存在或已过期的文件
+        """
+        if not os.path.isdir(self.artifact_dir):
+            return
+        removed = 0
+        for name in os.listdir(self.artifact_dir):
+            job_id, _ = os.path.splitext(name)
+            if job_id in self._jobs or await shared_state.get(self._job_key(job_id)) is not None:
+                continue
+            self._remove_file(os.path.join(self.artifact_dir, name))
+            removed += 1
+        if removed:
+            app_logger.info(f"已清理 {removed} 个遗留导出文件")
+
+    async def _sweep(self) -> None:
+        """定期清理过期任务，没有新的导出请求时文件也按TTL删除"""
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            try:
+                self.cleanup_expired()
+            except Exception as e:
+                app_logger.error(f"清理过期导出任务失败: {e}")
+
+    def start(self) -> None:
+        """启动定期清理（需在事件循环中调用）"""
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def shutdown(self) -> None:
+        """停止定期清理并取消仍在执行的导出任务"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _move_artifact(self, source: str, path: str) -> None:
+        os.makedirs(self.artifact_dir, exist_ok=True)
+        shutil.move(source, path)
+
+    @staticmethod
+    def _remove_file(path: Optional[str]) -> None:
+        if not path or not os.path.exists(path):
+            return
+        try:
+            os.remove(path)
+        except OSError as e:
+            app_logger.warning(f"删除导出文件失败: {e}")
+
+    def _public(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """构建对外返回的任务状态"""
+        expires_at = job['finished_at'] + self.artifact_ttl if job['finished_at'] else None
+        # 失败原因使用 failure_reason 字段，避免与服务层的 'error' 约定混淆
+        return {
+            "job_id": job['job_id'],
+            "kind": job['kind'],
+            "status": job['status'],
+            "progress": dict(job['progress']),
+            "created_at": job['created_at'],
+            "finished_at": job['finished_at'],
+            "expires_at": expires_at,
+            "filename": job['filename'],
+            "size": job['size'],
+            "failure_reason": job['error'],
+            "download_url": f"/custom/export/jobs/{job['job_id']}/download" if job['status'] == 'completed' else None
+        }
+
+
+# 创建全局实例
+export_job_service = ExportJobService()
@@ -0,0 +1,524 @@
+"""Excel渲染模块
+
+把已获取的任务/专注记录数据渲染为Excel工作簿。
+这里的函数只依赖传入的数据，不访问网络和会话，
+因此可以在进程池或线程池中执行，避免阻塞事件循环
+
+pandas 和 openpyxl 在首次渲染时才导入，不计入服务启动时间
+"""
+import io
+import os
+import tempfile
+from typing import TYPE_CHECKING, Dict, List, Any, Optional, Iterable, Tuple
+from utils import app_logger
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class ExcelRenderer:
+    """Excel渲染类"""
+
+    def render_tasks(self, datasets: Dict[str, Any], streaming: bool = False) -> Dict[str, Any]:
+        """
+        渲染任务工作簿
+
+        Args:
+            datasets: 包含 all_tasks、completed_tasks、abandoned_tasks、trash_tasks 的原始数据
+            streaming: 是否使用只写工作簿逐行写入临时文件
+
+        Returns:
+            dict: content（或流式模式下的path）、size以及每个工作表的行数rows
+        """
+        all_tasks_data = datasets.get('all_tasks')
+        completed_tasks_data = datasets.get('completed_tasks')
+        abandoned_tasks_data = datasets.get('abandoned_tasks')
+        trash_tasks_data = datasets.get('trash_tasks')
+
+        if streaming:
+            return self._write_streaming_workbook([
+                ('全部任务', self._iter_all_tasks_rows(all_tasks_data)),
+                ('已完成任务', self._iter_task_rows(completed_tasks_data or [])),
+                ('放弃任务', self._iter_task_rows(abandoned_tasks_data or [])),
+                ('垃圾桶任务', self._iter_task_rows((trash_tasks_data or {}).get('tasks', []))),
+            ])
+
+        import pandas as pd
+
+        rows: Dict[str, int] = {}
+        excel_buffer = io.BytesIO()
+
+        with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
+            # 处理全部任务
+            if all_tasks_data:
+                all_tasks_df = self._process_all_tasks(all_tasks_data)
+                if not all_tasks_df.empty:
+                    all_tasks_df.to_excel(writer, sheet_name='全部任务', index=False)
+                    rows['全部任务'] = len(all_tasks_df)
+                    app_logger.info(f"全部任务工作表创建完成，共 {len(all_tasks_df)} 条记录")
+
+            # 处理已完成任务
+            if completed_tasks_data:
+                completed_tasks_df = self._process_completed_tasks(completed_tasks_data)
+                if not completed_tasks_df.empty:
+                    completed_tasks_df.to_excel(writer, sheet_name='已完成任务', index=False)
+                    rows['已完成任务'] = len(completed_tasks_df)
+                    app_logger.info(f"已完成任务工作表创建完成，共 {len(completed_tasks_df)} 条记录")
+
+            # 处理放弃任务
+            if abandoned_tasks_data:
+                abandoned_tasks_df = self._process_abandoned_tasks(abandoned_tasks_data)
+                if not abandoned_tasks_df.empty:
+                    abandoned_tasks_df.to_excel(writer, sheet_name='放弃任务', index=False)
+                    rows['放弃任务'] = len(abandoned_tasks_df)
+                    app_logger.info(f"放弃任务工作表创建完成，共 {len(abandoned_tasks_df)} 条记录")
+
+            # 处理垃圾桶任务
+            if trash_tasks_data:
+                trash_tasks_df = self._process_trash_tasks(trash_tasks_data)
+                if not trash_tasks_df.empty:
+                    trash_tasks_df.to_excel(writer, sheet_name='垃圾桶任务', index=False)
+                    rows['垃圾桶任务'] = len(trash_tasks_df)
+                    app_logger.info(f"垃圾桶任务工作表创建完成，共 {len(trash_tasks_df)} 条记录")
+
+        content = excel_buffer.getvalue()
+        return {"content": content, "size": len(content), "rows": rows}
+
+    def render_focus(self, records: List[Dict], streaming: bool = False) -> Dict[str, Any]:
+        """
+        渲染专注记录工作簿
+
+        Args:
+            records: 专注记录时间线原始数据
+            streaming: 是否使用只写工作簿逐行写入临时文件
+
+        Returns:
+            dict: content（或流式模式下的path）、size以及每个工作表的行数rows
+        """
+        if streaming:
+            return self._write_streaming_workbook([('专注记录时间线', self._iter_focus_rows(records))])
+
+        import pandas as pd
+
+        rows: Dict[str, int] = {}
+        excel_buffer = io.BytesIO()
+
+        with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
+            # 处理专注记录时间线
+            focus_timeline_df = self._process_focus_timeline(records)
+            if not focus_timeline_df.empty:
+                focus_timeline_df.to_excel(writer, sheet_name='专注记录时间线', index=False)
+                rows['专注记录时间线'] = len(focus_timeline_df)
+                app_logger.info(f"专注记录时间线工作表创建完成，共 {len(focus_timeline_df)} 条记录")
+
+        content = excel_buffer.getvalue()
+        return {"content": content, "size": len(content), "rows": rows}
+
+    def _write_streaming_workbook(self, sheets: List[Tuple[str, Iterable[Dict]]]) -> Dict[str, Any]:
+        """
+        逐行写入只写（write-only）工作簿
+
+        每个工作表的行由生成器按需产生，openpyxl只写模式会把行直接写入磁盘，
+        内存占用与记录数量无关
+
+        Args:
+            sheets: (工作表名称, 行字典生成器) 列表
+
+        Returns:
+            dict: 临时文件路径path、大小size和行数rows，调用方负责在发送完成后删除文件
+        """
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        rows: Dict[str, int] = {}
+
+        for sheet_name, sheet_rows in sheets:
+            worksheet = None
+            headers: List[str] = []
+            row_count = 0
+
+            for row in sheet_rows:
+                if not row:
+                    continue
+                if worksheet is None:
+                    headers = list(row.keys())
+                    worksheet = workbook.create_sheet(title=sheet_name)
+                    worksheet.append(headers)
+                worksheet.append([row.get(header, '') for header in headers])
+                row_count += 1
+
+            if worksheet is not None:
+                rows[sheet_name] = row_count
+                app_logger.info(f"{sheet_name}工作表写入完成，共 {row_count} 条记录")
+
+        # 工作簿至少需要一个工作表
+        if not workbook.worksheets:
+            workbook.create_sheet(title='无数据')
+
+        fd, path = tempfile.mkstemp(prefix='dida_export_', suffix='.xlsx')
+        os.close(fd)
+        workbook.save(path)
+
+        return {"path": path, "size": os.path.getsize(path), "rows": rows}
+
+    def _iter_all_tasks_rows(self, data: Optional[Dict]) -> Iterable[Dict]:
+        """逐行产生全部任务数据"""
+        if not data:
+            return
+        projects = {p['id']: p['name'] for p in data.get('projectProfiles', [])}
+        for task in data.get('syncTaskBean', {}).get('update', []):
+            yield self._flatten_task(task, projects)
+
+    def _iter_task_rows(self, tasks: List[Dict]) -> Iterable[Dict]:
+        """逐行产生已完成/放弃/垃圾桶任务数据"""
+        for task in tasks:
+            yield self._flatten_task(task, {})
+
+    def _iter_focus_rows(self, records: List[Dict]) -> Iterable[Dict]:
+        """逐行产生紧凑型专注记录"""
+        for record in records:
+            yield self._create_compact_focus_record(record)
+
+    def _process_all_tasks(self, data: Dict) -> 'pd.DataFrame':
+        """处理全部任务数据"""
+        import pandas as pd
+
+        try:
+            tasks = data.get('syncTaskBean', {}).get('update', [])
+            projects = {p['id']: p['name'] for p in data.get('projectProfiles', [])}
+            
+            processed_tasks = []
+            for task in tasks:
+                processed_task = self._flatten_task(task, projects)
+                processed_tasks.append(processed_task)
+            
+            return pd.DataFrame(processed_tasks)
+            
+        except Exception as e:
+            app_logger.error(f"处理全部任务数据失败: {e}")
+            return pd.DataFrame()
+    
+    def _process_completed_tasks(self, data: List) -> 'pd.DataFrame':
+        """处理已完成任务数据"""
+        import pandas as pd
+
+        try:
+            processed_tasks = []
+            for task in data:
+                processed_task = self._flatten_task(task, {})
+                processed_tasks.append(processed_task)
+
+            return pd.DataFrame(processed_tasks)
+
+        except Exception as e:
+            app_logger.error(f"处理已完成任务数据失败: {e}")
+            return pd.DataFrame()
+
+    def _process_abandoned_tasks(self, data: List) -> 'pd.DataFrame':
+        """处理放弃任务数据"""
+        import pandas as pd
+
+        try:
+            processed_tasks = []
+            for task in data:
+                processed_task = self._flatten_task(task, {})
+                processed_tasks.append(processed_task)
+
+            return pd.DataFrame(processed_tasks)
+
+        except Exception as e:
+            app_logger.error(f"处理放弃任务数据失败: {e}")
+            return pd.DataFrame()
+
+    def _process_trash_tasks(self, data: Dict) -> 'pd.DataFrame':
+        """处理垃圾桶任务数据"""
+        import pandas as pd
+
+        try:
+            tasks = data.get('tasks', [])
+
+            processed_tasks = []
+            for task in tasks:
+                processed_task = self._flatten_task(task, {})
+                processed_tasks.append(processed_task)
+
+            return pd.DataFrame(processed_tasks)
+
+        except Exception as e:
+            app_logger.error(f"处理垃圾桶任务数据失败: {e}")
+            return pd.DataFrame()
+
+    def _process_focus_timeline(self, data: List) -> 'pd.DataFrame':
+        """处理专注记录时间线数据 - 紧凑型展示"""
+        import pandas as pd
+
+        try:
+            processed_records = []
+            for record in data:
+                # 为每个专注会话创建一条紧凑记录
+                compact_record = self._create_compact_focus_record(record)
+                processed_records.append(compact_record)
+
+            return pd.DataFrame(processed_records)
+
+        except Exception as e:
+            app_logger.error(f"处理专注记录时间线数据失败: {e}")
+            return pd.DataFrame()
+    
+    def _flatten_task(self, task: Dict, projects: Dict) -> Dict:
+        """展平任务数据，包含所有字段"""
+        try:
+            flattened = {
+                # 基本信息
+                '任务ID': task.get('id', ''),
+                '任务标题': task.get('title', ''),
+                '任务内容': task.get('content', ''),
+                '任务描述': task.get('desc', ''),
+                '项目ID': task.get('projectId', ''),
+                '项目名称': projects.get(task.get('projectId', ''), ''),
+                '排序顺序': task.get('sortOrder', 0),
+                
+                # 状态和优先级
+                '任务状态': self._get_status_text(task.get('status', 0)),
+                '状态代码': task.get('status', 0),
+                '优先级': task.get('priority', 0),
+                '完成进度': task.get('progress', 0),
+                '删除状态': task.get('deleted', 0),
+                
+                # 时间相关
+                '创建时间': task.get('createdTime', ''),
+                '修改时间': task.get('modifiedTime', ''),
+                '开始日期': task.get('startDate', ''),
+                '截止日期': task.get('dueDate', ''),
+                '置顶时间': task.get('pinnedTime', ''),
+                '完成时间': task.get('completedTime', ''),
+                '删除时间': task.get('deletedTime', ''),
+                
+                # 时区和时间设置
+                '时区': task.get('timeZone', ''),
+                '是否浮动时间': task.get('isFloating', False),
+                '是否全天任务': task.get('isAllDay', False),
+                
+                # 重复设置
+                '重复任务ID': task.get('repeatTaskId', ''),
+                '重复标志': task.get('repeatFlag', ''),
+                '重复来源': task.get('repeatFrom', ''),
+                '首次重复日期': task.get('repeatFirstDate', ''),
+                
+                # 提醒设置
+                '提醒设置': task.get('reminder', ''),
+                '提醒列表': str(task.get('reminders', [])),
+                '排除日期': str(task.get('exDate', [])),
+                
+                # 层级关系
+                '父任务ID': task.get('parentId', ''),
+                '子任务ID列表': str(task.get('childIds', [])),
+                
+                # 其他属性
+                '标签列表': str(task.get('tags', [])),
+                '子项目': str(task.get('items', [])),
+                '附件数量': len(task.get('attachments', [])),
+                '评论数量': task.get('commentCount', 0),
+                '列ID': task.get('columnId', ''),
+                '类型': task.get('kind', ''),
+                '图片模式': task.get('imgMode', 0),
+                
+                # 创建者和删除者
+                '创建者ID': task.get('creator', 0),
+                '删除者ID': task.get('deletedBy', 0),
+                
+                # 版本控制
+                '实体标签': task.get('etag', ''),
+                
+                # 专注相关
+                '番茄钟摘要': str(task.get('pomodoroSummaries', [])),
+                '专注摘要': str(task.get('focusSummaries', [])),
+                
+                # 附件详情
+                '附件详情': str(task.get('attachments', [])),
+            }
+            
+            return flattened
+            
+        except Exception as e:
+            app_logger.error(f"展平任务数据失败: {e}")
+            return {}
+    
+    def _get_status_text(self, status_code: int) -> str:
+        """获取状态文本描述"""
+        status_map = {
+            0: '未完成',
+            1: '进行中',
+            2: '已完成',
+            -1: '已删除'
+        }
+        return status_map.get(status_code, f'未知状态({status_code})')
+
+    def _create_compact_focus_record(self, record: Dict) -> Dict:
+        """创建紧凑型专注记录"""
+        try:
+            from datetime import datetime, timedelta
+
+            # 基本信息
+            session_id = record.get('id', '')
+            session_start = record.get('startTime', '')
+            session_end = record.get('endTime', '')
+            pause_duration = record.get('pauseDuration', 0)
+
+            # 计算总时长
+            total_duration = 0
+            if session_start and session_end:
+                try:
+                    start_time = datetime.fromisoformat(session_start.replace('Z', '+00:00'))
+                    end_time = datetime.fromisoformat(session_end.replace('Z', '+00:00'))
+                    total_duration = int((end_time - start_time).total_seconds())
+                except:
+                    total_duration = 0
+
+            # 获取任务信息
+            tasks = record.get('tasks', [])
+            task_titles = []
+            project_names = []
+
+            for task in tasks:
+                if task.get('title'):
+                    task_titles.append(task['title'])
+                if task.get('projectName'):
+                    project_names.append(task['projectName'])
+
+            main_task = '; '.join(set(task_titles))  # 去重
+            main_project = '; '.join(set(project_names))  # 去重
+
+            # 生成专注时间段描述
+            focus_timeline = self._generate_focus_timeline(tasks, pause_duration)
+
+            # 生成暂停模式描述
+            pause_pattern = self._generate_pause_pattern(tasks, pause_duration)
+
+            # 格式化会话时间
+            session_time_str = ""
+            if session_start and session_end:
+                try:
+                    start_dt = datetime.fromisoformat(session_start.replace('Z', '+00:00'))
+                    end_dt = datetime.fromisoformat(session_end.replace('Z', '+00:00'))
+                    session_time_str = f"{start_dt.strftime('%Y-%m-%d %H:%M')} - {end_dt.strftime('%H:%M')}"
+                except:
+                    session_time_str = f"{session_start} - {session_end}"
+
+            return {
+                '会话ID': session_id,
+                '会话时间': session_time_str,
+                '总时长': self._format_duration(total_duration),
+                '暂停时长': self._format_duration(pause_duration),
+                '任务标题': main_task,
+                '项目': main_project,
+                '专注时间段': focus_timeline,
+                '暂停模式': pause_pattern,
+                '效率(%)': round((total_duration - pause_duration) / total_duration * 100, 1) if total_duration > 0 else 0,
+                '时间段数量': len(tasks),
+                '会话类型': record.get('type', ''),
+                '实体标签': record.get('etag', '')
+            }
+
+        except Exception as e:
+            app_logger.error(f"创建紧凑型专注记录失败: {e}")
+            return {}
+
+    def _generate_focus_timeline(self, tasks: List[Dict], total_pause_duration: int) -> str:
+        """生成专注时间段描述"""
+        try:
+            from datetime import datetime
+
+            if not tasks:
+                return "无专注时间段"
+
+            timeline_parts = []
+
+            for i, task in enumerate(tasks):
+                start_time = task.get('startTime', '')
+                end_time = task.get('endTime', '')
+
+                if start_time and end_time:
+                    try:
+                        start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
+                        end_dt = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
+                        duration = int((end_dt - start_dt).total_seconds())
+
+                        # 格式化时间段
+                        time_part = f"{start_dt.strftime('%H:%M')}-{end_dt.strftime('%H:%M')}({self._format_duration(duration)})"
+                        timeline_parts.append(time_part)
+
+                        # 如果不是最后一个时间段，计算暂停时间
+                        if i < len(tasks) - 1:
+                            next_task = tasks[i + 1]
+                            next_start = next_task.get('startTime', '')
+                            if next_start:
+                                try:
+                                    next_start_dt = datetime.fromisoformat(next_start.replace('Z', '+00:00'))
+                                    pause_duration = int((next_start_dt - end_dt).total_seconds())
+                                    if pause_duration > 0:
+                                        timeline_parts.append(f"[暂停{self._format_duration(pause_duration)}]")
+                                except:
+                                    timeline_parts.append("[暂停未知时长]")
+                    except:
+                        timeline_parts.append(f"时间段{i+1}(解析失败)")
+
+            return " → ".join(timeline_parts)
+
+        except Exception as e:
+            app_logger.error(f"生成专注时间段描述失败: {e}")
+            return "生成失败"
+
+    def _generate_pause_pattern(self, tasks: List[Dict], total_pause_duration: int) -> str:
+        """生成暂停模式描述"""
+        try:
+            if len(tasks) <= 1:
+                return "无暂停" if total_pause_duration == 0 else f"总暂停{self._format_duration(total_pause_duration)}"
+
+            pause_count = len(tasks) - 1
+            avg_pause = total_pause_duration // pause_count if pause_count > 0 else 0
+
+            if pause_count == 1:
+                return f"暂停1次({self._format_duration(total_pause_duration)})"
+            else:
+                return f"暂停{pause_count}次(总计{self._format_duration(total_pause_duration)}, 平均{self._format_duration(avg_pause)})"
+
+        except Exception as e:
+            app_logger.error(f"生成暂停模式描述失败: {e}")
+            return "分析失败"
+
+    def _format_duration(self, seconds: int) -> str:
+        """格式化时长显示"""
+        try:
+            if seconds < 60:
+                return f"{seconds}秒"
+            elif seconds < 3600:
+                minutes = seconds // 60
+                remaining_seconds = seconds % 60
+                if remaining_seconds == 0:
+                    return f"{minutes}分钟"
+                else:
+                    return f"{minutes}分{remaining_seconds}秒"
+            else:
+                hours = seconds // 3600
+                remaining_minutes = (seconds % 3600) // 60
+                if remaining_minutes == 0:
+                    return f"{hours}小时"
+                else:
+                    return f"{hours}小时{remaining_minutes}分钟"
+        except:
+            return f"{seconds}秒"
+
+
+# 渲染器实例（每个工作进程各自持有一份）
+excel_renderer = ExcelRenderer()
+
+
+def render_tasks_excel(datasets: Dict[str, Any], streaming: bool = False) -> Dict[str, Any]:
+    """渲染任务工作簿（模块级函数，可被进程池序列化调用）"""
+    return excel_renderer.render_tasks(datasets, streaming)
+
+
+def render_focus_excel(records: List[Dict], streaming: bool = False) -> Dict[str, Any]:
+    """渲染专注记录工作簿（模块级函数，可被进程池序列化调用）"""
+    return excel_renderer.render_focus(records, streaming)
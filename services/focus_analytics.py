@@ -0,0 +1,121 @@
+"""专注记录本地统计模块
+
+根据归档的专注记录（开始、结束、暂停毫秒数）用 NumPy 向量化计算：
+- 每日专注时长（热力图）
+- 每日按小时分布（clockByDay）
+- 按小时汇总分布（clock）
+
+每条记录先按整点切分成若干小时片段，再用 bincount 按天或按小时累加，
+输出格式与上游对应的统计接口一致，时长单位为分钟。
+NumPy 在首次计算时才导入，不计入服务启动时间
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Sequence, Tuple
+
+HOUR_MS = 3600 * 1000
+# 统计使用中国时间（与请求头 X-Tz: Asia/Shanghai 一致）
+TZ_OFFSET_MS = 8 * HOUR_MS
+TIMEZONE = "Asia/Shanghai"
+
+
+def range_bounds(start_date: str, end_date: str) -> Tuple[int, int, int]:
+    """
+    把 YYYYMMDD 日期范围换算为UTC毫秒边界
+
+    Returns:
+        tuple: (开始毫秒, 结束毫秒（不含）, 天数)
+    """
+    start = datetime.strptime(start_date, "%Y%m%d")
+    end = datetime.strptime(end_date, "%Y%m%d") + timedelta(days=1)
+    epoch = datetime(1970, 1, 1)
+    start_ms = int((start - epoch).total_seconds() * 1000) - TZ_OFFSET_MS
+    end_ms = int((end - epoch).total_seconds() * 1000) - TZ_OFFSET_MS
+    return start_ms, end_ms, (end - start).days
+
+
+def _hour_slices(intervals: Sequence[Tuple[int, int, int]], start_ms: int, end_ms: int):
+    """
+    把专注记录按整点切分
+
+    Returns:
+        tuple: (相对范围起点的天序号, 小时(0-23), 分钟数) 三个等长数组
+    """
+    import numpy as np
+
+    if not intervals:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0)
+
+    data = np.asarray(intervals, dtype=np.int64)
+    starts = np.maximum(data[:, 0], start_ms) + TZ_OFFSET_MS
+    ends = np.minimum(data[:, 1], end_ms) + TZ_OFFSET_MS
+    spans = data[:, 1] - data[:, 0]
+
+    # 暂停时间按比例从每个片段中扣除
+    scale = np.where(spans > 0, 1 - np.clip(data[:, 2], 0, None) / np.maximum(spans, 1), 0.0)
+    keep = ends > starts
+    starts, ends, scale = starts[keep], ends[keep], np.clip(scale[keep], 0.0, 1.0)
+
+    first_hour = starts // HOUR_MS
+    counts = (ends - 1) // HOUR_MS - first_hour + 1
+
+    # 每条记录展开为 counts 个小时片段
+    record = np.repeat(np.arange(len(starts)), counts)
+    offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    hour = first_hour[record] + offset
+    overlap = np.minimum(ends[record], (hour + 1) * HOUR_MS) - np.maximum(starts[record], hour * HOUR_MS)
+    minutes = overlap * scale[record] / 60000
+
+    first_day = (start_ms + TZ_OFFSET_MS) // (24 * HOUR_MS)
+    return hour // 24 - first_day, hour % 24, minutes
+
+
+def _day_labels(start_date: str, days: int) -> List[str]:
+    start = datetime.strptime(start_date, "%Y%m%d")
+    return [(start + timedelta(days=i)).strftime("%Y%m%d") for i in range(days)]
+
+
+def compute_heatmap(intervals: Sequence[Tuple[int, int, int]],
+                    start_date: str, end_date: str) -> List[Dict[str, Any]]:
+    """计算每日专注时长，格式同 /pomodoros/statistics/heatmap"""
+    import numpy as np
+
+    start_ms, end_ms, days = range_bounds(start_date, end_date)
+    day, _, minutes = _hour_slices(intervals, start_ms, end_ms)
+    totals = np.rint(np.bincount(day, weights=minutes, minlength=days)[:days]).astype(int)
+    return [
+        {"duration": int(total), "day": label, "timezone": TIMEZONE}
+        for label, total in zip(_day_labels(start_date, days), totals)
+    ]
+
+
+def compute_clock_by_day(intervals: Sequence[Tuple[int, int, int]],
+                         start_date: str, end_date: str) -> List[Dict[str, Any]]:
+    """计算每日按小时的专注分布，格式同 /pomodoros/statistics/dist/clockByDay"""
+    import numpy as np
+
+    start_ms, end_ms, days = range_bounds(start_date, end_date)
+    day, hour, minutes = _hour_slices(intervals, start_ms, end_ms)
+    grid = np.rint(
+        np.bincount(day * 24 + hour, weights=minutes, minlength=days * 24)[:days * 24]
+    ).astype(int).reshape(days, 24)
+
+    result = []
+    for label, row in zip(_day_labels(start_date, days), grid):
+        item: Dict[str, Any] = {"day": label, "timezone": TIMEZONE}
+        hours = np.flatnonzero(row)
+        if hours.size:
+            item["timeDurations"] = {str(h): int(row[h]) for h in hours}
+        result.append(item)
+    return result
+
+
+def compute_hour_distribution(intervals: Sequence[Tuple[int, int, int]],
+                              start_date: str, end_date: str) -> Dict[str, int]:
+    """计算按小时汇总的专注分布，格式同 /pomodoros/statistics/dist/clock"""
+    import numpy as np
+
+    start_ms, end_ms, _ = range_bounds(start_date, end_date)
+    _, hour, minutes = _hour_slices(intervals, start_ms, end_ms)
+    totals = np.rint(np.bincount(hour, weights=minutes, minlength=24)).astype(int)
+    return {str(h): int(totals[h]) for h in np.flatnonzero(totals)}
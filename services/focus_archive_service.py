@@ -0,0 +1,205 @@
+"""专注记录归档服务模块
+
+把 /pomodoros/timeline 获取到的专注记录按账号归档到本地SQLite，
+热力图、每日时间分布、小时分布和专注记录导出都直接读取归档，不再反复翻页。
+
+同步分两部分，进度保存在 focus_archive_state 表中：
+- 增量：从最新一页向前翻页，直到遇到高水位（已归档的最新开始时间）
+- 回填：从回填游标继续向更早翻页，直到最后一页，不限页数；中断后下次从游标继续
+"""
+import asyncio
+import time
+import weakref
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from core import config, db
+from core.cache import make_session_key
+from services.focus_analytics import (
+    compute_clock_by_day, compute_heatmap, compute_hour_distribution, range_bounds
+)
+from services.pomodoro_service import pomodoro_service
+from utils import app_logger
+
+# 上游时间线每页通常返回31条记录，少于该数量说明已到最后一页
+TIMELINE_PAGE_SIZE = 31
+
+
+class FocusArchiveService:
+    """专注记录归档服务类"""
+
+    def __init__(self):
+        self.archive_config = config.get('focus_archive', {})
+        self.sync_interval = self.archive_config.get('sync_interval', 300)
+
+        # 只在同步进行中保留锁，账号数量增长时不累积
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self._last_sync: Dict[str, float] = {}
+
+    @staticmethod
+    def _parse_record(record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """解析一条时间线记录，缺少ID或时间的记录返回None"""
+        try:
+            return {
+                "id": record['id'],
+                "start_ms": pomodoro_service._convert_time_to_timestamp(record['startTime']),
+                "end_ms": pomodoro_service._convert_time_to_timestamp(record['endTime']),
+                "pause_ms": int(record.get('pauseDuration') or 0),
+                "data": record
+            }
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def _parse_page(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [item for item in map(self._parse_record, records) if item]
+
+    async def archive(self, auth_token: str, records: Any) -> int:
+        """
+        归档一页时间线记录（不改变同步进度）
+
+        Args:
+            auth_token: 认证令牌，归档按账号隔离
+            records: /pomodoros/timeline 的原始响应
+
+        Returns:
+            int: 写入的记录数
+        """
+        if not isinstance(records, list):
+            return 0
+        parsed = self._parse_page(records)
+        if not parsed:
+            return 0
+        return await db.run(db.save_focus_records, make_session_key(auth_token), parsed)
+
+    async def get_state(self, auth_token: str) -> Dict[str, Any]:
+        """获取归档同步状态"""
+        return await db.run(db.get_focus_archive_state, make_session_key(auth_token))
+
+    async def sync(self, auth_token: str, csrf_token: str, force: bool = False,
+                   on_page: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+        """
+        同步上游时间线到归档
+
+        Args:
+            auth_token: 认证令牌
+            csrf_token: CSRF令牌
+            force: 为True时忽略 sync_interval 立即同步
+            on_page: 每请求一页时调用，用于统计进度
+
+        Returns:
+            dict: 请求页数和写入条数；上游失败时包含error（已写入的进度会保留）
+        """
+        account_key = make_session_key(auth_token)
+        lock = self._locks.get(account_key)
+        if lock is None:
+            lock = self._locks[account_key] = asyncio.Lock()
+        async with lock:
+            if not force and time.monotonic() - self._last_sync.get(account_key, float('-inf')) < self.sync_interval:
+                return {"skipped": True}
+
+            stats = {"pages": 0, "archived": 0}
+
+            async def fetch(to_timestamp: Optional[int]) -> List[Dict[str, Any]]:
+                result = await pomodoro_service.get_focus_timeline(auth_token, csrf_token, to_timestamp)
+                stats["pages"] += 1
+                if on_page:
+                    on_page()
+                if not isinstance(result, list):
+                    raise RuntimeError(result.get('error') if isinstance(result, dict) else "timeline_error")
+                return result
+
+            async def save(parsed: List[Dict[str, Any]], state: Dict[str, Any]) -> None:
+                stats["archived"] += await db.run(db.save_focus_records, account_key, parsed, state)
+
+            try:
+                state = await db.run(db.get_focus_archive_state, account_key)
+                high_water = state['newest_start_ms']
+
+                if high_water is None:
+                    # 首次同步：第一页确定高水位，之后的页都属于回填
+                    page = await fetch(None)
+                    parsed = self._parse_page(page)
+                    await save(parsed, {
+                        "newest_start_ms": max((r['start_ms'] for r in parsed), default=None),
+                        "backfill_cursor": min((r['start_ms'] for r in parsed), default=None),
+                        "backfill_done": int(len(page) < TIMELINE_PAGE_SIZE),
+                        "last_sync_at": datetime.now()
+                    })
+                else:
+                    # 增量：翻页直到遇到高水位；全部完成后才推进高水位，中断时下次重新补齐
+                    newest = high_water
+                    to_timestamp = None
+                    while True:
+                        page = await fetch(to_timestamp)
+                        parsed = self._parse_page(page)
+                        if not parsed:
+                            break
+                        await save(parsed, {})
+                        newest = max(newest, max(r['start_ms'] for r in parsed))
+                        oldest = min(r['start_ms'] for r in parsed)
+                        if oldest <= high_water or len(page) < TIMELINE_PAGE_SIZE:
+                            break
+                        to_timestamp = oldest
+                    await save([], {"newest_start_ms": newest, "last_sync_at": datetime.now()})
+
+                # 回填：从游标继续向更早翻页直到最后一页，每页保存游标
+                state = await db.run(db.get_focus_archive_state, account_key)
+                cursor = state['backfill_cursor']
+                while not state['backfill_done'] and cursor is not None:
+                    page = await fetch(cursor)
+                    parsed = self._parse_page(page)
+                    oldest = min((r['start_ms'] for r in parsed), default=None)
+                    done = len(page) < TIMELINE_PAGE_SIZE or oldest is None or oldest >= cursor
+                    await save(parsed, {"backfill_cursor": oldest if oldest is not None else cursor,
+                                        "backfill_done": int(done)})
+                    state['backfill_done'] = done
+                    cursor = oldest
+
+            except Exception as e:
+                app_logger.warning(f"同步专注记录归档失败: {e}")
+                return {**stats, "error": str(e)}
+
+            now = time.monotonic()
+            # 超过 sync_interval 的记录不再影响是否跳过同步，顺便清理
+            for key in [k for k, synced in self._last_sync.items() if now - synced >= self.sync_interval]:
+                del self._last_sync[key]
+            self._last_sync[account_key] = now
+            app_logger.info(
+                f"专注记录归档同步完成: {account_key}, 请求 {stats['pages']} 页, 写入 {stats['archived']} 条"
+            )
+            return stats
+
+    async def get_all_records(self, auth_token: str, csrf_token: str,
+                              on_page: Optional[Callable[[], None]] = None) -> List[Dict[str, Any]]:
+        """同步后返回归档中的全部专注记录原始数据（从新到旧）"""
+        await self.sync(auth_token, csrf_token, force=True, on_page=on_page)
+        return await db.run(db.get_focus_records, make_session_key(auth_token))
+
+    async def _load_intervals(self, auth_token: str, csrf_token: str,
+                              start_date: str, end_date: str) -> List:
+        if self.archive_config.get('sync_on_read', True):
+            await self.sync(auth_token, csrf_token)
+        start_ms, end_ms, _ = range_bounds(start_date, end_date)
+        return await db.run(db.get_focus_intervals, make_session_key(auth_token), start_ms, end_ms)
+
+    async def get_heatmap(self, auth_token: str, csrf_token: str,
+                          start_date: str, end_date: str) -> List[Dict[str, Any]]:
+        """从归档计算专注趋势热力图"""
+        intervals = await self._load_intervals(auth_token, csrf_token, start_date, end_date)
+        return compute_heatmap(intervals, start_date, end_date)
+
+    async def get_time_distribution(self, auth_token: str, csrf_token: str,
+                                    start_date: str, end_date: str) -> List[Dict[str, Any]]:
+        """从归档计算每日按小时的专注分布"""
+        intervals = await self._load_intervals(auth_token, csrf_token, start_date, end_date)
+        return compute_clock_by_day(intervals, start_date, end_date)
+
+    async def get_hour_distribution(self, auth_token: str, csrf_token: str,
+                                    start_date: str, end_date: str) -> Dict[str, int]:
+        """从归档计算按小时汇总的专注分布"""
+        intervals = await self._load_intervals(auth_token, csrf_token, start_date, end_date)
+        return compute_hour_distribution(intervals, start_date, end_date)
+
+
+# 全局专注记录归档服务实例
+focus_archive_service = FocusArchiveService()
@@ -1,8 +1,7 @@
 """习惯管理服务模块"""
-import httpx
 from typing import Optional
 from utils import app_logger
-from core import urls
+from core import urls, http_client, response_cache
 # 不再使用响应模型，直接返回原始响应
 
 
@@ -10,7 +9,7 @@ class HabitService:
     """习惯管理服务类"""
     
     def __init__(self):
-        self.client = httpx.AsyncClient(timeout=30.0)
+        self.client = http_client
     
     def _build_auth_headers(self, auth_token: str, csrf_token: str) -> dict:
         """构建认证请求头"""
@@ -30,7 +29,25 @@ class HabitService:
             '_csrf_token': csrf_token
         }
     
-    async def get_habits(self, auth_token: str, csrf_token: str) -> dict:
+    async def get_habits(self, auth_token: str, csrf_token: str, use_cache: bool = True) -> dict:
+        """
+        获取习惯列表（带缓存）
+
+        Args:
+            auth_token: 认证令牌
+            csrf_token: CSRF令牌
+            use_cache: 是否读取缓存，为False时强制请求上游并刷新缓存
+
+        Returns:
+            dict: 原始响应数据
+        """
+        return await response_cache.get_or_fetch(
+            "get_habits", auth_token,
+            lambda: self._fetch_habits(auth_token, csrf_token),
+            bypass=not use_cache
+        )
+
+    async def _fetch_habits(self, auth_token: str, csrf_token: str) -> dict:
         """
         获取习惯列表
 
@@ -148,10 +165,6 @@ class HabitService:
         except Exception as e:
             app_logger.error(f"导出习惯数据时发生错误: {e}")
             return {"error": str(e)}
-    
-    async def close(self):
-        """关闭HTTP客户端"""
-        await self.client.aclose()
 
 
 # 全局习惯服务实例
@@ -0,0 +1,342 @@
+"""微信扫码登录流程管理模块
+
+每个二维码（qr_code_key）只启动一个后台长轮询任务，状态变化推送给所有订阅者，
+页面通过 SSE 接收状态，不再反复请求轮询接口。
+
+所有进行中的流程登记在 LoginFlowManager 中：
+- 全局进行中流程数达到 max_flows 时拒绝新流程
+- 同一客户端达到 max_flows_per_client 时取消该客户端最早的流程（刷新页面会产生新二维码）
+- 二维码过期、超时或所有订阅者断开超过 idle_grace 秒时取消后台轮询
+- 流程创建后 idle_grace 秒内一直没有订阅者时同样取消
+- 只为本服务签发的二维码启动流程，签发记录保存在共享状态中，多worker时任一worker都能识别
+"""
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+from core import config
+from core.shared_state import shared_state
+from models import WeChatValidateResponse
+from services.wechat_service import wechat_service
+from utils import app_logger
+
+
+# 微信轮询 wx_errcode 与登录流程状态的对应关系
+ERRCODE_STATUS = {
+    404: ("waiting", "请使用微信扫描二维码"),
+    403: ("scanned", "已扫码，请在手机上确认登录"),
+    402: ("expired", "二维码已过期，请重新获取"),
+    400: ("expired", "二维码已失效，请重新获取"),
+}
+
+# 长轮询挂起超时，状态没有变化
+ERRCODE_NO_CHANGE = 408
+
+# 结束状态，进入后不再轮询
+TERMINAL_STATUSES = {"success", "failed", "expired"}
+
+
+class LoginFlowLimitError(RuntimeError):
+    """进行中的登录流程数量已达上限"""
+
+
+class UnknownQRCodeError(LookupError):
+    """二维码不是本服务签发的，或签发记录已过期"""
+
+
+class LoginFlow:
+    """单个二维码的登录流程"""
+
+    def __init__(self, qr_code_key: str, client: str = ""):
+        self.qr_code_key = qr_code_key
+        self.client = client
+        self.status = "waiting"
+        self.message = "请使用微信扫描二维码"
+        self.errcode: Optional[int] = None
+        self.user_info: Optional[Dict[str, Any]] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.result: Optional[WeChatValidateResponse] = None
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.idle_handle: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def to_event(self) -> Dict[str, Any]:
+        """
+        构建推送给页面的事件（不包含令牌和cookie）
+
+        登录成功时带上新会话的ID，页面通过 POST /auth/session/bind 换取会话cookie
+        """
+        event = {
+            "qr_code_key": self.qr_code_key,
+            "status": self.status,
+            "message": self.message,
+            "errcode": self.errcode,
+            "user_info": self.user_info,
+            "updated_at": self.updated_at
+        }
+        if self.status == "success" and self.result is not None and self.result.session_id:
+            event["session_id"] = self.result.session_id
+        return event
+
+
+class LoginFlowManager:
+    """登录流程管理类"""
+
+    def __init__(self):
+        self.flow_config = config.get('wechat_login', {})
+        self.retry_interval = self.flow_config.get('retry_interval', 2.0)
+        self.flow_timeout = self.flow_config.get('flow_timeout', 300)
+        self.finished_retention = self.flow_config.get('finished_retention', 60)
+        self.max_flows = self.flow_config.get('max_flows', 500)
+        self.max_flows_per_client = self.flow_config.get('max_flows_per_client', 3)
+        self.idle_grace = self.flow_config.get('idle_grace', 30)
+
+        self._flows: Dict[str, LoginFlow] = {}
+        self.started = 0
+        self.rejected = 0
+        self.replaced = 0
+        self.abandoned = 0
+        self.unknown = 0
+
+    def _active_flows(self) -> List[LoginFlow]:
+        return [flow for flow in self._flows.values() if not flow.finished]
+
+    @staticmethod
+    def _issued_key(qr_code_key: str) -> str:
+        return shared_state.key('login_qr', qr_code_key)
+
+    async def register_issued(self, qr_code_key: str) -> None:
+        """记录本服务签发的二维码，flow_timeout 内可以为它启动登录流程"""
+        await shared_state.set(self._issued_key(qr_code_key), True, self.flow_timeout)
+
+    async def get_or_start(self, qr_code_key: str, client: str = "") -> LoginFlow:
+        """
+        获取登录流程，不存在时创建并启动后台轮询
+
+        新流程在 idle_grace 秒内没有订阅者即被取消，只调用本接口而不订阅时不会一直轮询
+
+        Args:
+            qr_code_key: 二维码密钥
+            client: 客户端标识（IP），用于按客户端限制进行中的流程数
+
+        Raises:
+            UnknownQRCodeError: 二维码不是本服务签发的
+            LoginFlowLimitError: 进行中的流程数已达全局上限
+        """
+        self._cleanup_finished()
+
+        flow = self._flows.get(qr_code_key)
+        if flow is not None:
+            return flow
+
+        if not await shared_state.get(self._issued_key(qr_code_key)):
+            self.unknown += 1
+            raise UnknownQRCodeError("二维码不存在或已过期，请重新获取")
+
+        flow = self._flows.get(qr_code_key)
+        if flow is not None:
+            return flow
+
+        active = self._active_flows()
+
+        # 同一客户端的流程过多时取消最早的，通常是刷新页面遗留的旧二维码
+        if client:
+            # 已确认的流程正在换取令牌，不取消
+            own = sorted(
+                (f for f in active if f.client == client and f.status != "confirmed"),
+                key=lambda f: f.created_at
+            )
+            for old in own[:max(0, len(own) - self.max_flows_per_client + 1)]:
+                self.replaced += 1
+                self._cancel(old, "已在新的二维码上继续登录")
+                active.remove(old)
+
+        if len(active) >= self.max_flows:
+            self.rejected += 1
+            raise LoginFlowLimitError("当前登录人数过多，请稍后重试")
+
+        flow = LoginFlow(qr_code_key, client)
+        flow.task = asyncio.create_task(self._poll(flow))
+        self._arm_idle(flow)
+        self._flows[qr_code_key] = flow
+        self.started += 1
+        app_logger.info(f"启动登录流程: {qr_code_key}，客户端: {client or '-'}")
+        return flow
+
+    async def subscribe(self, qr_code_key: str,
+                        heartbeat: Optional[float] = None) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        订阅登录流程状态
+
+        先产生当前状态，之后每次状态变化产生一次，流程结束后停止。
+        最后一个订阅者离开后，流程在 idle_grace 秒内没有新的订阅者即被取消
+
+        Args:
+            qr_code_key: 二维码密钥
+            heartbeat: 超过该秒数没有状态变化时产生None，供调用方发送保活消息
+        """
+        flow = await self.get_or_start(qr_code_key)
+        queue: asyncio.Queue = asyncio.Queue()
+        flow.subscribers.add(queue)
+        if flow.idle_handle is not None:
+            flow.idle_handle.cancel()
+            flow.idle_handle = None
+        try:
+            event = flow.to_event()
+            yield event
+            while event["status"] not in TERMINAL_STATUSES:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                yield event
+        finally:
+            flow.subscribers.discard(queue)
+            if not flow.subscribers and not flow.finished:
+                self._arm_idle(flow)
+
+    def _arm_idle(self, flow: LoginFlow) -> None:
+        """idle_grace 秒后仍没有订阅者时取消流程"""
+        if flow.idle_handle is not None:
+            flow.idle_handle.cancel()
+        flow.idle_handle = asyncio.get_running_loop().call_later(
+            self.idle_grace, self._cancel_if_idle, flow
+        )
+
+    def _cancel_if_idle(self, flow: LoginFlow) -> None:
+        """订阅者断开后一直没有重新连接，取消流程"""
+        flow.idle_handle = None
+        if not flow.subscribers and not flow.finished and flow.status != "confirmed":
+            self.abandoned += 1
+            self._cancel(flow, "页面已关闭，登录流程已取消")
+
+    def _cancel(self, flow: LoginFlow, message: str) -> None:
+        """取消流程的后台轮询并通知订阅者"""
+        if flow.idle_handle is not None:
+            flow.idle_handle.cancel()
+            flow.idle_handle = None
+        self._update(flow, "failed", message)
+        if flow.task and not flow.task.done():
+            flow.task.cancel()
+        app_logger.info(f"取消登录流程: {flow.qr_code_key}，原因: {message}")
+
+    def _update(self, flow: LoginFlow, status: str, message: str,
+                errcode: Optional[int] = None, user_info: Optional[Dict[str, Any]] = None) -> None:
+        """更新状态并通知订阅者（状态未变化时不推送）"""
+        if flow.status == status and flow.message == message:
+            return
+        flow.status = status
+        flow.message = message
+        flow.errcode = errcode
+        if user_info is not None:
+            flow.user_info = user_info
+        flow.updated_at = time.time()
+
+        event = flow.to_event()
+        for queue in list(flow.subscribers):
+            queue.put_nowait(event)
+        app_logger.info(f"登录流程 {flow.qr_code_key} 状态: {status}")
+
+    async def _poll(self, flow: LoginFlow) -> None:
+        """后台长轮询微信登录状态，直到成功、过期或超时"""
+        deadline = flow.created_at + self.flow_timeout
+        last: Optional[int] = None
+        try:
+            while time.time() < deadline:
+                try:
+                    errcode, wx_code = await wechat_service.check_qr_status(flow.qr_code_key, last)
+                except Exception as e:
+                    app_logger.warning(f"登录流程 {flow.qr_code_key} 轮询失败: {e}")
+                    await asyncio.sleep(self.retry_interval)
+                    continue
+
+                if errcode == 405 and wx_code:
+                    self._update(flow, "confirmed", "已确认，正在登录...", errcode)
+                    result = await wechat_service.validate_wechat_login(wx_code)
+                    flow.result = result
+                    if result and result.success:
+                        self._update(flow, "success", "登录成功", errcode, result.user_info or {})
+                    else:
+                        message = result.message if result else "登录失败"
+                        self._update(flow, "failed", message, errcode)
+                    return
+
+                if errcode == ERRCODE_NO_CHANGE:
+                    # 挂起期间状态没有变化，立即重新发起
+                    continue
+
+                if errcode in ERRCODE_STATUS:
+                    status, message = ERRCODE_STATUS[errcode]
+                    self._update(flow, status, message, errcode)
+                    if flow.finished:
+                        return
+                    # 带上最新状态立即重新发起，服务端会挂起到下一次变化
+                    last = errcode
+                    continue
+
+                # 无法识别的响应，稍后重试
+                await asyncio.sleep(self.retry_interval)
+
+            self._update(flow, "expired", "登录超时，请重新获取二维码")
+
+        except asyncio.CancelledError:
+            if not flow.finished:
+                self._update(flow, "failed", "登录流程已取消")
+            raise
+        except Exception as e:
+            app_logger.error(f"登录流程 {flow.qr_code_key} 发生错误: {e}")
+            self._update(flow, "failed", f"登录失败: {str(e)}")
+
+    def _cleanup_finished(self) -> None:
+        """移除结束超过保留时间的流程"""
+        now = time.time()
+        expired = [
+            key for key, flow in self._flows.items()
+            if flow.finished and now - flow.updated_at > self.finished_retention
+        ]
+        for key in expired:
+            del self._flows[key]
+
+    async def shutdown(self) -> None:
+        """取消所有进行中的登录流程"""
+        tasks = [flow.task for flow in self._flows.values() if flow.task and not flow.task.done()]
+        for flow in self._flows.values():
+            if flow.idle_handle is not None:
+                flow.idle_handle.cancel()
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取登录流程统计"""
+        self._cleanup_finished()
+        active = self._active_flows()
+        by_status: Dict[str, int] = {}
+        for flow in self._flows.values():
+            by_status[flow.status] = by_status.get(flow.status, 0) + 1
+        return {
+            "active": len(active),
+            "finished": len(self._flows) - len(active),
+            "subscribers": sum(len(flow.subscribers) for flow in self._flows.values()),
+            "clients": len({flow.client for flow in active if flow.client}),
+            "by_status": by_status,
+            "started": self.started,
+            "rejected": self.rejected,
+            "replaced": self.replaced,
+            "abandoned": self.abandoned,
+            "unknown": self.unknown,
+            "max_flows": self.max_flows,
+            "max_flows_per_client": self.max_flows_per_client,
+            "idle_grace": self.idle_grace
+        }
+
+
+# 创建全局实例
+login_flow_manager = LoginFlowManager()
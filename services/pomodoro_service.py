@@ -1,14 +1,35 @@
 """番茄专注服务模块"""
-import httpx
+import asyncio
 from datetime import datetime, timezone, timedelta
-from core import urls
+from typing import Any, Dict, List, Set
+from core import config, urls, http_client
+from core.cache import day_cache, make_session_key
+from utils import app_logger
+
+
+def _merge_sum(total: Any, value: Any) -> Any:
+    """合并两天的汇总统计：数值相加，字典逐键合并，其他字段保留先出现的值"""
+    if isinstance(total, dict) and isinstance(value, dict):
+        merged = dict(total)
+        for key, item in value.items():
+            merged[key] = _merge_sum(merged[key], item) if key in merged else item
+        return merged
+    if isinstance(total, (int, float)) and isinstance(value, (int, float)) \
+            and not isinstance(total, bool) and not isinstance(value, bool):
+        return total + value
+    return total
 
 
 class PomodoroService:
     """番茄专注服务类"""
     
     def __init__(self):
-        self.client = httpx.AsyncClient(timeout=30.0)
+        self.client = http_client
+        self.day_config = config.get('cache', {}).get('days', {})
+        self._warm_semaphore = asyncio.Semaphore(self.day_config.get('concurrency', 8))
+        self._warming: Set[str] = set()
+        # 后台补齐缓存的任务；事件循环只保留任务的弱引用，这里持有引用直到任务结束
+        self._background: Set[asyncio.Task] = set()
     
     def _build_auth_headers(self, auth_token: str, csrf_token: str) -> dict:
         """构建认证请求头"""
@@ -71,21 +92,10 @@ class PomodoroService:
     
     async def get_focus_distribution(self, auth_token: str, csrf_token: str,
                                    start_date: str, end_date: str) -> dict:
-        """获取专注详情分布，直接返回原始响应"""
-        try:
-            endpoint = f"{urls.DIDA_POMODORO_APIS['focus_distribution']}/{start_date}/{end_date}"
-            url = urls.build_dida_api_url(endpoint)
-            headers = self._build_auth_headers(auth_token, csrf_token)
-            cookies = self._build_auth_cookies(auth_token, csrf_token)
-
-            response = await self.client.get(url, headers=headers, cookies=cookies)
-
-            if response.status_code == 200:
-                return response.json()
-            else:
-                return {"error": f"HTTP {response.status_code}", "text": response.text}
-        except Exception as e:
-            return {"error": str(e)}
+        """获取专注详情分布（按天缓存，逐天汇总）"""
+        return await self._get_summed_by_day(
+            "focus_distribution", auth_token, csrf_token, start_date, end_date
+        )
     
     async def get_focus_timeline(self, auth_token: str, csrf_token: str, to_timestamp: int = None) -> dict:
         """
@@ -120,10 +130,31 @@ class PomodoroService:
 
     async def get_focus_heatmap(self, auth_token: str, csrf_token: str,
                                start_date: str, end_date: str) -> dict:
-        """获取专注趋势热力图，直接返回原始响应"""
+        """获取专注趋势热力图（按天缓存）"""
+        return await self._get_daily_by_day(
+            "focus_heatmap", auth_token, csrf_token, start_date, end_date
+        )
+
+    async def get_focus_time_distribution(self, auth_token: str, csrf_token: str,
+                                         start_date: str, end_date: str) -> dict:
+        """获取专注时间分布（按时间段，按天缓存）"""
+        return await self._get_daily_by_day(
+            "focus_time_distribution", auth_token, csrf_token, start_date, end_date
+        )
+
+    async def get_focus_hour_distribution(self, auth_token: str, csrf_token: str,
+                                         start_date: str, end_date: str) -> dict:
+        """获取专注时间按小时分布（按天缓存，逐天汇总）"""
+        return await self._get_summed_by_day(
+            "focus_hour_distribution", auth_token, csrf_token, start_date, end_date
+        )
+
+    async def _fetch_range(self, endpoint: str, auth_token: str, csrf_token: str,
+                           start_date: str, end_date: str) -> Any:
+        """按日期范围请求上游，直接返回原始响应"""
         try:
-            endpoint = f"{urls.DIDA_POMODORO_APIS['focus_heatmap']}/{start_date}/{end_date}"
-            url = urls.build_dida_api_url(endpoint)
+            path = f"{urls.DIDA_POMODORO_APIS[endpoint]}/{start_date}/{end_date}"
+            url = urls.build_dida_api_url(path)
             headers = self._build_auth_headers(auth_token, csrf_token)
             cookies = self._build_auth_cookies(auth_token, csrf_token)
 
@@ -136,45 +167,139 @@ class PomodoroService:
         except Exception as e:
             return {"error": str(e)}
 
-    async def get_focus_time_distribution(self, auth_token: str, csrf_token: str,
-                                         start_date: str, end_date: str) -> dict:
-        """获取专注时间分布（按时间段），直接返回原始响应"""
+    @staticmethod
+    def _split_days(start_date: str, end_date: str) -> List[str]:
+        """把日期范围拆成 YYYYMMDD 列表，日期无效或范围颠倒时返回空列表"""
         try:
-            endpoint = f"{urls.DIDA_POMODORO_APIS['focus_time_distribution']}/{start_date}/{end_date}"
-            url = urls.build_dida_api_url(endpoint)
-            headers = self._build_auth_headers(auth_token, csrf_token)
-            cookies = self._build_auth_cookies(auth_token, csrf_token)
+            start = datetime.strptime(start_date, "%Y%m%d")
+            end = datetime.strptime(end_date, "%Y%m%d")
+        except ValueError:
+            return []
+        return [(start + timedelta(days=i)).strftime("%Y%m%d") for i in range((end - start).days + 1)]
 
-            response = await self.client.get(url, headers=headers, cookies=cookies)
+    @staticmethod
+    def _today() -> str:
+        """今天的日期（与请求头 X-Tz 一致，使用中国时间）"""
+        return datetime.now(timezone(timedelta(hours=8))).strftime("%Y%m%d")
 
-            if response.status_code == 200:
-                return response.json()
+    async def _cached_days(self, endpoint: str, auth_token: str, days: List[str]) -> Dict[str, Any]:
+        """读取已缓存的过去日期，返回 {日期: 数据}"""
+        today = self._today()
+        return await day_cache.get_many(auth_token, endpoint, [d for d in days if d < today])
+
+    @staticmethod
+    def _runs(days: List[str]) -> List[List[str]]:
+        """把缺失日期拆成连续区间，每个区间只请求一次上游"""
+        runs: List[List[str]] = []
+        for day in days:
+            if runs and (datetime.strptime(day, "%Y%m%d")
+                         - datetime.strptime(runs[-1][-1], "%Y%m%d")).days == 1:
+                runs[-1].append(day)
             else:
-                return {"error": f"HTTP {response.status_code}", "text": response.text}
-        except Exception as e:
-            return {"error": str(e)}
+                runs.append([day])
+        return runs
 
-    async def get_focus_hour_distribution(self, auth_token: str, csrf_token: str,
-                                         start_date: str, end_date: str) -> dict:
-        """获取专注时间按小时分布，直接返回原始响应"""
-        try:
-            endpoint = f"{urls.DIDA_POMODORO_APIS['focus_hour_distribution']}/{start_date}/{end_date}"
-            url = urls.build_dida_api_url(endpoint)
-            headers = self._build_auth_headers(auth_token, csrf_token)
-            cookies = self._build_auth_cookies(auth_token, csrf_token)
+    async def _get_daily_by_day(self, endpoint: str, auth_token: str, csrf_token: str,
+                                start_date: str, end_date: str) -> Any:
+        """
+        获取按天返回的统计（列表中每项带 day 字段）
 
-            response = await self.client.get(url, headers=headers, cookies=cookies)
+        已缓存的日期直接使用，缺失的日期按连续区间向上游请求后拆分到各天
+        """
+        days = self._split_days(start_date, end_date)
+        if not days:
+            return await self._fetch_range(endpoint, auth_token, csrf_token, start_date, end_date)
 
-            if response.status_code == 200:
-                return response.json()
+        cached = await self._cached_days(endpoint, auth_token, days)
+        missing = [d for d in days if d not in cached]
+        today = self._today()
+
+        for run in self._runs(missing):
+            result = await self._fetch_range(endpoint, auth_token, csrf_token, run[0], run[-1])
+            if not isinstance(result, list):
+                return result
+            by_day: Dict[str, list] = {day: [] for day in run}
+            for item in result:
+                day = item.get('day') if isinstance(item, dict) else None
+                if day in by_day:
+                    by_day[day].append(item)
+            for day, items in by_day.items():
+                cached[day] = items
+                if day < today:
+                    await day_cache.set(auth_token, endpoint, day, items)
+
+        return [item for day in days for item in cached.get(day, [])]
+
+    async def _get_summed_by_day(self, endpoint: str, auth_token: str, csrf_token: str,
+                                 start_date: str, end_date: str) -> Any:
+        """
+        获取整个范围汇总的统计（专注分布、小时分布）
+
+        上游只返回范围汇总，各天的汇总可以相加：缺失的日期按连续区间各请求一次上游，
+        再与已缓存的日期逐项相加。区间的汇总无法拆分到天，缺失的过去日期在后台逐天获取写入缓存，
+        不占用本次请求的时间；缺失天数超过 max_missing_days 时直接请求整个范围且不写入缓存
+        """
+        days = self._split_days(start_date, end_date)
+        if not days:
+            return await self._fetch_range(endpoint, auth_token, csrf_token, start_date, end_date)
+
+        cached = await self._cached_days(endpoint, auth_token, days)
+        missing = [d for d in days if d not in cached]
+        if len(missing) > self.day_config.get('max_missing_days', 62):
+            return await self._fetch_range(endpoint, auth_token, csrf_token, start_date, end_date)
+
+        runs = self._runs(missing)
+        results = await asyncio.gather(*(
+            self._fetch_range(endpoint, auth_token, csrf_token, run[0], run[-1]) for run in runs
+        ))
+
+        total: Dict[str, Any] = {}
+        today = self._today()
+        for run, result in zip(runs, results):
+            if not isinstance(result, dict) or 'error' in result:
+                return result
+            total = _merge_sum(total, result)
+            if len(run) == 1 and run[0] < today:
+                await day_cache.set(auth_token, endpoint, run[0], result)
             else:
-                return {"error": f"HTTP {response.status_code}", "text": response.text}
+                self._warm_days(endpoint, auth_token, csrf_token, [d for d in run if d < today])
+
+        for day in days:
+            if day in cached:
+                total = _merge_sum(total, cached[day])
+        return total
+
+    def _warm_days(self, endpoint: str, auth_token: str, csrf_token: str, days: List[str]) -> None:
+        """在后台逐天获取汇总统计写入按天缓存（并发数 concurrency），同一天只获取一次"""
+        if not days or not day_cache.enabled:
+            return
+        prefix = f"{make_session_key(auth_token)}:{endpoint}:"
+        for day in days:
+            if prefix + day not in self._warming:
+                self._warming.add(prefix + day)
+                task = asyncio.ensure_future(self._warm_day(endpoint, auth_token, csrf_token, day, prefix + day))
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
+
+    async def _warm_day(self, endpoint: str, auth_token: str, csrf_token: str, day: str, key: str) -> None:
+        try:
+            async with self._warm_semaphore:
+                result = await self._fetch_range(endpoint, auth_token, csrf_token, day, day)
+            if isinstance(result, dict) and 'error' not in result:
+                await day_cache.set(auth_token, endpoint, day, result)
         except Exception as e:
-            return {"error": str(e)}
-    
-    async def close(self):
-        """关闭HTTP客户端"""
-        await self.client.aclose()
+            app_logger.warning(f"后台缓存专注统计失败 {endpoint} {day}: {e}")
+        finally:
+            self._warming.discard(key)
+
+    async def shutdown(self) -> None:
+        """取消仍在执行的后台缓存补齐"""
+        tasks = list(self._background)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._warming.clear()
 
 
 # 全局番茄专注服务实例
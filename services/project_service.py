@@ -1,8 +1,7 @@
 """项目管理服务模块"""
-import httpx
 from typing import Optional
 from utils import app_logger
-from core import urls
+from core import urls, http_client, response_cache
 # 不再使用响应模型，直接返回原始响应
 
 
@@ -10,9 +9,27 @@ class ProjectService:
     """项目管理服务类"""
     
     def __init__(self):
-        self.client = httpx.AsyncClient(timeout=30.0)
+        self.client = http_client
     
-    async def get_projects(self, auth_token: str, csrf_token: str) -> dict:
+    async def get_projects(self, auth_token: str, csrf_token: str, use_cache: bool = True) -> dict:
+        """
+        获取项目/清单列表（带缓存）
+
+        Args:
+            auth_token: 认证令牌
+            csrf_token: CSRF令牌
+            use_cache: 是否读取缓存，为False时强制请求上游并刷新缓存
+
+        Returns:
+            dict: 原始响应数据
+        """
+        return await response_cache.get_or_fetch(
+            "get_projects", auth_token,
+            lambda: self._fetch_projects(auth_token, csrf_token),
+            bypass=not use_cache
+        )
+
+    async def _fetch_projects(self, auth_token: str, csrf_token: str) -> dict:
         """
         获取项目/清单列表
 
@@ -62,10 +79,6 @@ class ProjectService:
             app_logger.error(f"获取项目列表时发生错误: {e}")
             return {"error": str(e)}
 
-    async def close(self):
-        """关闭HTTP客户端"""
-        await self.client.aclose()
-
 
 # 全局项目服务实例
 project_service = ProjectService()
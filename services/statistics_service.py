@@ -1,14 +1,13 @@
 """统计服务模块"""
-import httpx
 from utils import app_logger
-from core import urls
+from core import urls, http_client, response_cache
 
 
 class StatisticsService:
     """统计服务类"""
     
     def __init__(self):
-        self.client = httpx.AsyncClient(timeout=30.0)
+        self.client = http_client
     
     def _build_auth_headers(self, auth_token: str, csrf_token: str) -> dict:
         """构建认证请求头"""
@@ -28,7 +27,15 @@ class StatisticsService:
             '_csrf_token': csrf_token
         }
     
-    async def get_user_ranking(self, auth_token: str, csrf_token: str) -> dict:
+    async def get_user_ranking(self, auth_token: str, csrf_token: str, use_cache: bool = True) -> dict:
+        """获取用户排名统计（带缓存，use_cache=False时强制请求上游）"""
+        return await response_cache.get_or_fetch(
+            "user_ranking", auth_token,
+            lambda: self._fetch_user_ranking(auth_token, csrf_token),
+            bypass=not use_cache
+        )
+
+    async def _fetch_user_ranking(self, auth_token: str, csrf_token: str) -> dict:
         """获取用户排名统计，直接返回原始响应"""
         try:
             url = urls.build_dida_api_url(urls.DIDA_STATISTICS_APIS["user_ranking"]).replace('/v2/', '/v3/')
@@ -44,7 +51,15 @@ class StatisticsService:
         except Exception as e:
             return {"error": str(e)}
     
-    async def get_general_statistics(self, auth_token: str, csrf_token: str) -> dict:
+    async def get_general_statistics(self, auth_token: str, csrf_token: str, use_cache: bool = True) -> dict:
+        """获取通用统计信息（带缓存，use_cache=False时强制请求上游）"""
+        return await response_cache.get_or_fetch(
+            "general_statistics", auth_token,
+            lambda: self._fetch_general_statistics(auth_token, csrf_token),
+            bypass=not use_cache
+        )
+
+    async def _fetch_general_statistics(self, auth_token: str, csrf_token: str) -> dict:
         """获取通用统计信息，直接返回原始响应"""
         try:
             url = urls.build_dida_api_url(urls.DIDA_STATISTICS_APIS["general_statistics"])
@@ -77,10 +92,6 @@ class StatisticsService:
                 return {"error": f"HTTP {response.status_code}", "text": response.text}
         except Exception as e:
             return {"error": str(e)}
-    
-    async def close(self):
-        """关闭HTTP客户端"""
-        await self.client.aclose()
 
 
 # 全局统计服务实例
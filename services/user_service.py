@@ -1,6 +1,5 @@
 """用户信息服务模块"""
-import httpx
-from core import urls
+from core import urls, http_client, response_cache
 from utils import app_logger
 
 
@@ -8,7 +7,7 @@ class UserService:
     """用户信息服务类"""
     
     def __init__(self):
-        self.client = httpx.AsyncClient(timeout=30.0)
+        self.client = http_client
     
     def _build_auth_headers(self, auth_token: str, csrf_token: str) -> dict:
         """构建认证headers"""
@@ -30,7 +29,25 @@ class UserService:
             '_csrf_token': csrf_token
         }
     
-    async def get_user_profile(self, auth_token: str, csrf_token: str) -> dict:
+    async def get_user_profile(self, auth_token: str, csrf_token: str, use_cache: bool = True) -> dict:
+        """
+        获取用户信息（带缓存）
+
+        Args:
+            auth_token: 认证令牌
+            csrf_token: CSRF令牌
+            use_cache: 是否读取缓存，为False时强制请求上游并刷新缓存
+
+        Returns:
+            dict: 原始响应数据
+        """
+        return await response_cache.get_or_fetch(
+            "user_profile", auth_token,
+            lambda: self._fetch_user_profile(auth_token, csrf_token),
+            bypass=not use_cache
+        )
+
+    async def _fetch_user_profile(self, auth_token: str, csrf_token: str) -> dict:
         """
         获取用户信息，直接返回原始响应
         
@@ -63,10 +80,6 @@ class UserService:
         except Exception as e:
             app_logger.error(f"获取用户信息时发生错误: {e}")
             return {"error": str(e)}
-    
-    async def close(self):
-        """关闭HTTP客户端"""
-        await self.client.aclose()
 
 
 # 全局用户服务实例
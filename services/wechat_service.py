@@ -1,10 +1,10 @@
 """微信登录服务模块"""
 import re
-import uuid
 from typing import Optional, Dict, Any, Tuple
 import httpx
 from utils import app_logger
-from core import config, db, urls
+from core import config, urls, http_client
+from core.audit import audit_sink
 from models import WeChatQRResponse, WeChatValidateResponse, PasswordLoginRequest
 
 
@@ -13,7 +13,10 @@ class WeChatLoginService:
     
     def __init__(self):
         self.request_config = config.get('request_config', {})
-        self.client = httpx.AsyncClient(timeout=self.request_config.get('timeout', 30.0))
+        self.login_config = config.get('wechat_login', {})
+        self.long_poll_timeout = self.login_config.get('long_poll_timeout', 60.0)
+        self.retry_interval = self.login_config.get('retry_interval', 2.0)
+        self.client = http_client
     
     async def get_qr_code(self, state: str = "Lw==") -> Optional[WeChatQRResponse]:
         """
@@ -32,13 +35,11 @@ class WeChatLoginService:
             app_logger.info(f"请求微信二维码: {qr_url}")
             
             # 发送请求
-            response = await self.client.get(qr_url)
+            # 每次都需要新的二维码，不能与其他用户的请求合并
+            response = await self.client.get(qr_url, coalesce=False)
             response.raise_for_status()
             
-            # 记录完整响应
-            app_logger.debug(f"微信二维码响应状态: {response.status_code}")
-            app_logger.debug(f"微信二维码响应头: {dict(response.headers)}")
-            app_logger.debug(f"微信二维码响应内容长度: {len(response.text)}")
+            app_logger.debug(f"微信二维码响应状态: {response.status_code}，内容长度: {len(response.content)}")
             
             # 解析HTML中的二维码图片链接
             qr_code_key = self._extract_qr_code_key(response.text)
@@ -51,7 +52,7 @@ class WeChatLoginService:
             qr_code_url = f"{urls.WECHAT_URLS['qr_image_base_url']}/{qr_code_key}"
             
             # 记录到数据库
-            db.log_wechat_login(qr_code_key=qr_code_key, state=state)
+            audit_sink.log_wechat_login(qr_code_key=qr_code_key, state=state)
             
             app_logger.info(f"成功获取二维码: {qr_code_url}")
             
@@ -116,76 +117,113 @@ class WeChatLoginService:
             app_logger.error(f"提取二维码密钥时发生错误: {e}")
             return None
 
+    async def check_qr_status(self, qr_code_key: str, last: Optional[int] = None) -> Tuple[Optional[int], str]:
+        """
+        长轮询一次二维码状态
+
+        传入 last 时微信服务端会挂起请求，直到状态与 last 不同或挂起超时才返回，
+        调用方收到结果后应立即带上新的 last 再次请求
+
+        Args:
+            qr_code_key: 二维码密钥
+            last: 上一次收到的 wx_errcode，首次请求不传
+
+        Returns:
+            tuple: (wx_errcode, wx_code)，响应无法解析时errcode为None
+                   - 405: 已确认登录，wx_code为授权码
+                   - 404: 等待扫码
+                   - 403: 已扫码，等待确认
+                   - 408: 挂起超时，状态没有变化（请求读取超时也按此返回）
+                   - 402/400: 二维码已过期或失效
+        """
+        # 使用统一的URL构建函数
+        poll_url = urls.build_wechat_poll_url(qr_code_key, last=last)
+
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36',
+            'Referer': 'https://open.weixin.qq.com/',
+            'Accept': '*/*',
+            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
+        }
+
+        # 读取超时需要大于服务端的挂起时间，否则会在状态变化前主动断开
+        timeout = httpx.Timeout(self.long_poll_timeout, connect=self.request_config.get('timeout', 30.0))
+        try:
+            response = await self.client.get(poll_url, coalesce=False, headers=headers, timeout=timeout)
+        except httpx.ReadTimeout:
+            app_logger.debug(f"长轮询读取超时，状态未变化: {qr_code_key}")
+            return 408, ''
+        response_text = response.text
+        app_logger.debug(f"轮询响应: {response_text}")
+
+        # 解析微信轮询响应
+        # 实际响应格式是: window.wx_errcode=405;window.wx_code='xxx';
+        errcode_match = re.search(r'window\.wx_errcode\s*=\s*(\d+)', response_text)
+        if not errcode_match:
+            return None, ''
+
+        code_match = re.search(r"window\.wx_code\s*=\s*'([^']*)'", response_text)
+        errcode = int(errcode_match.group(1))
+        wx_code = code_match.group(1) if code_match else ''
+
+        app_logger.info(f"轮询状态 - errcode: {errcode}, wx_code: {wx_code}")
+        return errcode, wx_code
+
     async def poll_qr_status(self, qr_code_key: str, max_attempts: int = 60) -> Optional[WeChatValidateResponse]:
         """
-        轮询二维码状态，检查是否已扫码登录
+        长轮询二维码状态，检查是否已扫码登录
+
+        每次请求带上上一次的 wx_errcode，返回后立即发起下一次请求，
+        总时长不超过 [wechat_login] flow_timeout
 
         Args:
             qr_code_key: 二维码密钥
-            max_attempts: 最大轮询次数，默认60次（约5分钟）
+            max_attempts: 最大请求次数，默认60次
 
         Returns:
             WeChatValidateResponse: 登录结果
         """
         import asyncio
+        import time
+
+        deadline = time.monotonic() + self.login_config.get('flow_timeout', 300)
+        last = None
 
         for attempt in range(max_attempts):
+            if time.monotonic() >= deadline:
+                break
             try:
                 app_logger.info(f"轮询二维码状态，第 {attempt + 1}/{max_attempts} 次")
 
-                # 使用统一的URL构建函数
-                poll_url = urls.build_wechat_poll_url(qr_code_key)
-
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36',
-                    'Referer': 'https://open.weixin.qq.com/',
-                    'Accept': '*/*',
-                    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
-                }
-
-                response = await self.client.get(poll_url, headers=headers)
-                response_text = response.text
-                app_logger.debug(f"轮询响应: {response_text}")
-
-                # 解析微信轮询响应
-                # 实际响应格式是: window.wx_errcode=405;window.wx_code='xxx';
-                if "window.wx_errcode" in response_text:
-                    import re
-
-                    # 提取错误码
-                    errcode_match = re.search(r'window\.wx_errcode\s*=\s*(\d+)', response_text)
-                    code_match = re.search(r"window\.wx_code\s*=\s*'([^']*)'", response_text)
-
-                    if errcode_match:
-                        errcode = int(errcode_match.group(1))
-                        wx_code = code_match.group(1) if code_match else ''
-
-                        app_logger.info(f"轮询状态 - errcode: {errcode}, wx_code: {wx_code}")
-
-                        if errcode == 405 and wx_code:
-                            # 登录成功，获得了授权码
-                            app_logger.info(f"检测到登录成功，获得授权码: {wx_code}")
-
-                            # 使用获得的code进行验证
-                            return await self.validate_wechat_login(wx_code)
-
-                        elif errcode == 404:
-                            app_logger.info("等待扫码...")
-                        elif errcode == 403:
-                            app_logger.info("二维码已扫描，等待用户确认")
-                        elif errcode == 408:
-                            app_logger.info("二维码已过期")
-                            break
-                        elif errcode == 400:
-                            app_logger.info("二维码已失效")
-                            break
+                errcode, wx_code = await self.check_qr_status(qr_code_key, last)
+
+                if errcode == 405 and wx_code:
+                    # 登录成功，获得了授权码
+                    app_logger.info(f"检测到登录成功，获得授权码: {wx_code}")
+
+                    # 使用获得的code进行验证
+                    return await self.validate_wechat_login(wx_code)
+
+                elif errcode == 404:
+                    app_logger.info("等待扫码...")
+                elif errcode == 403:
+                    app_logger.info("二维码已扫描，等待用户确认")
+                elif errcode == 408:
+                    # 挂起超时，状态没有变化，保留last立即重新请求
+                    continue
+                elif errcode in (400, 402):
+                    app_logger.info("二维码已失效")
+                    break
+                else:
+                    # 无法解析的响应，稍后重试
+                    await asyncio.sleep(self.retry_interval)
+                    continue
 
-                # 等待5秒后继续轮询
-                await asyncio.sleep(5)
+                last = errcode
 
             except Exception as e:
                 app_logger.error(f"轮询二维码状态失败: {e}")
-                await asyncio.sleep(5)
+                await asyncio.sleep(self.retry_interval)
 
         app_logger.warning("轮询超时，未检测到登录")
         return WeChatValidateResponse(
@@ -235,9 +273,8 @@ class WeChatLoginService:
             # 发送验证请求
             response = await self.client.get(validate_url, headers=headers)
 
-            # 记录详细的响应信息
+            # 只记录状态码，响应头中的Set-Cookie包含认证令牌
             app_logger.info(f"验证响应状态码: {response.status_code}")
-            app_logger.info(f"验证响应头: {dict(response.headers)}")
 
             # 提取cookies
             cookies = {}
@@ -254,16 +291,16 @@ class WeChatLoginService:
                 for name, value in cookie_matches:
                     cookies[name.strip()] = value.strip()
 
-            app_logger.info(f"响应cookies: {cookies}")
+            app_logger.info(f"响应cookies: {sorted(cookies.keys())}")
 
             # 尝试解析JSON响应
             response_data = {}
             try:
                 response_data = response.json()
-                app_logger.info(f"验证响应JSON: {response_data}")
+                app_logger.debug(f"验证响应字段: {sorted(response_data.keys()) if isinstance(response_data, dict) else type(response_data).__name__}")
             except Exception as json_error:
                 app_logger.warning(f"响应不是有效的JSON: {json_error}")
-                app_logger.info(f"响应文本内容: {response.text}")
+                app_logger.info(f"响应文本内容（前200字符）: {response.text[:200]}")
                 response_data = {"raw_text": response.text}
 
             # 检查是否成功
@@ -273,36 +310,26 @@ class WeChatLoginService:
             token = cookies.get('t', '')
             csrf_token = cookies.get('_csrf_token', '')
 
-            # 保存会话信息
+            # 保存会话信息并自动设置滴答清单API认证会话
+            session_id = None
             if success and token:
-                session_id = str(uuid.uuid4())
-                session_data = {
-                    'session_id': session_id,
-                    'token': token,
-                    'csrf_token': csrf_token,
-                    'cookies': cookies,
-                    'is_active': True
-                }
-                db.save_user_session(session_data)
-
-                # 自动设置滴答清单API认证会话
                 try:
                     from services.dida_service import dida_service
-                    dida_service.set_auth_session(token, csrf_token)
+                    session_id = await dida_service.set_auth_session(token, csrf_token, cookies=cookies)
                     app_logger.info("已自动设置滴答清单API认证会话")
                 except Exception as e:
                     app_logger.warning(f"自动设置滴答清单API认证会话失败: {e}")
 
             # 记录登录日志
-            db.log_wechat_login(
+            audit_sink.log_wechat_login(
                 qr_code_key="",  # 这里可能需要从之前的记录中关联
                 validation_code=code,
                 state=state,
+                # 只记录排查所需的摘要，不保存响应头和cookie值
                 response_data={
                     'status_code': response.status_code,
-                    'headers': dict(response.headers),
-                    'cookies': cookies,
-                    'json_data': response_data
+                    'cookies': sorted(cookies.keys()),
+                    'user_id': response_data.get('userId') if isinstance(response_data, dict) else None
                 },
                 status='success' if success else 'failed'
             )
@@ -311,6 +338,7 @@ class WeChatLoginService:
                 success=success,
                 message="登录成功" if success else "登录失败",
                 token=token if token else None,
+                session_id=session_id,
                 user_info=response_data.get('user', {}),
                 cookies=cookies,
                 raw_response=response_data
@@ -320,7 +348,7 @@ class WeChatLoginService:
             app_logger.error(f"验证微信登录失败: {e}")
 
             # 记录失败日志
-            db.log_wechat_login(
+            audit_sink.log_wechat_login(
                 qr_code_key="",
                 validation_code=code,
                 state=state,
@@ -381,9 +409,8 @@ class WeChatLoginService:
             # 发送POST请求
             response = await self.client.post(login_url, json=login_data, headers=headers)
 
-            # 记录详细的响应信息
+            # 只记录状态码，响应头中的Set-Cookie包含认证令牌
             app_logger.info(f"密码登录响应状态码: {response.status_code}")
-            app_logger.info(f"密码登录响应头: {dict(response.headers)}")
 
             # 提取cookies
             cookies = {}
@@ -400,16 +427,16 @@ class WeChatLoginService:
                 for name, value in cookie_matches:
                     cookies[name.strip()] = value.strip()
 
-            app_logger.info(f"密码登录响应cookies: {cookies}")
+            app_logger.info(f"密码登录响应cookies: {sorted(cookies.keys())}")
 
             # 尝试解析JSON响应
             response_data = {}
             try:
                 response_data = response.json()
-                app_logger.info(f"密码登录响应JSON: {response_data}")
+                app_logger.debug(f"密码登录响应字段: {sorted(response_data.keys()) if isinstance(response_data, dict) else type(response_data).__name__}")
             except Exception as json_error:
                 app_logger.warning(f"响应不是有效的JSON: {json_error}")
-                app_logger.info(f"响应文本内容: {response.text}")
+                app_logger.info(f"响应文本内容（前200字符）: {response.text[:200]}")
                 response_data = {"raw_text": response.text}
 
             # 检查是否成功
@@ -419,20 +446,10 @@ class WeChatLoginService:
             if success:
                 token = response_data.get('token', '')
                 if token:
-                    session_id = str(uuid.uuid4())
-                    session_data = {
-                        'session_id': session_id,
-                        'token': token,
-                        'csrf_token': '',  # 密码登录可能不返回CSRF token
-                        'cookies': cookies,
-                        'is_active': True
-                    }
-                    db.save_user_session(session_data)
-
-                    # 自动设置滴答清单API认证会话
+                    # 保存会话信息并自动设置滴答清单API认证会话（密码登录可能不返回CSRF token）
                     try:
                         from services.dida_service import dida_service
-                        dida_service.set_auth_session(token, '')
+                        await dida_service.set_auth_session(token, '', cookies=cookies)
                         app_logger.info("已自动设置滴答清单API认证会话")
                     except Exception as e:
                         app_logger.warning(f"自动设置滴答清单API认证会话失败: {e}")
@@ -446,10 +463,6 @@ class WeChatLoginService:
             # 返回错误响应
             return {'error': str(e)}
 
-    async def close(self):
-        """关闭HTTP客户端"""
-        await self.client.aclose()
-
 
 # 全局微信登录服务实例
 wechat_service = WeChatLoginService()
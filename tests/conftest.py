@@ -0,0 +1,12 @@
+"""测试公共配置
+
+应用按相对路径读取 config.toml 并写入 ./output，测试统一在项目根目录下运行
+"""
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)
@@ -0,0 +1,69 @@
+"""已关闭任务归档全量同步测试
+
+全量同步会先清空归档再写入获取到的任务，中间有长时间没有任务的时间段时，
+更早窗口中的任务仍然必须被获取并保留
+"""
+import asyncio
+import importlib
+from datetime import datetime, timedelta
+
+from core.cache import make_session_key
+from core.database import Database
+
+archive_module = importlib.import_module('services.closed_task_archive_service')
+
+
+class FakeDida:
+    """只返回给定completedTime任务的上游"""
+
+    current_session = {'auth_token': 'token', 'csrf_token': 'csrf'}
+
+    def __init__(self, tasks):
+        self.tasks = tasks
+        self.windows = []
+
+    async def get_completed_tasks(self, to=None, status="Completed", from_time=None):
+        self.windows.append((from_time, to))
+        return [
+            task for task in self.tasks
+            if from_time <= task['completedTime'][:19].replace('T', ' ') < to
+        ]
+
+
+def _task(task_id: str, completed: datetime) -> dict:
+    return {"id": task_id, "title": task_id, "completedTime": completed.strftime('%Y-%m-%dT%H:%M:%S.000+0000')}
+
+
+def test_full_sync_keeps_history_behind_a_long_empty_gap(tmp_path, monkeypatch):
+    now = archive_module.ClosedTaskArchiveService._utcnow()
+    recent = _task("recent", now - timedelta(days=10))
+    # 与最近的任务之间隔着十几个90天的空窗口
+    old = _task("old", now - timedelta(days=4 * 365 - 30))
+    upstream = FakeDida([recent, old])
+
+    database = Database(str(tmp_path / "archive.db"))
+    database.init_database()
+    monkeypatch.setattr(archive_module, 'db', database)
+    monkeypatch.setattr(archive_module, 'dida_service', upstream)
+
+    service = archive_module.ClosedTaskArchiveService()
+    service.archive_config = {
+        'history_start': (now - timedelta(days=4 * 365)).strftime('%Y-%m-%d'),
+        'window_days': 90,
+        'window_concurrency': 4,
+        'start_from_account_created': False,
+    }
+
+    async def scenario():
+        sync = await service.refresh("Completed")
+        assert sync['mode'] == 'full'
+        return await database.run(database.get_closed_tasks, make_session_key('token'), "Completed")
+
+    tasks, total = asyncio.run(scenario())
+
+    assert total == 2
+    assert [task['id'] for task in tasks] == ["recent", "old"]
+    # 每个窗口都被请求过，没有因为空窗口提前停止
+    assert len(upstream.windows) == len(service._closed_task_windows(
+        datetime.strptime(service.archive_config['history_start'], '%Y-%m-%d')
+    ))
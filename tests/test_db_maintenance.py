@@ -0,0 +1,43 @@
+"""数据库维护跨worker互斥测试
+
+多个worker共用同一个共享状态后端时，每个维护周期只有一个worker执行维护
+"""
+import asyncio
+import importlib
+
+from core.shared_state import SharedState, SQLiteStateBackend
+
+maintenance_module = importlib.import_module('core.db_maintenance')
+
+
+def test_only_one_worker_runs_each_maintenance_pass(tmp_path, monkeypatch):
+    state = SharedState()
+    state.backend = SQLiteStateBackend(str(tmp_path / "shared_state.db"))
+    monkeypatch.setattr(maintenance_module, 'shared_state', state)
+
+    runs = []
+
+    class FakeDb:
+        async def run(self, fn, *args):
+            return fn(*args)
+
+    monkeypatch.setattr(maintenance_module, 'db', FakeDb())
+
+    workers = [maintenance_module.DatabaseMaintenance() for _ in range(3)]
+    for index, worker in enumerate(workers):
+        worker.enabled = True
+        worker.interval = 60
+        monkeypatch.setattr(worker, 'run_once', lambda index=index: runs.append(index) or {"worker": index})
+
+    async def scenario() -> None:
+        for worker in workers:
+            worker.start()
+        await asyncio.sleep(0.1)
+        for worker in workers:
+            await worker.stop()
+        await state.close()
+
+    asyncio.run(scenario())
+
+    assert len(runs) == 1
+    assert sum(worker.skipped for worker in workers) == 2
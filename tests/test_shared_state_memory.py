@@ -0,0 +1,22 @@
+"""MemoryStateBackend 测试"""
+import asyncio
+
+from core.shared_state import MemoryStateBackend
+
+
+def test_expired_keys_that_are_never_read_are_purged():
+    async def scenario() -> None:
+        backend = MemoryStateBackend()
+        # 与签发的二维码一样：写入后不再读取
+        for i in range(backend.PURGE_EVERY * 3):
+            await backend.set(f"login_qr:{i}", True, ttl=0.001)
+        await backend.set("kept", {"value": 1})
+        await asyncio.sleep(0.01)
+        for i in range(backend.PURGE_EVERY):
+            await backend.set(f"other:{i}", True, ttl=60)
+
+        assert len(backend._data) <= backend.PURGE_EVERY + 1
+        assert await backend.get("kept") == {"value": 1}
+        assert await backend.get("other:0") is True
+
+    asyncio.run(scenario())
@@ -0,0 +1,227 @@
+"""RedisStateBackend 测试
+
+使用进程内的最小RESP服务（只实现客户端用到的 AUTH、SELECT、GET、SET、DEL、INCR），
+不需要真实的Redis
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import pytest
+
+from core.shared_state import RedisError, RedisStateBackend, SharedState
+
+
+class FakeRedis:
+    """最小的内存RESP服务"""
+
+    def __init__(self, password: Optional[str] = None):
+        self.password = password
+        self.data: Dict[str, Tuple[str, Optional[float]]] = {}
+        self.commands: List[List[str]] = []
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.writers: List[asyncio.StreamWriter] = []
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self._serve, '127.0.0.1', 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self.drop_connections()
+        self.server.close()
+        await self.server.wait_closed()
+
+    def drop_connections(self) -> None:
+        for writer in self.writers:
+            writer.close()
+        self.writers.clear()
+
+    def _alive(self, key: str) -> bool:
+        item = self.data.get(key)
+        if item is None:
+            return False
+        if item[1] is not None and item[1] <= time.monotonic():
+            del self.data[key]
+            return False
+        return True
+
+    @staticmethod
+    async def _read_command(reader: asyncio.StreamReader) -> Optional[List[str]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        assert line.startswith(b'*')
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2].decode('utf-8'))
+        return args
+
+    @staticmethod
+    def _bulk(value: Optional[str]) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        data = value.encode('utf-8')
+        return b"$%d\r\n%s\r\n" % (len(data), data)
+
+    def _execute(self, args: List[str]) -> bytes:
+        name = args[0].upper()
+        if name == 'AUTH':
+            return b"+OK\r\n" if args[1] == self.password else b"-WRONGPASS invalid password\r\n"
+        if name == 'SELECT':
+            return b"+OK\r\n"
+        if name == 'GET':
+            return self._bulk(self.data[args[1]][0] if self._alive(args[1]) else None)
+        if name == 'SET':
+            key, value, options = args[1], args[2], [a.upper() for a in args[3:]]
+            if 'NX' in options and self._alive(key):
+                return self._bulk(None)
+            expires_at = None
+            if 'PX' in options:
+                expires_at = time.monotonic() + int(args[3 + options.index('PX') + 1]) / 1000
+            self.data[key] = (value, expires_at)
+            return b"+OK\r\n"
+        if name == 'DEL':
+            existed = self._alive(args[1])
+            self.data.pop(args[1], None)
+            return b":%d\r\n" % int(existed)
+        if name == 'INCR':
+            value = int(self.data[args[1]][0]) + 1 if self._alive(args[1]) else 1
+            self.data[args[1]] = (str(value), None)
+            return b":%d\r\n" % value
+        return b"-ERR unknown command\r\n"
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.writers.append(writer)
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                self.commands.append(args)
+                writer.write(self._execute(args))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def run_with_server(test: Callable[[FakeRedis, int], Awaitable[Any]], password: Optional[str] = None) -> Any:
+    """启动进程内RESP服务并在同一个事件循环中执行测试协程"""
+    async def main() -> Any:
+        server = FakeRedis(password)
+        port = await server.start()
+        try:
+            return await test(server, port)
+        finally:
+            await server.stop()
+    return asyncio.run(main())
+
+
+def test_get_set_delete_roundtrip():
+    async def scenario(server: FakeRedis, port: int) -> None:
+        backend = RedisStateBackend(f"redis://127.0.0.1:{port}/0")
+        value = {"name": "滴答清单", "items": [1, 2, 3], "nested": {"ok": True}}
+
+        assert await backend.get("missing") is None
+        await backend.set("k", value)
+        assert await backend.get("k") == value
+
+        await backend.delete("k")
+        assert await backend.get("k") is None
+
+        assert await backend.incr("counter") == 1
+        assert await backend.incr("counter") == 2
+        assert await backend.get("counter") == 2
+        await backend.close()
+
+    run_with_server(scenario)
+
+
+def test_ttl_expires_entries_and_locks():
+    async def scenario(server: FakeRedis, port: int) -> None:
+        backend = RedisStateBackend(f"redis://127.0.0.1:{port}")
+
+        await backend.set("short", "value", ttl=0.05)
+        await backend.set("long", "value", ttl=60)
+        assert ["SET", "short", '"value"', "PX", "50"] in server.commands
+        assert await backend.get("short") == "value"
+
+        assert await backend.acquire("lock", "a", ttl=0.05)
+        assert not await backend.acquire("lock", "b", ttl=0.05)
+        # 非持有者释放锁不生效
+        await backend.release("lock", "b")
+        assert not await backend.acquire("lock", "b", ttl=0.05)
+
+        await asyncio.sleep(0.1)
+        assert await backend.get("short") is None
+        assert await backend.get("long") == "value"
+        assert await backend.acquire("lock", "b", ttl=1)
+        await backend.release("lock", "b")
+        assert await backend.get("lock") is None
+        await backend.close()
+
+    run_with_server(scenario)
+
+
+def test_auth_select_and_reconnect():
+    async def scenario(server: FakeRedis, port: int) -> None:
+        backend = RedisStateBackend(f"redis://:s3cret@127.0.0.1:{port}/2")
+        await backend.set("k", 1)
+        assert server.commands[:2] == [["AUTH", "s3cret"], ["SELECT", "2"]]
+
+        # 服务端断开连接后，下一条命令自动重连并重新认证
+        server.drop_connections()
+        await asyncio.sleep(0.01)
+        assert await backend.get("k") == 1
+        assert [c[0] for c in server.commands].count("AUTH") == 2
+        await backend.close()
+
+    run_with_server(scenario, password="s3cret")
+
+
+def test_command_error_is_raised():
+    async def scenario(server: FakeRedis, port: int) -> None:
+        backend = RedisStateBackend(f"redis://:wrong@127.0.0.1:{port}")
+        with pytest.raises(RedisError, match="WRONGPASS"):
+            await backend.get("k")
+        await backend.close()
+
+    run_with_server(scenario, password="s3cret")
+
+
+def test_coalesce_runs_once_across_callers():
+    async def scenario(server: FakeRedis, port: int) -> None:
+        # 两个 SharedState 模拟两个worker，各自使用独立的连接
+        workers = []
+        for _ in range(2):
+            state = SharedState()
+            state.backend = RedisStateBackend(f"redis://127.0.0.1:{port}")
+            state.lock_poll_interval = 0.01
+            workers.append(state)
+
+        calls = 0
+
+        async def fetch() -> dict:
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.1)
+            result = {"value": calls}
+            await workers[0].set("result", result, ttl=60)
+            return result
+
+        async def call(state: SharedState) -> dict:
+            return await state.coalesce("fetch", fetch, lambda: state.get("result"))
+
+        results = await asyncio.gather(*(call(workers[i % 2]) for i in range(6)))
+
+        assert calls == 1
+        assert results == [{"value": 1}] * 6
+        assert sum(state.leader for state in workers) == 1
+        assert sum(state.follower_hits for state in workers) == 5
+        assert await workers[0].get(workers[0].key("lock", "fetch")) is None
+        for state in workers:
+            await state.close()
+
+    run_with_server(scenario)
@@ -0,0 +1,42 @@
+"""服务启动耗时测试
+
+在独立的解释器中导入 main，确认导入耗时不超过 config.toml [app] startup_budget_seconds，
+且 pandas、numpy、openpyxl 等较重的依赖没有在启动时导入
+"""
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import toml
+
+ROOT = Path(__file__).resolve().parent.parent
+
+HEAVY_MODULES = ("pandas", "numpy", "openpyxl")
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+print(json.dumps({"elapsed": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def _import_main() -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=ROOT, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_import_main_within_budget_without_heavy_dependencies():
+    budget = float(toml.load(ROOT / "config.toml").get("app", {}).get("startup_budget_seconds", 0) or 0)
+    assert budget > 0, "config.toml [app] startup_budget_seconds 未配置"
+
+    probe = _import_main()
+
+    assert probe["loaded"] == [], f"启动时导入了较重的依赖: {probe['loaded']}"
+    assert probe["elapsed"] < budget, f"导入 main 耗时 {probe['elapsed']:.3f}s，超过预算 {budget}s"
@@ -1,35 +1,142 @@
-"""日志配置模块"""
+"""日志配置模块
+
+按 config.toml [logging] 配置日志：
+- 全局级别和按模块的级别（[logging.modules]，按模块名最长前缀匹配）
+- enqueue 模式下由后台线程写入控制台和文件，调用方只做过滤和格式化
+- 同一位置（模块、函数、行号）重复出现的低级别日志按时间窗口限流采样，
+  被丢弃的条数附加在下一个窗口的第一条日志后面
+"""
 import sys
 import os
+import threading
+import time
 from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import toml
 from loguru import logger
 
+# 与 core.config 读取同一个文件；这里不能导入 core（core 依赖 utils），直接读取 [logging]
+CONFIG_PATH = "config.toml"
+
+DEFAULT_FORMAT = '{time:YYYY-MM-DD HH:mm:ss} | {level} | {name}:{function}:{line} - {message}'
+
+
+def _load_logging_config() -> Dict[str, Any]:
+    """读取 [logging]，配置文件不存在或无法解析时使用默认值"""
+    path = Path(CONFIG_PATH)
+    if not path.exists():
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return toml.load(f).get('logging', {})
+    except (OSError, toml.TomlDecodeError) as e:
+        print(f"读取日志配置失败，使用默认配置: {e}", file=sys.stderr)
+        return {}
+
+
+class LogFilter:
+    """按模块级别过滤并对重复日志限流采样
+
+    所有输出共用一个实例；一条日志只在第一个输出上计算一次结果，
+    其他输出直接复用，避免重复计数
+    """
+
+    def __init__(self, level: str, modules: Dict[str, str], sampling: Dict[str, Any]):
+        self.default_no = logger.level(level).no
+        # 按模块名长度倒序，优先匹配更具体的模块
+        self.modules: List[Tuple[str, int]] = sorted(
+            ((name, logger.level(module_level).no) for name, module_level in modules.items()),
+            key=lambda item: len(item[0]), reverse=True
+        )
+        self._module_levels: Dict[str, int] = {}
+
+        self.sampling_enabled = sampling.get('enabled', True)
+        self.window = float(sampling.get('window', 60))
+        self.max_per_window = int(sampling.get('max_per_window', 20))
+        # 只对低于该级别的日志采样，警告和错误总是保留
+        self.sample_below = logger.level(sampling.get('below_level', 'WARNING')).no
+        self._sites: Dict[Tuple[str, str, int], List] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def min_level_no(self) -> int:
+        """各输出需要放行的最低级别，具体是否输出由过滤器按模块判断"""
+        return min([self.default_no] + [no for _, no in self.modules])
+
+    def _level_for(self, name: str) -> int:
+        level_no = self._module_levels.get(name)
+        if level_no is None:
+            level_no = self.default_no
+            for prefix, prefix_no in self.modules:
+                if name == prefix or name.startswith(prefix + '.'):
+                    level_no = prefix_no
+                    break
+            self._module_levels[name] = level_no
+        return level_no
+
+    def _sample(self, record: Dict[str, Any]) -> bool:
+        site = (record['name'], record['function'], record['line'])
+        now = time.monotonic()
+        with self._lock:
+            state = self._sites.get(site)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                self._sites[site] = [now, 1, 0]
+                if suppressed:
+                    record['message'] += f"（前{int(self.window)}秒内另有 {suppressed} 条同位置日志被采样丢弃）"
+                return True
+            if state[1] < self.max_per_window:
+                state[1] += 1
+                return True
+            state[2] += 1
+            return False
+
+    def __call__(self, record: Dict[str, Any]) -> bool:
+        extra = record['extra']
+        decision = extra.get('_log_filter')
+        if decision is None:
+            decision = record['level'].no >= self._level_for(record['name'] or '')
+            if decision and self.sampling_enabled and record['level'].no < self.sample_below:
+                decision = self._sample(record)
+            extra['_log_filter'] = decision
+        return decision
+
 
 def setup_logger():
     """配置日志系统"""
     # 移除默认的日志处理器
     logger.remove()
 
-    # 使用默认配置
-    level = 'DEBUG'
-    format_str = '{time:YYYY-MM-DD HH:mm:ss} | {level} | {name}:{function}:{line} - {message}'
-    rotation = '1 day'
-    retention = '7 days'
+    log_config = _load_logging_config()
+    level = log_config.get('level', 'INFO')
+    format_str = log_config.get('format', DEFAULT_FORMAT)
+    rotation = log_config.get('rotation', '1 day')
+    retention = log_config.get('retention', '7 days')
+    # 后台线程写入，避免文件I/O阻塞事件循环
+    enqueue = log_config.get('enqueue', True)
+
+    log_filter = LogFilter(level, log_config.get('modules', {}), log_config.get('sampling', {}))
+    min_level = log_filter.min_level_no
 
     # 控制台输出
-    logger.add(
-        sys.stdout,
-        format=format_str,
-        level=level,
-        colorize=True
-    )
+    if log_config.get('console', True):
+        logger.add(
+            sys.stdout,
+            format=format_str,
+            level=min_level,
+            filter=log_filter,
+            colorize=True,
+            enqueue=enqueue
+        )
 
     # 获取当前日期，用于创建日志文件夹结构
     now = datetime.now()
     year = now.strftime('%Y')
     month = now.strftime('%m')
     day = now.strftime('%d')
-    
+
     # 创建日志文件夹结构: output/logs/年/月/日/
     log_dir = f"output/logs/{year}/{month}/{day}"
     os.makedirs(log_dir, exist_ok=True)
@@ -38,10 +145,12 @@ def setup_logger():
     logger.add(
         f"{log_dir}/app.log",
         format=format_str,
-        level=level,
+        level=min_level,
+        filter=log_filter,
         rotation=rotation,
         retention=retention,
-        encoding="utf-8"
+        encoding="utf-8",
+        enqueue=enqueue
     )
 
     # 错误日志单独文件
@@ -49,9 +158,11 @@ def setup_logger():
         f"{log_dir}/error.log",
         format=format_str,
         level="ERROR",
+        filter=log_filter,
         rotation=rotation,
         retention=retention,
-        encoding="utf-8"
+        encoding="utf-8",
+        enqueue=enqueue
     )
 
     return logger